@@ -3,6 +3,9 @@ import React from 'react';
 import { Calendar, Clock, Flame, Target } from 'lucide-react';
 import './WorkoutCard.css';
 
+// Everything the card shows, for list requests that don't need the exercises themselves
+export const WORKOUT_CARD_FIELDS = 'id,name,date,description,duration_minutes,calories_burned,notes,exercise_count';
+
 const WorkoutCard = ({ workout, onClick, onDelete }) => {
   const formatDate = (dateString) => {
     return new Date(dateString).toLocaleDateString('en-US', {
@@ -41,7 +44,7 @@ const WorkoutCard = ({ workout, onClick, onDelete }) => {
         )}
         <div className="stat">
           <Target size={16} />
-          <span>{workout.exercises?.length || 0} exercises</span>
+          <span>{workout.exercise_count ?? workout.exercises?.length ?? 0} exercises</span>
         </div>
       </div>
       
@@ -3,6 +3,10 @@ import React from 'react';
 import { Play, Clock, Flame, Users, Dumbbell } from 'lucide-react';
 import './WorkoutTemplateCard.css';
 
+// Everything the card (and the template list filters) use, without the exercises
+export const TEMPLATE_CARD_FIELDS = 'id,name,description,category,difficulty_level,estimated_duration_minutes,' +
+  'estimated_calories,image_url,equipment_needed,target_muscle_groups,exercise_count';
+
 const WorkoutTemplateCard = ({ template, onStartWorkout, onViewDetails }) => {
   const getDifficultyColor = (difficulty) => {
     switch (difficulty) {
@@ -94,7 +98,7 @@ const WorkoutTemplateCard = ({ template, onStartWorkout, onViewDetails }) => {
 
           <div className="exercise-count">
             <strong>Exercises:</strong>
-            <span>{template.exercises ? template.exercises.length : 0} exercises</span>
+            <span>{template.exercise_count ?? (template.exercises ? template.exercises.length : 0)} exercises</span>
           </div>
         </div>
 
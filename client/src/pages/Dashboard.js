@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { useNavigate } from 'react-router-dom';
 import api from '../services/api';
-import WorkoutCard from '../components/WorkoutCard';
+import WorkoutCard, { WORKOUT_CARD_FIELDS } from '../components/WorkoutCard';
 import { Plus, TrendingUp, Calendar, Target } from 'lucide-react';
 import './Dashboard.css';
 
@@ -28,30 +28,18 @@ const Dashboard = () => {
 
   const fetchDashboardData = async () => {
     try {
-      const response = await api.getWorkouts(user.id);
-      const workouts = response.data;
-      
-      // Get recent workouts (last 5)
-      setRecentWorkouts(workouts.slice(0, 5));
-      
-      // Calculate stats
-      const totalWorkouts = workouts.length;
-      const totalCalories = workouts.reduce((sum, w) => sum + (w.calories_burned || 0), 0);
-      const totalDuration = workouts.reduce((sum, w) => sum + (w.duration_minutes || 0), 0);
-      const avgDuration = totalWorkouts > 0 ? Math.round(totalDuration / totalWorkouts) : 0;
-      
-      // This week's workouts
-      const oneWeekAgo = new Date();
-      oneWeekAgo.setDate(oneWeekAgo.getDate() - 7);
-      const thisWeekWorkouts = workouts.filter(w => 
-        new Date(w.date) >= oneWeekAgo
-      ).length;
+      const [statsResponse, workoutsResponse] = await Promise.all([
+        api.getUserStats(user.id),
+        api.getWorkouts(user.id, { limit: 5, fields: WORKOUT_CARD_FIELDS })
+      ]);
+      const summary = statsResponse.data;
       
+      setRecentWorkouts(workoutsResponse.data.workouts);
       setStats({
-        totalWorkouts,
-        totalCalories,
-        thisWeekWorkouts,
-        avgDuration
+        totalWorkouts: summary.total_workouts,
+        totalCalories: summary.total_calories,
+        thisWeekWorkouts: summary.this_week_workouts,
+        avgDuration: summary.avg_duration_minutes
       });
     } catch (error) {
       console.error('Error fetching dashboard data:', error);
@@ -1,9 +1,13 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef, useCallback } from 'react';
 import { useParams, useLocation, useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
+import api from '../services/api';
 import { Play, Pause, Square, SkipForward, Timer, CheckCircle } from 'lucide-react';
 import './WorkoutSession.css';
 
+// How often queued session events are sent to the server
+const EVENT_FLUSH_MS = 2000;
+
 const WorkoutSession = () => {
   const { workoutId } = useParams();
   const { state } = useLocation();
@@ -20,6 +24,14 @@ const WorkoutSession = () => {
   const [completedExercises, setCompletedExercises] = useState(new Set());
   const [workoutStartTime, setWorkoutStartTime] = useState(null);
   const [totalElapsedTime, setTotalElapsedTime] = useState(0);
+  const [session, setSession] = useState(null);
+  
+  // Events not yet acknowledged by the server, numbered with seq so a batch
+  // that is sent twice is only stored once
+  const pendingEvents = useRef([]);
+  const nextSeq = useRef(1);
+  const flushing = useRef(false);
+  const restStartedAt = useRef(null);
 
   useEffect(() => {
     if (!user) {
@@ -33,6 +45,66 @@ const WorkoutSession = () => {
     }
   }, [user, workout, template, navigate]);
 
+  // Open (or pick up) the server-side session that logs this workout
+  useEffect(() => {
+    if (!workout) return;
+    api.openWorkoutSession(workout.id)
+      .then((response) => {
+        const lastSeq = response.data.last_seq;
+        pendingEvents.current.forEach((event, index) => {
+          event.seq = lastSeq + index + 1;
+        });
+        nextSeq.current = lastSeq + pendingEvents.current.length + 1;
+        setSession(response.data.session);
+      })
+      .catch((error) => console.error('Error opening workout session:', error));
+  }, [workout]);
+
+  const recordEvent = useCallback((type, details = {}) => {
+    pendingEvents.current.push({ seq: nextSeq.current++, type, at: new Date().toISOString(), ...details });
+  }, []);
+
+  const flushEvents = useCallback(async () => {
+    if (!session || flushing.current || pendingEvents.current.length === 0) return;
+    flushing.current = true;
+    const batch = pendingEvents.current.slice();
+    try {
+      await api.appendSessionEvents(session.id, batch);
+      pendingEvents.current = pendingEvents.current.slice(batch.length);
+    } catch (error) {
+      // Kept for the next flush
+      console.error('Error saving workout progress:', error);
+    } finally {
+      flushing.current = false;
+    }
+  }, [session]);
+
+  useEffect(() => {
+    const interval = setInterval(flushEvents, EVENT_FLUSH_MS);
+    return () => clearInterval(interval);
+  }, [flushEvents]);
+
+  const finalizeSession = async () => {
+    if (!session) return;
+    const events = pendingEvents.current;
+    pendingEvents.current = [];
+    try {
+      await api.finalizeWorkoutSession(session.id, { events, at: new Date().toISOString() });
+    } catch (error) {
+      console.error('Error saving workout:', error);
+    }
+  };
+
+  // Log each rest period once it ends, however it ended
+  useEffect(() => {
+    if (isResting) {
+      restStartedAt.current = Date.now();
+    } else if (restStartedAt.current) {
+      recordEvent('rest', { duration_seconds: Math.round((Date.now() - restStartedAt.current) / 1000) });
+      restStartedAt.current = null;
+    }
+  }, [isResting, recordEvent]);
+
   // Timer effects
   useEffect(() => {
     let interval;
@@ -66,10 +138,13 @@ const WorkoutSession = () => {
   };
 
   const currentExercise = template?.exercises?.[currentExerciseIndex];
+  // The workout's copy of each template exercise, in the same order
+  const workoutExercises = [...(workout?.exercises || [])].sort((a, b) => a.order_in_workout - b.order_in_workout);
   const isWorkoutComplete = completedExercises.size === template?.exercises?.length;
 
   const startWorkout = () => {
     setIsRunning(true);
+    recordEvent(workoutStartTime ? 'resume' : 'start');
     if (!workoutStartTime) {
       setWorkoutStartTime(Date.now());
     }
@@ -77,14 +152,15 @@ const WorkoutSession = () => {
 
   const pauseWorkout = () => {
     setIsRunning(false);
+    recordEvent('pause');
   };
 
-  const stopWorkout = () => {
+  const stopWorkout = async () => {
     setIsRunning(false);
     setExerciseTime(0);
     setRestTime(0);
     setIsResting(false);
-    // Could save workout progress here
+    await finalizeSession();
     navigate('/dashboard');
   };
 
@@ -93,6 +169,18 @@ const WorkoutSession = () => {
     
     setCompletedExercises(prev => new Set([...prev, currentExerciseIndex]));
     
+    const workoutExercise = workoutExercises[currentExerciseIndex];
+    if (workoutExercise) {
+      const sets = currentExercise.sets || 1;
+      for (let i = 0; i < sets; i++) {
+        recordEvent('set_completed', {
+          workout_exercise_id: workoutExercise.id,
+          reps: currentExercise.reps,
+          duration_seconds: Math.round(exerciseTime / sets),
+        });
+      }
+    }
+    
     // Start rest period if there's a next exercise
     if (currentExerciseIndex < template.exercises.length - 1) {
       const restSeconds = currentExercise.rest_seconds || 60;
@@ -103,6 +191,7 @@ const WorkoutSession = () => {
       // Workout complete
       setIsRunning(false);
       setExerciseTime(0);
+      finalizeSession();
     }
   };
 
@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { useNavigate } from 'react-router-dom';
 import api from '../services/api';
-import WorkoutTemplateCard from '../components/WorkoutTemplateCard';
+import WorkoutTemplateCard, { TEMPLATE_CARD_FIELDS } from '../components/WorkoutTemplateCard';
 import { Search, Filter, X, Clock, Zap, Target, ChevronDown } from 'lucide-react';
 import './Pages.css';
 
@@ -89,7 +89,7 @@ const WorkoutTemplates = () => {
 
   const fetchTemplates = async () => {
     try {
-      const response = await api.getTemplates();
+      const response = await api.getTemplates({ fields: TEMPLATE_CARD_FIELDS });
       setTemplates(response.data);
     } catch (error) {
       console.error('Error fetching workout templates:', error);
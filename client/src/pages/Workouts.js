@@ -2,16 +2,21 @@ import React, { useState, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { useNavigate } from 'react-router-dom';
 import api from '../services/api';
-import WorkoutCard from '../components/WorkoutCard';
+import WorkoutCard, { WORKOUT_CARD_FIELDS } from '../components/WorkoutCard';
 import { Plus, Search, Filter } from 'lucide-react';
 import './Pages.css';
 
+const PAGE_SIZE = 20;
+const SEARCH_DELAY_MS = 300;
+
 const Workouts = () => {
   const { user } = useAuth();
   const navigate = useNavigate();
   const [workouts, setWorkouts] = useState([]);
   const [filteredWorkouts, setFilteredWorkouts] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
 
   useEffect(() => {
@@ -23,18 +28,28 @@ const Workouts = () => {
   }, [user, navigate]);
 
   useEffect(() => {
-    // Filter workouts based on search term
-    const filtered = workouts.filter(workout =>
-      workout.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-      (workout.description && workout.description.toLowerCase().includes(searchTerm.toLowerCase()))
-    );
-    setFilteredWorkouts(filtered);
+    if (!searchTerm.trim()) {
+      setFilteredWorkouts(workouts);
+      return;
+    }
+    
+    // Search the whole history on the server once typing settles
+    const timer = setTimeout(async () => {
+      try {
+        const response = await api.searchWorkouts(user.id, searchTerm, { fields: WORKOUT_CARD_FIELDS });
+        setFilteredWorkouts(response.data.workouts);
+      } catch (error) {
+        console.error('Error searching workouts:', error);
+      }
+    }, SEARCH_DELAY_MS);
+    return () => clearTimeout(timer);
   }, [workouts, searchTerm]);
 
   const fetchWorkouts = async () => {
     try {
-      const response = await api.getWorkouts(user.id);
-      setWorkouts(response.data);
+      const response = await api.getWorkouts(user.id, { limit: PAGE_SIZE, fields: WORKOUT_CARD_FIELDS });
+      setWorkouts(response.data.workouts);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Error fetching workouts:', error);
     } finally {
@@ -42,6 +57,19 @@ const Workouts = () => {
     }
   };
 
+  const loadMoreWorkouts = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await api.getWorkouts(user.id, { limit: PAGE_SIZE, cursor: nextCursor, fields: WORKOUT_CARD_FIELDS });
+      setWorkouts(prev => [...prev, ...response.data.workouts]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Error fetching workouts:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDeleteWorkout = async (workoutId) => {
     if (window.confirm('Are you sure you want to delete this workout?')) {
       try {
@@ -112,6 +140,18 @@ const Workouts = () => {
             )}
           </div>
         )}
+
+        {nextCursor && !searchTerm && (
+          <div className="load-more">
+            <button
+              className="btn btn-secondary"
+              onClick={loadMoreWorkouts}
+              disabled={loadingMore}
+            >
+              {loadingMore ? 'Loading...' : 'Load More'}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -10,6 +10,15 @@ const api = axios.create({
   },
 });
 
+// Send the signed session token issued at login/registration
+api.interceptors.request.use((config) => {
+  const token = localStorage.getItem('token');
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`;
+  }
+  return config;
+});
+
 // Auth endpoints
 export const authAPI = {
   login: (username, password) => 
@@ -25,10 +34,31 @@ export const authAPI = {
     api.put(`/auth/users/${userId}`, userData),
 };
 
+// User endpoints
+export const userAPI = {
+  getUserStats: (userId) => 
+    api.get(`/users/${userId}/stats`),
+};
+
 // Workout endpoints
 export const workoutAPI = {
-  getWorkouts: (userId) => 
-    api.get(`/workouts${userId ? `?user_id=${userId}` : ''}`),
+  getWorkouts: (userId, params = {}) => {
+    const query = new URLSearchParams();
+    if (userId) query.append('user_id', userId);
+    Object.keys(params).forEach(key => {
+      if (params[key]) query.append(key, params[key]);
+    });
+    return api.get(`/workouts?${query.toString()}`);
+  },
+  
+  searchWorkouts: (userId, q, params = {}) => {
+    const query = new URLSearchParams({ q });
+    if (userId) query.append('user_id', userId);
+    Object.keys(params).forEach(key => {
+      if (params[key]) query.append(key, params[key]);
+    });
+    return api.get(`/workouts/search?${query.toString()}`);
+  },
   
   getWorkout: (workoutId) => 
     api.get(`/workouts/${workoutId}`),
@@ -77,6 +107,21 @@ export const templateAPI = {
     api.post(`/templates/${templateId}/start`, userData),
 };
 
+// Live workout session endpoints
+export const sessionAPI = {
+  openSession: (workoutId) => 
+    api.post(`/workouts/${workoutId}/session`),
+  
+  getSession: (sessionId) => 
+    api.get(`/sessions/${sessionId}`),
+  
+  appendEvents: (sessionId, events) => 
+    api.post(`/sessions/${sessionId}/events`, { events }),
+  
+  finalizeSession: (sessionId, data) => 
+    api.post(`/sessions/${sessionId}/finalize`, data),
+};
+
 // Combined API object
 const apiService = {
   // Auth
@@ -85,8 +130,12 @@ const apiService = {
   getUser: authAPI.getUser,
   updateUser: authAPI.updateUser,
   
+  // Users
+  getUserStats: userAPI.getUserStats,
+  
   // Workouts
   getWorkouts: workoutAPI.getWorkouts,
+  searchWorkouts: workoutAPI.searchWorkouts,
   getWorkout: workoutAPI.getWorkout,
   createWorkout: workoutAPI.createWorkout,
   updateWorkout: workoutAPI.updateWorkout,
@@ -102,6 +151,12 @@ const apiService = {
   getTemplate: templateAPI.getTemplate,
   startWorkoutFromTemplate: templateAPI.startWorkoutFromTemplate,
   
+  // Live workout sessions
+  openWorkoutSession: sessionAPI.openSession,
+  getWorkoutSession: sessionAPI.getSession,
+  appendSessionEvents: sessionAPI.appendEvents,
+  finalizeWorkoutSession: sessionAPI.finalizeSession,
+  
   // Health check
   healthCheck: () => api.get('/health'),
 };
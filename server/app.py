@@ -1,54 +1,108 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, current_app, jsonify
 from flask_cors import CORS
 import os
 
 # Import your database instance
-from database import db
+from database import configure_engine, database_health, database_url, db, engine_options
 
-app = Flask(__name__)
+# Application factory.
+#
+# Importing this module builds nothing and touches no database: workers, scripts
+# and tests call create_app() with whatever config they need. Schema creation and
+# migrations are an explicit step:
+#
+#   flask --app app init-db
+#
+# (python app.py, the development server, still runs it before serving). Queued
+# background jobs are run by their own worker processes (see jobs.py):
+#
+#   flask --app app run-jobs
 
-# Configure CORS (allow requests from your frontend only)
-CORS(app, resources={r"/api/*": {"origins": "https://fitness-tracke-app-1-2sbj.onrender.com"}})
 
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///fitness_tracker.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'your-secret-key-here'
+def create_app(config=None):
+    """Build the Flask app; config entries override the environment-derived defaults"""
+    app = Flask(__name__)
 
-# Initialize database
-db.init_app(app)
+    # Configure CORS (allow requests from your frontend only)
+    CORS(app, resources={r"/api/*": {"origins": "https://fitness-tracke-app-1-2sbj.onrender.com"}})
 
-# Import routes after app context is set
-try:
-    from routes import auth_bp, workout_bp, exercise_bp, template_bp
-    from models import User, Workout, Exercise, WorkoutTemplate  # explicit imports ✅
+    # Database configuration
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+    app.config['JOBS_DIR'] = os.environ.get('JOBS_DIR') or os.path.join(app.instance_path, 'jobs')
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    # Initialize database
+    db.init_app(app)
+    configure_engine(app)
+
+    from routes import auth_bp, user_bp, workout_bp, exercise_bp, template_bp, session_bp, sync_bp, jobs_bp
+    from migrations import init_db_command
+    from calories import estimate_calories_command
+    from jobs import run_jobs_command
+    from cache import catalog_cache
+    from auth import authenticate_request
+    from metrics import CONTENT_TYPE, init_metrics
 
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(user_bp, url_prefix='/api/users')
     app.register_blueprint(workout_bp, url_prefix='/api/workouts')
     app.register_blueprint(exercise_bp, url_prefix='/api/exercises')
     app.register_blueprint(template_bp, url_prefix='/api/templates')
+    app.register_blueprint(session_bp, url_prefix='/api/sessions')
+    app.register_blueprint(sync_bp, url_prefix='/api/sync')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
 
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # Request metrics wrap everything below, authentication included
+    init_metrics(app)
+
+    # Resolve signed session tokens before any route runs
+    app.before_request(authenticate_request)
+
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(estimate_calories_command)
+    app.cli.add_command(run_jobs_command)
 
-except ImportError as e:
-    print(f"⚠️  Failed to import routes: {e}")
-    raise
+    # Health check route
+    @app.route('/')
+    def home():
+        return jsonify({
+            'message': 'Fitness Tracker API is running!',
+            'version': '1.0.0',
+            'status': 'healthy'
+        })
 
-# Health check route
-@app.route('/')
-def home():
-    return jsonify({
-        'message': 'Fitness Tracker API is running!',
-        'version': '1.0.0',
-        'status': 'healthy'
-    })
+    @app.route('/api/health')
+    def health_check():
+        database = database_health(db.engine, app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        if not database['reachable']:
+            status = 'degraded' if database['reachable'] is None else 'unhealthy'
+        else:
+            status = 'healthy'
+        return jsonify({
+            'status': status,
+            'service': 'fitness-tracker-api',
+            'database': database
+        }), 503 if status == 'unhealthy' else 200
 
-@app.route('/api/health')
-def health_check():
-    return jsonify({'status': 'healthy', 'service': 'fitness-tracker-api'})
+    @app.route('/api/metrics')
+    def metrics():
+        return Response(current_app.extensions['metrics'].render(), content_type=CONTENT_TYPE)
+
+    @app.route('/api/cache/stats')
+    def cache_stats():
+        return jsonify({'catalog': catalog_cache.stats()})
+
+    return app
 
 if __name__ == '__main__':
+    from migrations import init_schema
+
+    app = create_app()
+    with app.app_context():
+        init_schema()
     app.run(debug=False, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,159 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from flask import current_app, g, jsonify, request
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Authentication: signed session tokens and bounded password hashing.
+#
+# Login issues "<payload>.<signature>", where payload is base64url JSON holding the
+# user id and an expiry, and signature is HMAC-SHA256 of it under SECRET_KEY. A
+# before_request hook checks the signature and expiry and puts the user id on
+# g.user_id, so authenticated requests need no session table, user lookup or
+# password hash. Requests without a token keep working unless AUTH_REQUIRED is
+# set; routes that take a user id refuse other users' ids when a token is present.
+#
+# Password hashing is deliberately slow, so it runs on a small per-process thread
+# pool with a bounded number of waiting callers. A login burst beyond that gets a
+# quick 503 instead of tying up every request worker on PBKDF2.
+
+DEFAULT_TOKEN_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_HASH_ITERATIONS = 600000  # benchmark with benchmark_password_hash.py
+DEFAULT_HASH_WORKERS = 2
+DEFAULT_HASH_QUEUE = 8
+
+PUBLIC_ENDPOINTS = {'auth.login', 'auth.register', 'home', 'health_check', 'metrics'}
+
+
+class TokenError(Exception):
+    pass
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(payload):
+    key = current_app.config['SECRET_KEY'].encode()
+    return hmac.new(key, payload.encode('ascii'), hashlib.sha256).digest()
+
+
+def issue_token(user_id):
+    """Return a signed token for user_id and its expiry as a unix timestamp"""
+    expires = int(time.time()) + _config('AUTH_TOKEN_TTL_SECONDS', DEFAULT_TOKEN_TTL_SECONDS)
+    payload = _b64encode(json.dumps({'uid': user_id, 'exp': expires}, separators=(',', ':')).encode())
+    return f'{payload}.{_b64encode(_signature(payload))}', expires
+
+
+def verify_token(token):
+    """Return the user id of a valid token, or raise TokenError"""
+    try:
+        payload, signature = token.split('.')
+        if not hmac.compare_digest(_b64decode(signature), _signature(payload)):
+            raise TokenError('Invalid token')
+        claims = json.loads(_b64decode(payload))
+        user_id, expires = claims['uid'], claims['exp']
+    except (ValueError, TypeError, KeyError):
+        raise TokenError('Invalid token')
+    if expires < time.time():
+        raise TokenError('Token expired')
+    return user_id
+
+
+def authenticate_request():
+    """before_request hook: resolve the bearer token, if any, without touching the database"""
+    g.user_id = None
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        try:
+            g.user_id = verify_token(header[len('Bearer '):].strip())
+        except TokenError as e:
+            return jsonify({'error': str(e)}), 401
+    elif (_config('AUTH_REQUIRED', False) and request.method != 'OPTIONS'
+          and request.endpoint not in PUBLIC_ENDPOINTS):
+        return jsonify({'error': 'Authentication required'}), 401
+
+
+def current_user_id():
+    """User id from the request's token, or None for anonymous requests"""
+    return g.get('user_id')
+
+
+def forbidden_user(user_id):
+    """403 response if an authenticated request targets another user's data, else None"""
+    if current_user_id() is None or user_id is None:
+        return None
+    try:
+        if int(user_id) == current_user_id():
+            return None
+    except (TypeError, ValueError):
+        pass
+    return jsonify({'error': "Not allowed to access another user's data"}), 403
+
+
+def password_method():
+    """werkzeug hash method string for the configured cost"""
+    return f"pbkdf2:sha256:{_config('PASSWORD_HASH_ITERATIONS', DEFAULT_HASH_ITERATIONS)}"
+
+
+class PasswordHasher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._slots = None
+
+    def _pool(self):
+        # Created on first use in each process, so workers forked from a preloaded
+        # app don't inherit a pool whose threads only exist in the parent
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    from concurrent.futures import ThreadPoolExecutor
+                    workers = _config('PASSWORD_HASH_WORKERS', DEFAULT_HASH_WORKERS)
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+                    self._slots = threading.BoundedSemaphore(workers + _config('PASSWORD_HASH_QUEUE', DEFAULT_HASH_QUEUE))
+                    self._pid = os.getpid()
+        return self._executor, self._slots
+
+    def run(self, fn, *args):
+        """Run fn(*args) on the hashing pool, or raise HasherBusy if it is full"""
+        executor, slots = self._pool()
+        if not slots.acquire(blocking=False):
+            raise HasherBusy('Too many sign-in attempts in progress, please retry shortly')
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            slots.release()
+
+
+password_hasher = PasswordHasher()
+
+
+def hash_password(password):
+    return password_hasher.run(generate_password_hash, password, password_method())
+
+
+def verify_password(password_hash, password):
+    return password_hasher.run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True if a stored hash was made with a different method or cost"""
+    return not password_hash.startswith(password_method() + '$')
@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Mixed read/write throughput against SQLite with the default rollback journal
+# and with the WAL/synchronous/mmap tuning from database.py.
+#
+# For each mode the configured database file is copied to a scratch directory
+# and several worker processes hammer it through the test client: most requests
+# read a page of a user's workouts, the rest create a workout with exercises.
+# Separate processes compete for SQLite's file locks the way gunicorn workers do.
+#
+#   python benchmark_db_concurrency.py [--processes 4] [--seconds 10] [--write-ratio 0.2]
+
+MODES = {
+    'baseline': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_MMAP_SIZE': '0'},
+    'tuned': {},
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def worker(seconds, write_ratio, start_at, seed):
+    from app import create_app
+    from models import Exercise, User
+
+    app = create_app()
+
+    with app.app_context():
+        user_ids = [row.id for row in User.query.with_entities(User.id)]
+        exercise_ids = [row.id for row in Exercise.query.with_entities(Exercise.id)]
+
+    rng = random.Random(seed)
+    client = app.test_client()
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    latencies = []
+
+    time.sleep(max(0.0, start_at - time.time()))
+    end = time.time() + seconds
+    while time.time() < end:
+        user_id = rng.choice(user_ids)
+        started = time.perf_counter()
+        if rng.random() < write_ratio:
+            response = client.post('/api/workouts', json={
+                'user_id': user_id,
+                'name': 'Benchmark workout',
+                'duration_minutes': 30,
+                'calories_burned': 200,
+                'exercises': [{'exercise_id': rng.choice(exercise_ids), 'sets': 3, 'reps': 10}
+                              for _ in range(3)]
+            })
+            kind = 'writes'
+        else:
+            response = client.get(f'/api/workouts?user_id={user_id}&limit=20')
+            kind = 'reads'
+        latencies.append(time.perf_counter() - started)
+        if response.status_code < 400:
+            counts[kind] += 1
+        else:
+            counts['errors'] += 1
+
+    print(json.dumps(dict(counts, latencies=latencies)))
+
+
+def run_mode(name, args, source):
+    scratch = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    try:
+        path = os.path.join(scratch, 'bench.db')
+        shutil.copy(source, path)
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', **MODES[name])
+        script = os.path.abspath(__file__)
+
+        # Apply migrations once so the workers don't race on them
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], env=env, check=True,
+                       cwd=os.path.dirname(script), stdout=subprocess.DEVNULL)
+
+        start_at = time.time() + 5
+        processes = [
+            subprocess.Popen([sys.executable, script, '--worker', '--seconds', str(args.seconds),
+                              '--write-ratio', str(args.write_ratio), '--start-at', str(start_at),
+                              '--seed', str(i)],
+                             env=env, stdout=subprocess.PIPE, cwd=os.path.dirname(script))
+            for i in range(args.processes)
+        ]
+        results = [json.loads(p.communicate()[0].decode().strip().splitlines()[-1]) for p in processes]
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    reads = sum(r['reads'] for r in results)
+    writes = sum(r['writes'] for r in results)
+    errors = sum(r['errors'] for r in results)
+    latencies = [latency for r in results for latency in r['latencies']]
+    return {
+        'mode': name,
+        'requests_per_second': round((reads + writes) / args.seconds, 1),
+        'reads_per_second': round(reads / args.seconds, 1),
+        'writes_per_second': round(writes / args.seconds, 1),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite mixed read/write concurrency benchmark')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--database', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           'instance', 'fitness_tracker.db'))
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--seed', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.seconds, args.write_ratio, args.start_at, args.seed)
+        return
+
+    print(f"{args.processes} processes, {args.seconds:g}s, {args.write_ratio:.0%} writes")
+    print(f"{'mode':<10} {'req/s':>8} {'reads/s':>8} {'writes/s':>9} {'errors':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}")
+    for name in MODES:
+        r = run_mode(name, args, args.database)
+        print(f"{r['mode']:<10} {r['requests_per_second']:>8} {r['reads_per_second']:>8} {r['writes_per_second']:>9} "
+              f"{r['errors']:>7} {r['p50_ms']:>7} {r['p95_ms']:>7} {r['p99_ms']:>7}")
+
+
+if __name__ == '__main__':
+    main()
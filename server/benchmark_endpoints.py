@@ -0,0 +1,487 @@
+import argparse
+import http.client
+import itertools
+import json
+import os
+import resource
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, func
+from app import create_app
+from auth import issue_token
+from benchmark_load import percentile, wait_until_up
+from database import db
+from models import Exercise, User, Workout, WorkoutExercise, WorkoutSession, WorkoutTemplate
+from sync import current_seq
+
+# Benchmark of every blueprint route against a scaled dataset (generate_data.py),
+# in two passes:
+#
+#   client  requests one at a time through the Flask test client, in-process:
+#           p50/p95/p99 latency, throughput, SQL statements per request and the
+#           process's peak RSS while the route ran
+#   http    the production profile (gunicorn.conf.py) driven over keep-alive
+#           connections from --clients threads for --seconds per route:
+#           p50/p95/p99 latency, throughput and the workers' peak RSS
+#
+# Results are compared against benchmarks/endpoints.json: --check exits non-zero
+# when any route's latency or RSS grows, or its throughput drops, by more than
+# --tolerance, or when it issues more SQL statements per request than before (the
+# count is deterministic, so any increase fails); --save records the run as the
+# new baseline (only the routes that ran, with --routes). Latency changes under
+# NOISE_FLOOR_MS never count as regressions, and p99 is recorded but not gated:
+# over a few hundred requests it is a couple of samples. Timings on a shared or
+# single-core machine move by tens of percent between runs, hence the default
+# tolerance.
+#
+# Write routes create users, workouts and exercises, so point DATABASE_URL at a
+# disposable copy of the dataset.
+#
+#   python generate_data.py --users 10000 --workouts-per-user 100
+#   python benchmark_endpoints.py [--mode client|http|both] [--routes workouts.] [--check | --save]
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'endpoints.json')
+DEFAULT_PORT = 5056
+NOISE_FLOOR_MS = 2.0
+
+# The sparse fieldsets the client's list cards ask for
+WORKOUT_CARD_FIELDS = 'id,name,date,description,duration_minutes,calories_burned,notes,exercise_count'
+TEMPLATE_CARD_FIELDS = ('id,name,description,category,difficulty_level,estimated_duration_minutes,estimated_calories,'
+                        'image_url,equipment_needed,target_muscle_groups,exercise_count')
+
+# Metrics gated by --check: (higher is worse, subject to --tolerance)
+GATED_METRICS = {
+    'p50_ms': (True, True),
+    'p95_ms': (True, True),
+    'rps': (False, True),
+    'sql_statements': (True, False),
+    'peak_rss_mb': (True, True),
+}
+
+
+class Route:
+    def __init__(self, name, method, path, body=None, expect=(200,), collect=None, user='reader'):
+        self.name = name
+        self.method = method
+        self.path = path  # str, or callable(n) -> str; raises IndexError when out of targets
+        self.body = body  # None, or callable(n) -> JSON-serializable body
+        self.expect = expect
+        self.collect = collect  # callable(response JSON) run after each request
+        self.user = user  # 'reader', or 'writer' for routes that add to the user's history
+
+    def request(self, n):
+        path = self.path(n) if callable(self.path) else self.path
+        return path, self.body(n) if self.body else None
+
+
+def sample_routes(password, tag):
+    """Routes in run order, reads before writes, and the ids of the reader and writer users
+
+    Routes that create workouts run as a second user, so repeated runs don't grow
+    the history the read routes are measured on.
+    """
+    user_id = db.session.query(func.max(Workout.user_id)).scalar()
+    writer_id = db.session.query(func.max(Workout.user_id)).filter(Workout.user_id < user_id).scalar()
+    user = db.session.get(User, user_id) if user_id else None
+    workouts = Workout.query.filter_by(user_id=user_id).order_by(Workout.id).limit(50).all() if user else []
+    exercise_ids = [e.id for e in Exercise.query.order_by(Exercise.id).limit(20)]
+    template = WorkoutTemplate.query.order_by(WorkoutTemplate.id).first()
+    # The reader's most frequent rep-based exercise, for the progress series
+    progress_exercise_id = db.session.query(WorkoutExercise.exercise_id).join(Workout) \
+        .filter(Workout.user_id == user_id, WorkoutExercise.reps > 0) \
+        .group_by(WorkoutExercise.exercise_id).order_by(func.count().desc()).limit(1).scalar()
+    if not (workouts and writer_id and exercise_ids and template):
+        raise SystemExit('Seed the database first (seed_db.py, seed_templates.py, generate_data.py)')
+
+    workout_ids = [w.id for w in workouts]
+    username = user.username
+
+    # A live session on a fresh workout of the writer's, for the event appends
+    session_workout = Workout(user_id=writer_id, name=f'Benchmark session {tag}')
+    db.session.add(session_workout)
+    db.session.flush()
+    live_session = WorkoutSession(workout_id=session_workout.id, user_id=writer_id)
+    db.session.add(live_session)
+    db.session.commit()
+    session_id = live_session.id
+    sync_cursor = current_seq()
+    created = deque()  # workouts made by the write routes, deleted again by workouts.delete
+    today = date.today()
+
+    def new_workout(n):
+        return {
+            'name': f'Benchmark {n}',
+            'date': (today - timedelta(days=n % 365)).isoformat(),
+            'duration_minutes': 45,
+            'calories_burned': 350,
+            'exercises': [{'exercise_id': exercise_ids[(n + i) % len(exercise_ids)], 'sets': 3, 'reps': 10,
+                           'weight': 40 + i} for i in range(6)],
+        }
+
+    def keep_workout(data):
+        created.append(data['workout']['id'])
+
+    return [
+        Route('auth.get_user', 'GET', f'/api/auth/users/{user_id}'),
+        Route('users.stats', 'GET', f'/api/users/{user_id}/stats'),
+        Route('users.progress', 'GET', f'/api/users/{user_id}/progress?exercise_id={progress_exercise_id}'),
+        Route('users.export_csv', 'GET', f'/api/users/{user_id}/export?format=csv'),
+        Route('users.export_arrow', 'GET', f'/api/users/{user_id}/export?format=arrow'),
+        Route('users.export_queue', 'POST', f'/api/users/{user_id}/export?format=csv', expect=(202,)),
+        Route('workouts.list', 'GET', f'/api/workouts?user_id={user_id}'),
+        Route('workouts.list_page', 'GET', f'/api/workouts?user_id={user_id}&limit=20'),
+        Route('workouts.list_ndjson', 'GET', f'/api/workouts?user_id={user_id}&format=ndjson'),
+        Route('workouts.list_all_page', 'GET', '/api/workouts?limit=20'),
+        Route('workouts.list_page_cards', 'GET', f'/api/workouts?user_id={user_id}&limit=20&fields={WORKOUT_CARD_FIELDS}'),
+        Route('workouts.search', 'GET', f'/api/workouts/search?q=day&user_id={user_id}'),
+        Route('workouts.get', 'GET', lambda n: f'/api/workouts/{workout_ids[n % len(workout_ids)]}'),
+        Route('exercises.list', 'GET', '/api/exercises'),
+        Route('exercises.filter', 'GET', '/api/exercises?muscle_group=chest,triceps&match=all'),
+        Route('exercises.get', 'GET', lambda n: f'/api/exercises/{exercise_ids[n % len(exercise_ids)]}'),
+        Route('templates.list', 'GET', '/api/templates'),
+        Route('templates.list_cards', 'GET', f'/api/templates?fields={TEMPLATE_CARD_FIELDS}'),
+        Route('templates.filter', 'GET', '/api/templates?muscle_group=core'),
+        Route('templates.get', 'GET', f'/api/templates/{template.id}'),
+        Route('jobs.list', 'GET', f'/api/jobs?user_id={user_id}&limit=20'),
+        Route('sync.full', 'GET', f'/api/sync?user_id={user_id}'),
+        Route('sync.delta', 'GET', f'/api/sync?user_id={user_id}&since={sync_cursor}'),
+        Route('workouts.create', 'POST', '/api/workouts', new_workout, (201,), keep_workout, 'writer'),
+        Route('templates.start', 'POST', f'/api/templates/{template.id}/start', lambda n: {}, (201,),
+              keep_workout, 'writer'),
+        Route('workouts.bulk', 'POST', '/api/workouts/bulk',
+              lambda n: [new_workout(n * 20 + i) for i in range(20)], (201,), user='writer'),
+        Route('sessions.events', 'POST', f'/api/sessions/{session_id}/events', lambda n: {'events': [
+            {'seq': n + 1, 'type': 'pause' if n % 2 else 'resume', 'at': datetime.utcnow().isoformat()}]},
+              user='writer'),
+        Route('workouts.update', 'PUT', lambda n: f'/api/workouts/{workout_ids[n % len(workout_ids)]}',
+              lambda n: {'notes': f'Benchmark note {n}'}),
+        Route('workouts.delete', 'DELETE', lambda n: f'/api/workouts/{created.popleft()}', user='writer'),
+        Route('auth.update_user', 'PUT', f'/api/auth/users/{user_id}', lambda n: {'weight': 70 + n % 10}),
+        Route('auth.login', 'POST', '/api/auth/login', lambda n: {'username': username, 'password': password}),
+        Route('auth.register', 'POST', '/api/auth/register', lambda n: {
+            'username': f'bench-{tag}-{n}', 'email': f'bench-{tag}-{n}@example.com', 'password': password,
+            'first_name': 'Bench', 'last_name': 'Mark'}, (201,)),
+        Route('exercises.create', 'POST', '/api/exercises', lambda n: {
+            'name': f'Benchmark Exercise {tag}-{n}', 'category': 'strength', 'muscle_groups': ['chest']}, (201,)),
+    ], user_id, writer_id
+
+
+def dataset_size():
+    return {
+        'users': db.session.query(func.count(User.id)).scalar(),
+        'workouts': db.session.query(func.count(Workout.id)).scalar(),
+        'workout_exercises': db.session.query(func.count(WorkoutExercise.id)).scalar(),
+    }
+
+
+def reset_peak_rss():
+    # Linux lets a process reset its own high-water mark; elsewhere the peak only grows
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(latencies, elapsed, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def run_client(app, routes, headers, args):
+    """Requests through the test client, one at a time; max --requests or --route-seconds per route"""
+    client = app.test_client()
+    statements = [0]
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements[0] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    results = {}
+    counter = itertools.count()
+    try:
+        for route in routes:
+            for _ in range(args.warmup):
+                try:
+                    path, body = route.request(next(counter))
+                except IndexError:
+                    break
+                response = client.open(path, method=route.method, json=body, headers=headers[route.user],
+                                       buffered=True)
+                if route.collect and response.status_code in route.expect:
+                    route.collect(response.get_json())
+
+            reset_peak_rss()
+            latencies = []
+            sql_counts = []
+            errors = 0
+            deadline = time.perf_counter() + args.route_seconds
+            started = time.perf_counter()
+            while len(latencies) + errors < args.requests and time.perf_counter() < deadline:
+                try:
+                    path, body = route.request(next(counter))
+                except IndexError:
+                    break
+                statements[0] = 0
+                request_started = time.perf_counter()
+                # buffered: streamed bodies are read in full inside the timing
+                response = client.open(path, method=route.method, json=body, headers=headers[route.user],
+                                       buffered=True)
+                latency = time.perf_counter() - request_started
+                if response.status_code not in route.expect:
+                    errors += 1
+                    continue
+                latencies.append(latency)
+                sql_counts.append(statements[0])
+                if route.collect:
+                    route.collect(response.get_json())
+            elapsed = time.perf_counter() - started
+
+            result = summarize(latencies, elapsed, errors)
+            result['sql_statements'] = percentile(sql_counts, 0.5) if sql_counts else 0
+            result['peak_rss_mb'] = peak_rss_mb()
+            results[route.name] = result
+            print_result('client', route.name, result)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    return results
+
+
+def worker_pids(master_pid):
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def drive_route(port, route, headers, counter, seconds, clients, master_pid):
+    """Load one route from `clients` threads; returns (latencies, errors, elapsed, peak worker RSS)"""
+    stop = time.time() + seconds
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+    done = threading.Event()
+    peak = [0.0]
+
+    def sample_rss():
+        # /proc sampling, Linux only: the largest worker's RSS while the route runs
+        while not done.wait(0.05):
+            for pid in worker_pids(master_pid):
+                peak[0] = max(peak[0], rss_mb(pid))
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        own = []
+        failed = 0
+        while time.time() < stop:
+            try:
+                path, body = route.request(next(counter))
+            except IndexError:
+                break
+            payload = json.dumps(body) if body is not None else None
+            request_headers = dict(headers[route.user])
+            if payload:
+                request_headers['Content-Type'] = 'application/json'
+            started = time.perf_counter()
+            try:
+                connection.request(route.method, path, body=payload, headers=request_headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                continue
+            latency = time.perf_counter() - started
+            if response.status not in route.expect:
+                failed += 1
+                continue
+            own.append(latency)
+            if route.collect:
+                route.collect(json.loads(data))
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    sampler = threading.Thread(target=sample_rss)
+    sampler.start()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    return latencies, errors[0], elapsed, round(peak[0], 1)
+
+
+def run_http(routes, headers, args):
+    """Each route under concurrent load against gunicorn with the production config"""
+    # No worker recycling mid-run: a restart drops the clients' keep-alive connections
+    env = dict(os.environ, WEB_CONCURRENCY=str(args.workers), PORT=str(args.port), GUNICORN_MAX_REQUESTS='0')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    results = {}
+    counter = itertools.count(10 ** 6)  # keep generated names apart from the client pass
+    try:
+        wait_until_up(args.port, time.time() + 60)
+        for route in routes:
+            drive_route(args.port, route, headers, counter, min(1.0, args.seconds), args.clients, server.pid)
+            latencies, errors, elapsed, peak = drive_route(args.port, route, headers, counter, args.seconds,
+                                                           args.clients, server.pid)
+            result = summarize(latencies, elapsed, errors)
+            result['peak_rss_mb'] = peak
+            results[route.name] = result
+            print_result('http', route.name, result)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+    return results
+
+
+def print_result(mode, name, result):
+    print(f"{mode:<6} {name:<24} {result['requests']:>6} {result['rps']:>8.1f} {result['p50_ms']:>9.2f} "
+          f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {str(result.get('sql_statements', '-')):>5} "
+          f"{result['peak_rss_mb']:>8.1f} {result['errors']:>6}", flush=True)
+
+
+def regressions(result, baseline, tolerance):
+    """Human-readable lines for every gated metric that got worse by more than tolerance"""
+    found = []
+    for mode, routes in result.items():
+        for name, metrics in routes.items():
+            before = baseline.get(mode, {}).get(name)
+            if before is None:
+                print(f"new route {mode} {name}: no baseline")
+                continue
+            for metric, (higher_is_worse, tolerant) in GATED_METRICS.items():
+                if metric not in metrics or not before.get(metric):
+                    continue
+                new, old = metrics[metric], before[metric]
+                allowed = tolerance if tolerant else 0
+                if higher_is_worse:
+                    worse = new > old * (1 + allowed)
+                    if metric.endswith('_ms'):
+                        worse = worse and new - old >= NOISE_FLOOR_MS
+                else:
+                    worse = new < old * (1 - allowed)
+                if worse:
+                    found.append(f"{mode} {name} {metric}: {new} vs baseline {old} ({(new - old) / old:+.0%})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-route latency, throughput, SQL and memory benchmark')
+    parser.add_argument('--mode', choices=('client', 'http', 'both'), default='both')
+    parser.add_argument('--routes', help='comma-separated route name prefixes to run (default: all)')
+    parser.add_argument('--requests', type=int, default=200, help='client pass: requests per route')
+    parser.add_argument('--route-seconds', type=float, default=10, help='client pass: time cap per route')
+    parser.add_argument('--warmup', type=int, default=3, help='client pass: untimed requests per route')
+    parser.add_argument('--seconds', type=float, default=5, help='http pass: load time per route')
+    parser.add_argument('--clients', type=int, default=8, help='http pass: client threads')
+    parser.add_argument('--workers', type=int, default=2, help='http pass: gunicorn workers')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--password', default='password123', help="password of the benchmark user")
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed timing/RSS regression (fraction)')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--check', action='store_true', help='fail if any route regressed against the baseline')
+    mode.add_argument('--save', action='store_true', help='save this run as the baseline')
+    args = parser.parse_args()
+
+    app = create_app()
+    result = {}
+    with app.app_context():
+        dataset = dataset_size()
+        routes, user_id, writer_id = sample_routes(args.password, int(time.time()))
+        if args.routes:
+            prefixes = tuple(args.routes.split(','))
+            routes = [route for route in routes if route.name.startswith(prefixes)]
+        headers = {'reader': {'Authorization': f'Bearer {issue_token(user_id)[0]}'},
+                   'writer': {'Authorization': f'Bearer {issue_token(writer_id)[0]}'}}
+
+        print(f"{dataset['users']} users, {dataset['workouts']} workouts, "
+              f"{dataset['workout_exercises']} workout exercises; {os.cpu_count()} CPUs")
+        print(f"{'mode':<6} {'route':<24} {'n':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'sql':>5} {'rss MB':>8} {'errors':>6}")
+        if args.mode in ('client', 'both'):
+            result['client'] = run_client(app, routes, headers, args)
+        db.session.remove()
+
+    if args.mode in ('http', 'both'):
+        with app.app_context():
+            db.engine.dispose()
+        result['http'] = run_http(routes, headers, args)
+
+    failed = [f"{mode} {name}: {r['errors']} unexpected responses, {r['requests']} ok"
+              for mode, routes_result in result.items() for name, r in routes_result.items()
+              if r['errors'] or not r['requests']]
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline['dataset'] = dataset
+        for mode, routes_result in result.items():
+            baseline.setdefault(mode, {}).update(routes_result)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+    elif args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        recorded = baseline.get('dataset', {}).get('workouts', 0)
+        if abs(dataset['workouts'] - recorded) > recorded * args.tolerance:
+            print(f"warning: baseline was recorded on a different dataset: {baseline.get('dataset')}")
+        failed += regressions(result, baseline, args.tolerance)
+
+    for line in failed:
+        print(f"FAIL {line}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# HTTP load test of the production profile: starts gunicorn with gunicorn.conf.py
+# at each worker count, drives the workout list and detail endpoints over
+# keep-alive connections from a pool of client threads, and prints throughput and
+# latency per worker count. --save records the table, with the machine's CPU
+# count, in benchmarks/load.json.
+#
+#   python benchmark_load.py [--workers 1,2,4] [--clients 16] [--seconds 10] [--save]
+#
+# Run it on a machine with at least as many cores as the largest worker count
+# plus a core for the client, or the numbers measure CPU contention instead.
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'load.json')
+DEFAULT_PORT = 5055
+
+
+def wait_until_up(port, deadline):
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/api/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit('gunicorn did not come up')
+
+
+def sample_paths(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('GET', '/api/workouts?limit=20')
+    workouts = json.loads(connection.getresponse().read())['workouts']
+    if not workouts:
+        raise SystemExit('No workouts to load test against; seed the database first')
+    user_id = workouts[0]['user_id']
+    return {
+        'list': f'/api/workouts?user_id={user_id}&limit=20',
+        'detail': [f"/api/workouts/{w['id']}" for w in workouts],
+    }
+
+
+def drive(port, paths, seconds, clients):
+    stop = time.time() + seconds
+    lock = threading.Lock()
+    results = {name: [] for name in paths}
+    errors = [0]
+
+    def client(index):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        latencies = {name: [] for name in paths}
+        failed = 0
+        n = index
+        while time.time() < stop:
+            n += 1
+            name = 'list' if n % 2 else 'detail'
+            path = paths['list'] if name == 'list' else paths['detail'][n % len(paths['detail'])]
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            latencies[name].append(time.perf_counter() - started)
+        with lock:
+            for name in paths:
+                results[name].extend(latencies[name])
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors[0]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def run(workers, args):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(args.port))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_up(args.port, time.time() + 60)
+        paths = sample_paths(args.port)
+        drive(args.port, paths, 2, args.clients)  # warm up caches and connections
+        results, errors = drive(args.port, paths, args.seconds, args.clients)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    summary = {'errors': errors}
+    for name, latencies in results.items():
+        summary[name] = {
+            'rps': round(len(latencies) / args.seconds, 1),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        }
+        print(f"{workers:>7} {name:<7} {summary[name]['rps']:>9.1f} {summary[name]['p50_ms']:>8.1f} "
+              f"{summary[name]['p95_ms']:>8.1f} {summary[name]['p99_ms']:>8.1f} {errors:>7}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP load test across gunicorn worker counts')
+    parser.add_argument('--workers', default='1,2,4', help='comma-separated worker counts')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--save', action='store_true', help=f'record the results in {RESULTS_PATH}')
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.clients} client threads, {args.seconds:g}s per run")
+    print(f"{'workers':>7} {'route':<7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    runs = {str(workers): run(workers, args) for workers in (int(w) for w in args.workers.split(','))}
+
+    if args.save:
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+        with open(RESULTS_PATH, 'w') as f:
+            json.dump({'cpus': os.cpu_count(), 'clients': args.clients, 'seconds': args.seconds, 'workers': runs},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Saved results to {RESULTS_PATH}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Picks PASSWORD_HASH_ITERATIONS for this machine and checks the hashing pool
+# under load. Times one PBKDF2-SHA256 verification at several iteration counts,
+# suggests the largest count that stays under the target, then fires a burst of
+# concurrent verifications through the app's hashing pool to show how many are
+# served and how many are turned away with HasherBusy.
+#
+#   python benchmark_password_hash.py [--target-ms 250] [--burst 32]
+
+ITERATION_COUNTS = [100000, 200000, 300000, 400000, 600000, 800000, 1000000]
+
+
+def time_verification(iterations, repeat=3):
+    password_hash = generate_password_hash('benchmark-password', method=f'pbkdf2:sha256:{iterations}')
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        check_password_hash(password_hash, 'benchmark-password')
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def burst(app, size, iterations):
+    from auth import HasherBusy, verify_password
+    password_hash = generate_password_hash('benchmark-password', method=f'pbkdf2:sha256:{iterations}')
+
+    def attempt(_):
+        with app.app_context():
+            start = time.perf_counter()
+            try:
+                verify_password(password_hash, 'benchmark-password')
+                return 'ok', time.perf_counter() - start
+            except HasherBusy:
+                return 'busy', time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=size) as callers:
+        results = list(callers.map(attempt, range(size)))
+    total = time.perf_counter() - start
+
+    served = sorted(elapsed for outcome, elapsed in results if outcome == 'ok')
+    rejected = [elapsed for outcome, elapsed in results if outcome == 'busy']
+    print(f"\nBurst of {size} concurrent logins at {iterations} iterations ({total:.2f}s):")
+    print(f"  served   {len(served):4d}  slowest {served[-1] * 1000:7.1f} ms" if served else "  served      0")
+    print(f"  rejected {len(rejected):4d}  slowest {max(rejected) * 1000:7.1f} ms" if rejected else "  rejected    0")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark password hashing cost')
+    parser.add_argument('--target-ms', type=float, default=250, help='slowest acceptable single verification')
+    parser.add_argument('--burst', type=int, default=32, help='concurrent logins for the pool test')
+    args = parser.parse_args()
+
+    print(f"{'iterations':>12} {'verify ms':>10}")
+    suggested = ITERATION_COUNTS[0]
+    for iterations in ITERATION_COUNTS:
+        elapsed = time_verification(iterations)
+        print(f"{iterations:>12} {elapsed * 1000:>10.1f}")
+        if elapsed * 1000 <= args.target_ms:
+            suggested = iterations
+    print(f"\nSuggested PASSWORD_HASH_ITERATIONS = {suggested} (target {args.target_ms:.0f} ms)")
+
+    from app import create_app
+    burst(create_app(), args.burst, suggested)
+
+
+if __name__ == '__main__':
+    main()
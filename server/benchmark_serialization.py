@@ -0,0 +1,127 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+# Compares the two ways of turning list endpoint rows into a response body:
+#
+#   orm   load model objects (with the eager loading the routes used), call
+#         to_dict() on each and serialize the list with jsonify
+#   fast  select the to_dict() columns as tuples and encode them with the
+#         precompiled row encoders in serializers.py
+#
+# Both run against the configured database in fresh sessions, and their bodies
+# must be byte-identical; the script exits non-zero if they are not. Reports
+# parent rows per second (best of --repeat) and the peak memory traced while
+# building one body, per row, as the allocation cost.
+#
+#   python benchmark_serialization.py [--rows 2000] [--repeat 5]
+
+
+def orm_workouts(limit):
+    from cache import json_bytes
+    from loading import workout_options
+    from models import Workout
+    workouts = Workout.query.options(*workout_options()) \
+        .order_by(Workout.date.desc(), Workout.id.desc()).limit(limit).all()
+    return json_bytes([workout.to_dict() for workout in workouts])
+
+
+def fast_workouts(limit):
+    from database import db
+    from models import Workout
+    from serializers import WORKOUT_JSON, encode_workouts, json_array, json_body
+    rows = Workout.query.with_entities(*WORKOUT_JSON.columns) \
+        .order_by(Workout.date.desc(), Workout.id.desc()).limit(limit).all()
+    return json_body(json_array(encode_workouts(db.session, rows)))
+
+
+def orm_templates(limit):
+    from cache import json_bytes
+    from loading import template_options
+    from models import WorkoutTemplate
+    templates = WorkoutTemplate.query.options(*template_options()).order_by(WorkoutTemplate.id).limit(limit).all()
+    return json_bytes([template.to_dict() for template in templates])
+
+
+def fast_templates(limit):
+    from database import db
+    from models import WorkoutTemplate
+    from serializers import TEMPLATE_JSON, encode_templates, json_array, json_body
+    rows = WorkoutTemplate.query.with_entities(*TEMPLATE_JSON.columns).order_by(WorkoutTemplate.id).limit(limit).all()
+    return json_body(json_array(encode_templates(db.session, rows)))
+
+
+def orm_exercises(limit):
+    from cache import json_bytes
+    from models import Exercise
+    return json_bytes([exercise.to_dict() for exercise in Exercise.query.order_by(Exercise.id).limit(limit)])
+
+
+def fast_exercises(limit):
+    from models import Exercise
+    from serializers import EXERCISE_JSON, encode_exercises, json_array, json_body
+    rows = Exercise.query.with_entities(*EXERCISE_JSON.columns).order_by(Exercise.id).limit(limit).all()
+    return json_body(json_array(encode_exercises(rows)))
+
+
+CASES = [
+    ('workouts', orm_workouts, fast_workouts),
+    ('templates', orm_templates, fast_templates),
+    ('exercises', orm_exercises, fast_exercises),
+]
+
+
+def run(build, limit):
+    from database import db
+    db.session.remove()
+    start = time.perf_counter()
+    body = build(limit)
+    elapsed = time.perf_counter() - start
+    db.session.remove()
+    return body, elapsed
+
+
+def peak_memory(build, limit):
+    from database import db
+    db.session.remove()
+    tracemalloc.start()
+    try:
+        build(limit)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        db.session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ORM vs tuple serialization of list endpoints')
+    parser.add_argument('--rows', type=int, default=2000, help='parent rows per body')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    mismatches = 0
+    with app.app_context():
+        print(f"{'case':<10} {'path':<5} {'rows':>6} {'KiB':>8} {'best ms':>9} {'rows/s':>10} {'peak B/row':>11}")
+        for name, orm, fast in CASES:
+            bodies = {}
+            for path, build in (('orm', orm), ('fast', fast)):
+                body, best = None, None
+                for _ in range(args.repeat):
+                    body, elapsed = run(build, args.rows)
+                    best = elapsed if best is None else min(best, elapsed)
+                bodies[path] = body
+                rows = max(len(json.loads(body)), 1)
+                print(f"{name:<10} {path:<5} {rows:>6} {len(body) / 1024:>8.1f} {best * 1000:>9.1f} "
+                      f"{rows / best:>10.0f} {peak_memory(build, args.rows) / rows:>11.0f}")
+            if bodies['orm'] != bodies['fast']:
+                mismatches += 1
+                print(f"{name}: bodies differ", file=sys.stderr)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
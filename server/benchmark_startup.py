@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Startup time from "import app" to the first response, measured in fresh
+# interpreters so nothing is cached in-process. Each run reports:
+#
+#   import_ms      importing app.py
+#   create_app_ms  building the app (config, engine, blueprints)
+#   first_ms       first GET /api/health through the test client
+#   total_ms       all of the above
+#
+# Medians over --runs are compared against benchmarks/startup.json; --check exits
+# non-zero when total_ms regresses by more than --tolerance, --save records a new
+# baseline.
+#
+#   python benchmark_startup.py [--runs 7] [--check | --save]
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'startup.json')
+
+MEASURE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+response = application.test_client().get('/api/health')
+assert response.status_code == 200, response.status_code
+answered = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_ms': (answered - created) * 1000,
+    'total_ms': (answered - start) * 1000,
+}))
+"""
+
+
+def measure(runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', MEASURE], check=True, capture_output=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        samples.append(json.loads(output.decode().strip().splitlines()[-1]))
+    return {key: round(statistics.median(s[key] for s in samples), 1) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import-to-first-response startup benchmark')
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed total_ms regression (fraction)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--check', action='store_true', help='fail if slower than the saved baseline')
+    mode.add_argument('--save', action='store_true', help='save this run as the baseline')
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+    if args.save:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Saved baseline to {BASELINE_PATH}")
+    elif args.check:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        limit = baseline['total_ms'] * (1 + args.tolerance)
+        print(f"total_ms {result['total_ms']} vs baseline {baseline['total_ms']} (limit {limit:.1f})")
+        if result['total_ms'] > limit:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, current_app
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session
+from database import db
+from models import CatalogState, Exercise, Tag, WorkoutTemplate, WorkoutTemplateExercise
+from conditional import make_etag, not_modified, with_etag
+
+# Read-through cache for the exercise and template catalog.
+#
+# Entries hold the exact JSON bytes jsonify would have sent, keyed by endpoint and
+# filter parameters. Every flush that touches a catalog model bumps the version in
+# the catalog_state table in the same transaction, so writes from any process
+# (other workers, the seed scripts) invalidate the cache. Each process re-reads the
+# version at most once per CATALOG_CACHE_RECHECK_SECONDS, and immediately after it
+# commits a catalog change itself.
+
+CATALOG_MODELS = (Exercise, WorkoutTemplate, WorkoutTemplateExercise, Tag)
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_RECHECK_SECONDS = 1.0
+
+
+def read_catalog_version():
+    """Return the current catalog version from the database"""
+    return db.session.query(CatalogState.version).filter_by(id=1).scalar() or 0
+
+
+class CatalogCache:
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _config(self, name, default):
+        return current_app.config.get(name, default)
+
+    def version(self):
+        """Current catalog version, re-read from the database when the check is stale"""
+        now = time.monotonic()
+        if now - self._checked_at >= self._config('CATALOG_CACHE_RECHECK_SECONDS', DEFAULT_RECHECK_SECONDS):
+            version = read_catalog_version()
+            with self._lock:
+                if version != self._version:
+                    self._entries.clear()
+                    self._version = version
+                self._checked_at = now
+        return self._version
+
+    def invalidate(self):
+        """Force the next lookup to re-read the catalog version"""
+        self._checked_at = 0.0
+
+    def get_or_build(self, key, build):
+        """Return cached bytes for key, calling build() to produce them on a miss"""
+        version = self.version()
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+
+        body = build()
+        max_entries = self._config('CATALOG_CACHE_SIZE', DEFAULT_MAX_ENTRIES)
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = body
+                self._entries.move_to_end(key)
+                while len(self._entries) > max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return body
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self._version,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+catalog_cache = CatalogCache()
+
+
+def json_bytes(obj):
+    """Serialize obj exactly as jsonify() would"""
+    return current_app.json.response(obj).get_data()
+
+
+def cached_body(key, build):
+    """Respond with the cached JSON bytes for key, calling build() for them on a miss"""
+    etag = make_etag('catalog', catalog_cache.version(), key)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    body = catalog_cache.get_or_build(key, build)
+    return with_etag(Response(body, status=200, mimetype='application/json'), etag)
+
+
+def cached_json(key, build):
+    """Respond with the cached JSON for key, building it from build() on a miss"""
+    return cached_body(key, lambda: json_bytes(build()))
+
+
+@event.listens_for(Session, 'after_flush')
+def bump_catalog_version(session, flush_context):
+    touched = session.new | session.dirty | session.deleted
+    if not any(isinstance(obj, CATALOG_MODELS) for obj in touched):
+        return
+
+    connection = session.connection()
+    result = connection.execute(
+        update(CatalogState.__table__).where(CatalogState.__table__.c.id == 1)
+        .values(version=CatalogState.__table__.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(CatalogState.__table__).values(id=1, version=1))
+    session.info['catalog_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_after_commit(session):
+    if session.info.pop('catalog_changed', False):
+        catalog_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_catalog_change(session):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,300 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, select, update
+from cache import catalog_cache
+from database import db
+from jobs import enqueue, job_type
+from models import Exercise, User, UserStats, Workout, WorkoutExercise
+from sync import next_change_seq
+
+# Calorie estimates for workouts recorded without them.
+#
+# An exercise row burns MET x body weight (kg) x active hours, with the MET value
+# looked up by the exercise's category and difficulty level and the user's own
+# weight (DEFAULT_BODY_WEIGHT_KG when they never gave one). Active time is
+# duration_seconds when the row has one, otherwise each set counts its reps at
+# SECONDS_PER_REP plus SET_REST_SECONDS. A workout burns the sum of its exercise
+# rows, or GENERAL_MET for its duration_minutes when none of them has a value.
+#
+# Whatever the client sent is kept; only missing values are filled in, and
+# calories_estimated marks them so that they can be recomputed when the workout
+# changes (create, update, finalizing a live session, bulk import) without ever
+# overwriting a real measurement. Estimates are computed with NumPy over column
+# arrays, a whole batch of rows at once.
+#
+# History recorded before this existed is filled in by a backfill that walks the
+# workouts in id order, one transaction per chunk, with one executemany UPDATE
+# per table and one stats delta per user:
+#
+#   flask --app app estimate-calories [--chunk-workouts 5000] [--queue]
+#
+# (--queue leaves it to the job workers, see jobs.py.)
+# Running it again only writes rows whose estimate changed (say, after editing
+# the MET table).
+
+# (beginner, intermediate, advanced), after the Compendium of Physical Activities
+MET_VALUES = {
+    'strength': (3.5, 5.0, 6.0),
+    'cardio': (5.0, 7.0, 9.0),
+    'hiit': (6.0, 8.0, 10.0),
+    'flexibility': (2.3, 2.5, 3.0),
+    'yoga': (2.5, 3.0, 4.0),
+}
+DIFFICULTY_LEVELS = ('beginner', 'intermediate', 'advanced')
+DEFAULT_MET = 4.0
+GENERAL_MET = 5.0
+
+DEFAULT_BODY_WEIGHT_KG = 70.0
+SECONDS_PER_REP = 3
+SET_REST_SECONDS = 60
+
+BACKFILL_CHUNK_WORKOUTS = 5000
+
+
+def exercise_met(category, difficulty_level):
+    """MET value for a catalog exercise; unknown levels count as intermediate"""
+    values = MET_VALUES.get((category or '').lower())
+    if values is None:
+        return DEFAULT_MET
+    level = (difficulty_level or '').lower()
+    return values[DIFFICULTY_LEVELS.index(level) if level in DIFFICULTY_LEVELS else 1]
+
+
+def build_met_table(rows):
+    """Array of MET values indexed by exercise id from (id, category, difficulty_level) rows"""
+    import numpy as np
+
+    table = np.full(max((row[0] for row in rows), default=0) + 1, DEFAULT_MET)
+    for exercise_id, category, difficulty_level in rows:
+        table[exercise_id] = exercise_met(category, difficulty_level)
+    return table
+
+
+_met_table = (None, None)
+
+
+def met_table():
+    """The MET table for the current catalog, rebuilt when the catalog changes"""
+    global _met_table
+    version = catalog_cache.version()
+    cached_version, table = _met_table
+    if table is None or cached_version != version:
+        table = build_met_table(
+            db.session.execute(select(Exercise.id, Exercise.category, Exercise.difficulty_level)).all()
+        )
+        _met_table = (version, table)
+    return table
+
+
+def _calories(np, sent, values):
+    """(calories_burned, calories_estimated) pairs; values are NaN where there is nothing to say"""
+    known = ~np.isnan(values)
+    calories = [int(value) if ok else None for value, ok in zip(values.tolist(), known.tolist())]
+    return list(zip(calories, (known & ~sent).tolist()))
+
+
+def estimate_calories(met, workouts, exercises):
+    """Fill in calories for workouts and their exercise rows, keeping the ones the client sent
+
+    workouts: (body_weight, duration_minutes, calories_burned, calories_estimated) per workout
+    exercises: (workout index, exercise_id, sets, reps, duration_seconds, calories_burned,
+    calories_estimated) per exercise row
+    Returns a (calories_burned, calories_estimated) pair per workout and per exercise row.
+    """
+    if not workouts:
+        return [], []
+    import numpy as np
+
+    body_weights, minutes, calories, estimated = zip(*workouts)
+    body_weight = np.array(body_weights, dtype=np.float64)
+    body_weight = np.where(np.isnan(body_weight) | (body_weight <= 0), DEFAULT_BODY_WEIGHT_KG, body_weight)
+    count = len(workouts)
+
+    totals = np.zeros(count)
+    counted = np.zeros(count, dtype=bool)
+    exercise_calories = []
+    if exercises:
+        index, exercise_ids, sets, reps, seconds, row_calories, row_estimated = zip(*exercises)
+        index = np.array(index, dtype=np.int64)
+        exercise_ids = np.array(exercise_ids, dtype=np.int64)
+        rate = np.full(len(exercise_ids), DEFAULT_MET)
+        listed = (exercise_ids >= 0) & (exercise_ids < len(met))
+        rate[listed] = met[exercise_ids[listed]]
+
+        sets = np.array(sets, dtype=np.float64)
+        sets = np.where(np.isnan(sets) | (sets < 1), 1, sets)
+        reps = np.array(reps, dtype=np.float64)
+        seconds = np.array(seconds, dtype=np.float64)
+        # NaN compares false: rows with neither a duration nor reps stay unknown
+        active = np.where(seconds > 0, seconds,
+                          np.where(reps > 0, sets * (reps * SECONDS_PER_REP + SET_REST_SECONDS), np.nan))
+        estimate = np.rint(rate * body_weight[index] * active / 3600)
+
+        values = np.array(row_calories, dtype=np.float64)
+        sent = ~np.isnan(values) & ~np.array(row_estimated, dtype=bool)
+        values = np.where(sent, values, estimate)
+        known = ~np.isnan(values)
+        totals = np.bincount(index[known], weights=values[known], minlength=count)
+        counted = np.bincount(index[known], minlength=count) > 0
+        exercise_calories = _calories(np, sent, values)
+
+    by_duration = np.rint(GENERAL_MET * body_weight * np.array(minutes, dtype=np.float64) / 60)
+    values = np.array(calories, dtype=np.float64)
+    sent = ~np.isnan(values) & ~np.array(estimated, dtype=bool)
+    values = np.where(sent, values, np.where(counted, totals, by_duration))
+    return _calories(np, sent, values), exercise_calories
+
+
+def estimate_workout(workout, workout_exercises=None):
+    """Fill in the calories a workout and its exercises (default: its loaded ones) were recorded without"""
+    # Looking things up must not flush the rows being estimated half-done
+    with db.session.no_autoflush:
+        if workout_exercises is None:
+            workout_exercises = list(workout.workout_exercises)
+        user = db.session.get(User, workout.user_id)
+        met = met_table()
+    (workout_calories,), exercise_calories = estimate_calories(
+        met,
+        [(user.weight if user else None, workout.duration_minutes, workout.calories_burned,
+          workout.calories_estimated)],
+        [(0, e.exercise_id, e.sets, e.reps, e.duration_seconds, e.calories_burned, e.calories_estimated)
+         for e in workout_exercises]
+    )
+    for obj, (calories, estimated) in zip([workout, *workout_exercises], [workout_calories, *exercise_calories]):
+        # Only touch what changed, so that an unchanged row isn't written again
+        if obj.calories_burned != calories or bool(obj.calories_estimated) != estimated:
+            obj.calories_burned = calories
+            obj.calories_estimated = estimated
+
+
+def driver_update_sql(table, columns, dialect):
+    """Raw UPDATE of columns in table by id in the driver's own placeholder style"""
+    placeholder = '?' if dialect.paramstyle == 'qmark' else '%s'
+    assignments = ', '.join(f'{column} = {placeholder}' for column in columns)
+    return f"UPDATE {table} SET {assignments} WHERE id = {placeholder}"
+
+
+def backfill_chunk(connection, met, after, limit):
+    """Estimate calories for the next limit workouts by id; returns (last id or None, workouts, exercises updated)"""
+    workouts = connection.execute(
+        select(Workout.id, Workout.user_id, User.weight, Workout.duration_minutes, Workout.calories_burned,
+               Workout.calories_estimated)
+        .outerjoin(User, User.id == Workout.user_id)
+        .where(Workout.id > after).order_by(Workout.id).limit(limit)
+    ).tuples().all()
+    if not workouts:
+        return None, 0, 0
+    exercises = connection.execute(
+        select(WorkoutExercise.id, WorkoutExercise.workout_id, WorkoutExercise.exercise_id, WorkoutExercise.sets,
+               WorkoutExercise.reps, WorkoutExercise.duration_seconds, WorkoutExercise.calories_burned,
+               WorkoutExercise.calories_estimated)
+        .where(WorkoutExercise.workout_id.between(workouts[0][0], workouts[-1][0]))
+    ).tuples().all()
+
+    position = {row[0]: i for i, row in enumerate(workouts)}
+    workout_calories, exercise_calories = estimate_calories(
+        met,
+        [row[2:] for row in workouts],
+        [(position[row[1]],) + row[2:] for row in exercises]
+    )
+
+    # Rows are written with the driver's executemany() as plain tuples, like
+    # bulk_import.py: Core's per-row parameter processing costs more than the update
+    changed_exercises = []
+    touched = set()
+    for (row_id, workout_id, *_, calories_burned, calories_estimated), (calories, estimated) \
+            in zip(exercises, exercise_calories):
+        if calories_burned != calories or bool(calories_estimated) != estimated:
+            changed_exercises.append((calories, estimated, row_id))
+            touched.add(workout_id)
+    # A workout whose exercises changed is written too, for its updated_at and change_seq
+    changed_workouts = []
+    deltas = defaultdict(int)
+    for (workout_id, user_id, *_, calories_burned, calories_estimated), (calories, estimated) \
+            in zip(workouts, workout_calories):
+        if calories_burned != calories or bool(calories_estimated) != estimated or workout_id in touched:
+            changed_workouts.append((calories, estimated, workout_id))
+            deltas[user_id] += (calories or 0) - (calories_burned or 0)
+
+    if changed_workouts:
+        dialect = connection.dialect
+        seq = next_change_seq(connection)
+        now = datetime.utcnow()
+        if changed_exercises:
+            connection.exec_driver_sql(
+                driver_update_sql(WorkoutExercise.__tablename__,
+                                  ('calories_burned', 'calories_estimated', 'change_seq'), dialect),
+                [(calories, estimated, seq, row_id) for calories, estimated, row_id in changed_exercises]
+            )
+        connection.exec_driver_sql(
+            driver_update_sql(Workout.__tablename__,
+                              ('calories_burned', 'calories_estimated', 'updated_at', 'change_seq'), dialect),
+            [(calories, estimated, now, seq, workout_id) for calories, estimated, workout_id in changed_workouts]
+        )
+        # Users without a stats row yet get theirs rebuilt from history on first use
+        stats = [{'b_user_id': user_id, 'delta': delta} for user_id, delta in sorted(deltas.items()) if delta]
+        if stats:
+            table = UserStats.__table__
+            connection.execute(
+                update(table).where(table.c.user_id == bindparam('b_user_id'))
+                .values(total_calories=table.c.total_calories + bindparam('delta')),
+                stats
+            )
+    return workouts[-1][0], len(changed_workouts), len(changed_exercises)
+
+
+def backfill(chunk_workouts=BACKFILL_CHUNK_WORKOUTS, progress=None):
+    """Estimate missing calories across the whole workout history, one transaction per chunk
+
+    progress, if given, is called after each chunk with the last workout id done
+    and the workouts and exercises updated so far.
+    """
+    met = met_table()
+    db.session.commit()
+
+    written_workouts = written_exercises = 0
+    last_id = 0
+    with db.engine.connect() as connection:
+        while True:
+            with connection.begin():
+                last_id, workouts, exercises = backfill_chunk(connection, met, last_id, chunk_workouts)
+            if last_id is None:
+                break
+            written_workouts += workouts
+            written_exercises += exercises
+            if progress:
+                progress(last_id, written_workouts, written_exercises)
+    return written_workouts, written_exercises
+
+
+@job_type('estimate_calories')
+def estimate_calories_job(job):
+    """The backfill as a job; payload: chunk_workouts"""
+    workouts, exercises = backfill(job.payload.get('chunk_workouts', BACKFILL_CHUNK_WORKOUTS))
+    return {'workouts': workouts, 'exercises': exercises}
+
+
+@click.command('estimate-calories')
+@click.option('--chunk-workouts', default=BACKFILL_CHUNK_WORKOUTS, show_default=True,
+              help='workouts per transaction')
+@click.option('--queue', is_flag=True, help='queue it as a background job instead of running it here')
+@with_appcontext
+def estimate_calories_command(chunk_workouts, queue):
+    """Fill in estimated calories for workouts recorded without them."""
+    if queue:
+        job = enqueue('estimate_calories', {'chunk_workouts': chunk_workouts})
+        db.session.commit()
+        click.echo(f"Queued job {job.id}")
+        return
+    started = time.perf_counter()
+
+    def progress(last_id, workouts, exercises):
+        click.echo(f"{last_id:>10} last id {workouts:>10} workouts {exercises:>10} exercises "
+                   f"updated {time.perf_counter() - started:7.1f}s")
+
+    workouts, exercises = backfill(chunk_workouts, progress)
+    click.echo(f"Updated {workouts} workouts and {exercises} workout exercises "
+               f"in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,213 @@
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from collections import namedtuple
+from sqlalchemy import event
+from app import create_app
+from database import db
+from jobs import work
+from models import User, Workout, Exercise, WorkoutTemplate
+
+# Drives every route through the test client, reads before writes, then runs the
+# jobs they queued, captures the statements issued along the way and runs EXPLAIN
+# QUERY PLAN on each against the configured SQLite database. Exits non-zero if any statement falls back to a
+# full table scan, so a route change that loses its index shows up before it
+# reaches a large database.
+#
+# The write routes change data, so the routes run against a copy of the
+# database in a temporary directory; the configured one is only read.
+#
+#   flask --app app init-db && python check_query_plans.py
+
+# SCAN CONSTANT ROW is a SELECT without a table (e.g. of scalar subqueries)
+SCAN_PATTERN = re.compile(r'^SCAN (?!CONSTANT ROW)(\w+)')
+
+# A virtual table scan that hands constraints to the module (FTS5 MATCH, rowid
+# lookups) names them after the colon; a bare "INDEX 0:" reads every row
+VIRTUAL_SEARCH_PATTERN = re.compile(r' VIRTUAL TABLE INDEX \d+:\S')
+
+# Routes that read the whole exercise and template catalog by design
+CATALOG_TABLES = {'exercises', 'workout_templates', 'workout_template_exercises'}
+
+# Statements that have a plan; plain INSERT ... VALUES has an empty one
+PLANNED_PATTERN = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+
+# One request. path and body are formatted with (or, if callable, called with)
+# the ids found so far; keep maps names to functions of the JSON response whose
+# results later steps can use; allowed names the tables the route may scan. A
+# step without a method calls body() instead and path only labels it.
+Step = namedtuple('Step', ['method', 'path', 'body', 'allowed', 'keep'], defaults=(None, set(), None))
+
+
+def sample_routes():
+    """(Steps in run order, the ids they start from) for every route"""
+    user = User.query.join(Workout, Workout.user_id == User.id).first()
+    workout = Workout.query.filter_by(user_id=user.id).first() if user else None
+    exercise = Exercise.query.first()
+    template = WorkoutTemplate.query.first()
+    if not (user and workout and exercise and template):
+        raise SystemExit('Seed the database first (seed_db.py, seed_templates.py)')
+
+    ids = {'user': user.id, 'workout': workout.id, 'exercise': exercise.id, 'template': template.id,
+           'category': exercise.category, 'term': workout.name.split()[0]}
+    new_workout = {'user_id': user.id, 'name': 'Plan check', 'duration_minutes': 30,
+                   'exercises': [{'exercise_id': exercise.id, 'sets': 3, 'reps': 10}]}
+    steps = [
+        Step('POST', '/api/auth/login', {'username': user.username, 'password': 'password123'}),
+        Step('GET', '/api/auth/users/{user}'),
+        Step('GET', '/api/users/{user}/stats'),
+        Step('GET', '/api/users/{user}/progress?exercise_id={exercise}'),
+        Step('GET', '/api/users/{user}/export'),
+        Step('GET', '/api/workouts', allowed={'workouts'}),
+        Step('GET', '/api/workouts?user_id={user}'),
+        Step('GET', '/api/workouts?user_id={user}&limit=1'),
+        Step('GET', '/api/workouts?user_id={user}&format=ndjson'),
+        Step('GET', '/api/workouts/search?q={term}&user_id={user}'),
+        Step('GET', '/api/workouts/{workout}'),
+        Step('GET', '/api/exercises', allowed=CATALOG_TABLES),
+        Step('GET', '/api/exercises?category={category}', allowed=CATALOG_TABLES),
+        Step('GET', '/api/exercises?muscle_group=chest,triceps&match=all'),
+        Step('GET', '/api/exercises?equipment=barbell'),
+        Step('GET', '/api/exercises/{exercise}'),
+        Step('GET', '/api/templates', allowed=CATALOG_TABLES),
+        Step('GET', '/api/templates?muscle_group=core'),
+        Step('GET', '/api/templates/{template}'),
+        Step('GET', '/api/sync?user_id={user}', allowed=CATALOG_TABLES, keep={'cursor': lambda r: r['cursor']}),
+        Step('GET', '/api/sync?user_id={user}&since={cursor}'),
+
+        Step('PUT', '/api/auth/users/{user}', {'fitness_goal': 'Plan check'}),
+        # Creating workouts checks exercise ids against (and estimates calories from) the catalog
+        Step('POST', '/api/workouts', new_workout, allowed=CATALOG_TABLES, keep={
+            'created': lambda r: r['workout']['id'],
+            'created_exercise': lambda r: r['workout']['exercises'][0]['id'],
+        }),
+        Step('PUT', '/api/workouts/{created}', {'name': 'Plan check, renamed', 'calories_burned': None}),
+        Step('POST', '/api/workouts/bulk', [dict(new_workout, date='2024-01-02')], allowed=CATALOG_TABLES),
+        Step('POST', '/api/workouts/{created}/session', keep={'session': lambda r: r['session']['id']}),
+        Step('GET', '/api/sessions/{session}'),
+        Step('POST', '/api/sessions/{session}/events', lambda ids: {'events': [
+            {'seq': 1, 'type': 'start', 'at': '2024-01-02T10:00:00'},
+            {'seq': 2, 'type': 'set_completed', 'at': '2024-01-02T10:02:00',
+             'workout_exercise_id': ids['created_exercise'], 'reps': 10},
+        ]}),
+        Step('POST', '/api/sessions/{session}/finalize'),
+        Step('DELETE', '/api/workouts/{created}'),
+        Step('POST', '/api/exercises', {'name': 'Plan check press', 'category': 'strength',
+                                        'muscle_groups': ['chest'], 'equipment': 'barbell'}),
+        Step('POST', '/api/templates/{template}/start', {'user_id': user.id}),
+        Step('POST', '/api/users/{user}/export', keep={'job': lambda r: r['job']['id']}),
+        Step('POST', '/api/users/{user}/rebuild'),
+        Step(None, 'job worker', lambda ids: work('check_query_plans', once=True)),
+        Step('GET', '/api/jobs?user_id={user}'),
+        Step('GET', '/api/jobs/{job}'),
+        Step('GET', '/api/jobs/{job}/result'),
+    ]
+    return steps, ids
+
+
+def capture_statements(run):
+    """Call run() and return (its result, (statement, parameters) of every statement with a plan)"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if PLANNED_PATTERN.match(statement):
+            # Batched INSERT ... RETURNING comes as executemany with its parameters already flat
+            many = executemany and isinstance(parameters, list)
+            statements.append((statement, parameters[0] if many else parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        result = run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return result, statements
+
+
+def full_scans(statement, parameters, allowed):
+    """Return the plan lines of a statement that scan a table outside `allowed`"""
+    with db.engine.connect() as connection:
+        tables = {row[0] for row in connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        match = SCAN_PATTERN.match(detail)
+        # Subqueries SQLite materialized show up under their alias, not a table
+        if not match or match.group(1) not in tables or match.group(1) in allowed:
+            continue
+        if not VIRTUAL_SEARCH_PATTERN.search(detail):
+            scans.append(detail)
+    return scans
+
+
+def _request(client, method, path, body):
+    response = client.open(path, method=method, json=body)
+    response.get_data()
+    return response
+
+
+def plan_failures(app):
+    """Run every route against app's database; returns (method, path, statement, scans) for each full scan"""
+    failures = []
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            raise SystemExit('EXPLAIN QUERY PLAN checks only run against SQLite')
+
+        client = app.test_client()
+        steps, ids = sample_routes()
+        for step in steps:
+            path = step.path.format(**ids)
+            body = step.body(ids) if callable(step.body) and step.method else step.body
+            if step.method is None:
+                _, statements = capture_statements(lambda: body(ids))
+            else:
+                response, statements = capture_statements(lambda: _request(client, step.method, path, body))
+                if response.status_code >= 400:
+                    failures.append((step.method, path, None, [response.get_data(as_text=True)]))
+                    continue
+                for name, find in (step.keep or {}).items():
+                    ids[name] = find(response.get_json())
+            for statement, parameters in statements:
+                scans = full_scans(statement, parameters, step.allowed)
+                if scans:
+                    failures.append((step.method, path, statement, scans))
+    return failures
+
+
+def copy_database(app, directory):
+    """Copy app's SQLite database into directory, returning the copy's URL"""
+    with app.app_context():
+        source = db.engine.url.database
+    target = os.path.join(directory, os.path.basename(source))
+    with sqlite3.connect(source) as original, sqlite3.connect(target) as copy:
+        original.backup(copy)
+    return f'sqlite:///{target}'
+
+
+def check_query_plans():
+    with tempfile.TemporaryDirectory() as directory:
+        url = copy_database(create_app(), directory)
+        app = create_app({'SQLALCHEMY_DATABASE_URI': url, 'JOBS_DIR': os.path.join(directory, 'jobs')})
+        failures = plan_failures(app)
+        with app.app_context():
+            db.engine.dispose()
+
+    for method, path, statement, details in failures:
+        print(f"FULL SCAN  {method or ''} {path}" if statement else f"ERROR      {method} {path}")
+        if statement:
+            print(f"    {' '.join(statement.split())}")
+        for detail in details:
+            print(f"    -> {detail}")
+
+    if failures:
+        print(f"{len(failures)} statement(s) fall back to a full table scan or route(s) failed")
+    else:
+        print("All route queries use an index")
+    return len(failures)
+
+
+if __name__ == '__main__':
+    sys.exit(1 if check_query_plans() else 0)
@@ -0,0 +1,80 @@
+import hashlib
+from datetime import datetime
+from flask import Response, request
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from database import db
+from models import SyncTombstone, User, Workout, WorkoutExercise
+from sync import current_seq
+
+# HTTP validators for the read endpoints.
+#
+# ETags are derived from a handful of version columns (updated_at, change
+# sequence numbers, the catalog version) fetched with a narrow query, never from
+# the serialized body, so a matching If-None-Match is answered with a 304 before
+# any ORM objects are loaded or to_dict() runs.
+#
+# Workout lists use the change sequence numbers of sync.py: every write to a
+# user's workouts stamps a workout or leaves a tombstone, so the newest of both
+# (two index lookups) changes whenever any page of the list could.
+
+
+def make_etag(*parts):
+    """Strong ETag value for a tuple of version parts"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already holds etag, else None"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+
+def with_etag(response, etag):
+    """Attach etag to a response and ask clients to revalidate on every use"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def user_etag(user_id):
+    row = db.session.query(User.id, func.coalesce(User.updated_at, User.created_at)) \
+        .filter(User.id == user_id).first()
+    return make_etag('user', *row) if row else None
+
+
+def workout_etag(workout_id, catalog_version):
+    """(owner's user_id, ETag) of a workout, or (None, None) if there is none"""
+    row = db.session.query(Workout.user_id, Workout.id, func.coalesce(Workout.updated_at, Workout.created_at)) \
+        .filter(Workout.id == workout_id).first()
+    if row is None:
+        return None, None
+    # Workout payloads embed exercise names, so catalog changes invalidate them too
+    return row.user_id, make_etag('workout', catalog_version, *row[1:])
+
+
+def workout_list_etag(user_id, catalog_version, params):
+    if user_id:
+        version = db.session.execute(select(
+            select(func.max(Workout.change_seq)).where(Workout.user_id == user_id).scalar_subquery(),
+            select(func.max(SyncTombstone.seq)).where(SyncTombstone.user_id == user_id).scalar_subquery(),
+        )).one()
+    else:
+        # Every user's workouts: any change anywhere takes a new number
+        version = (current_seq(),)
+    return make_etag('workouts', catalog_version, user_id, sorted(params.items(multi=True)), *version)
+
+
+@event.listens_for(Session, 'before_flush')
+def touch_parent_workouts(session, flush_context, instances):
+    """Changing a workout's exercises changes its payload, so bump its updated_at"""
+    now = datetime.utcnow()
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, WorkoutExercise):
+            workout = obj.workout
+            if workout is not None and workout not in session.deleted and workout not in session.new:
+                workout.updated_at = now
@@ -1,10 +1,11 @@
-from app import app
-from database import db
+from app import create_app
+from migrations import init_schema
 
 def create_tables():
-    with app.app_context():
-        # Create all tables
-        db.create_all()
+    # Same as: flask --app app init-db
+    with create_app().app_context():
+        # Create all tables and apply migrations
+        init_schema()
         print("All tables created successfully!")
 
 if __name__ == '__main__':
@@ -0,0 +1,155 @@
+import csv
+import io
+import os
+from datetime import date
+from flask import current_app
+from sqlalchemy import select
+from database import db
+from jobs import job_type
+from models import Exercise, Workout, WorkoutExercise
+
+# Streaming export of a user's training history.
+#
+# One flat row per workout x exercise (workouts without exercises get a single
+# row with empty exercise columns), read through a server-side cursor in batches
+# of EXPORT_BATCH_SIZE and written out batch by batch, so memory use does not
+# grow with the length of the history.
+#
+# Formats:
+#   csv    - RFC 4180 text with a header row
+#   arrow  - Apache Arrow IPC stream, one zstd-compressed record batch per
+#            database batch; loads directly into pandas, polars, DuckDB or R.
+#            Needs pyarrow.
+#
+# Besides streaming straight into the response, an export can run as a
+# background job (see jobs.py) that writes the file under JOBS_DIR for
+# /api/jobs/<id>/result to serve.
+
+EXPORT_BATCH_SIZE = 2000
+ARROW_COMPRESSION = 'zstd'
+
+# (output name, column, arrow type name)
+EXPORT_COLUMNS = [
+    ('workout_id', Workout.id, 'int64'),
+    ('date', Workout.date, 'date32'),
+    ('workout_name', Workout.name, 'string'),
+    ('workout_duration_minutes', Workout.duration_minutes, 'int64'),
+    ('workout_calories_burned', Workout.calories_burned, 'int64'),
+    ('workout_notes', Workout.notes, 'string'),
+    ('order_in_workout', WorkoutExercise.order_in_workout, 'int64'),
+    ('exercise_id', WorkoutExercise.exercise_id, 'int64'),
+    ('exercise_name', Exercise.name, 'string'),
+    ('category', Exercise.category, 'string'),
+    ('sets', WorkoutExercise.sets, 'int64'),
+    ('reps', WorkoutExercise.reps, 'int64'),
+    ('weight', WorkoutExercise.weight, 'float64'),
+    ('duration_seconds', WorkoutExercise.duration_seconds, 'int64'),
+    ('distance', WorkoutExercise.distance, 'float64'),
+    ('calories_burned', WorkoutExercise.calories_burned, 'int64'),
+    ('exercise_notes', WorkoutExercise.notes, 'string'),
+]
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow'),
+}
+
+
+def export_query(user_id, date_from=None, date_to=None):
+    """Flattened workout x exercise rows for one user, oldest first"""
+    query = select(*[column.label(name) for name, column, _ in EXPORT_COLUMNS]) \
+        .select_from(Workout) \
+        .outerjoin(WorkoutExercise, WorkoutExercise.workout_id == Workout.id) \
+        .outerjoin(Exercise, Exercise.id == WorkoutExercise.exercise_id) \
+        .where(Workout.user_id == user_id)
+    if date_from:
+        query = query.where(Workout.date >= date_from)
+    if date_to:
+        query = query.where(Workout.date <= date_to)
+    # ix_workouts_user_id_date is (user_id, date DESC, id): walking it backwards gives
+    # date ASC, id DESC, and exercises come out of their own index in order, so the
+    # rows stream without a sort step
+    return query.order_by(Workout.date, Workout.id.desc(), WorkoutExercise.order_in_workout)
+
+
+def _batches(connection, query):
+    result = connection.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE).execute(query)
+    try:
+        for batch in result.partitions():
+            yield batch
+    finally:
+        result.close()
+
+
+def stream_csv(connection, query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow([name for name, _, _ in EXPORT_COLUMNS])
+    for batch in _batches(connection, query):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def arrow_schema():
+    import pyarrow as pa
+    return pa.schema([(name, getattr(pa, arrow_type)()) for name, _, arrow_type in EXPORT_COLUMNS])
+
+
+def stream_arrow(connection, query):
+    import pyarrow as pa
+    schema = arrow_schema()
+    sink = io.BytesIO()
+    options = pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION)
+    with pa.ipc.new_stream(sink, schema, options=options) as writer:
+        for batch in _batches(connection, query):
+            columns = zip(*batch)
+            writer.write_batch(pa.record_batch(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # Schema message if there were no rows, plus the end-of-stream marker
+    yield sink.getvalue()
+
+
+def export_stream(export_format):
+    """The stream_* function for a format, or ValueError if it can't be written here"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format == 'arrow':
+        try:
+            arrow_schema()
+        except ImportError:
+            raise ValueError('The arrow format requires pyarrow to be installed')
+        return stream_arrow
+    return stream_csv
+
+
+@job_type('export', concurrency=2)
+def export_job(job):
+    """Write a user's history to a file under JOBS_DIR; payload: format, from, to (YYYY-MM-DD or None)"""
+    export_format = job.payload['format']
+    stream = export_stream(export_format)
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    date_from, date_to = (date.fromisoformat(job.payload[key]) if job.payload.get(key) else None
+                          for key in ('from', 'to'))
+
+    directory = current_app.config['JOBS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'export-{job.id}.{extension}')
+    # Written aside and renamed, so a retried attempt never serves half a file
+    with open(path + '.part', 'wb') as f:
+        for chunk in stream(db.session.connection(), export_query(job.user_id, date_from, date_to)):
+            f.write(chunk.encode() if isinstance(chunk, str) else chunk)
+    os.replace(path + '.part', path)
+    return {
+        'file': os.path.basename(path),
+        'filename': f'workouts-{job.user_id}.{extension}',
+        'mimetype': mimetype,
+        'bytes': os.path.getsize(path)
+    }
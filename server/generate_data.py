@@ -0,0 +1,256 @@
+import argparse
+import random
+import time
+from collections import Counter
+from datetime import date, datetime, time as clock, timedelta
+from sqlalchemy import func, select, text
+from werkzeug.security import generate_password_hash
+from app import create_app
+from database import db, driver_insert_sql
+from migrations import init_schema
+from models import Exercise, User, UserStats, Workout, WorkoutExercise
+from search import reindex_workouts
+from sync import next_change_seq
+
+# Synthetic data at production scale for benchmarking.
+#
+# Generates N users x M workouts on top of the existing exercise catalog (run
+# seed_db.py first). Each user has a training focus and level, a routine of
+# exercises drawn from the catalog by that focus, and loads that progress over
+# the date range. Same seed on the same starting database gives the same data.
+#
+# Rows are built as tuples with ids assigned up front and written with one
+# driver-level executemany per table per chunk, together with the users'
+# user_stats rows and their search index entries, one transaction per chunk
+# with one change sequence number (see sync.py).
+# Nothing else should write to the database while it runs.
+#
+#   python generate_data.py --users 10000 --workouts-per-user 100 --seed 42
+
+USER_COLUMNS = ('id', 'username', 'email', 'password_hash', 'first_name', 'last_name', 'age',
+                'weight', 'height', 'fitness_goal', 'created_at', 'updated_at')
+# Workout and exercise rows get the chunk's change sequence number appended on write
+WORKOUT_COLUMNS = ('id', 'user_id', 'name', 'description', 'date', 'duration_minutes',
+                   'calories_burned', 'notes', 'created_at', 'updated_at', 'change_seq')
+EXERCISE_COLUMNS = ('id', 'workout_id', 'exercise_id', 'sets', 'reps', 'weight', 'duration_seconds',
+                    'distance', 'calories_burned', 'notes', 'order_in_workout', 'change_seq')
+STATS_COLUMNS = ('user_id', 'total_workouts', 'total_calories', 'total_duration_minutes', 'updated_at')
+
+# Relative weight of each exercise category in a user's routine
+FOCUSES = {
+    'strength': {'strength': 6, 'cardio': 1, 'flexibility': 1},
+    'endurance': {'strength': 1, 'cardio': 6, 'flexibility': 1},
+    'general': {'strength': 3, 'cardio': 3, 'flexibility': 1},
+    'mobility': {'strength': 1, 'cardio': 1, 'flexibility': 5},
+}
+GOALS = {
+    'strength': 'Build muscle and strength',
+    'endurance': 'Improve cardiovascular endurance',
+    'general': 'Stay fit and healthy',
+    'mobility': 'Improve flexibility and mobility',
+}
+LEVELS = {'beginner': 0.6, 'intermediate': 1.0, 'advanced': 1.5}
+
+WORKOUT_NAMES = {
+    'strength': ['Upper Body Strength', 'Leg Day', 'Push Day', 'Pull Day', 'Full Body Strength'],
+    'cardio': ['Morning Run', 'HIIT Session', 'Cardio Blast', 'Interval Training', 'Endurance Ride'],
+    'flexibility': ['Yoga Flow', 'Mobility Session', 'Stretch and Recover'],
+}
+NOTES = [
+    'Great workout! Felt strong today.',
+    'Tired today, cut it a bit short.',
+    'New personal best!',
+    'Focus on form next time.',
+    'Felt easy, go heavier next week.',
+]
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn',
+               'Maria', 'Ahmed', 'Wei', 'Priya', 'Lucas', 'Amara', 'Kenji', 'Sofia', 'Omar', 'Elena']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Kim', 'Nguyen', 'Johnson', 'Okafor', 'Silva', 'Novak',
+              'Brown', 'Khan', 'Rossi', 'Müller', 'Haddad', 'Tanaka', 'Lopez', 'Ivanova', 'Cohen', 'Mensah']
+
+# Equipment that means a strength exercise is done with an external load
+LOADED_EQUIPMENT = ('barbell', 'dumbbell', 'kettlebell', 'machine')
+
+
+class Generator:
+    def __init__(self, rng, exercises, workouts_per_user, exercises_per_workout, days, password_hash):
+        self.rng = rng
+        self.exercises = exercises  # (id, category, loaded)
+        self.workouts_per_user = workouts_per_user
+        self.exercises_per_workout = exercises_per_workout
+        self.days = days
+        self.password_hash = password_hash
+        self.today = date.today()
+
+    def user(self, user_id, workout_id, exercise_row_id):
+        """Rows for one user and their history: (user, stats, workouts, exercises)"""
+        rng = self.rng
+        focus = rng.choice(list(FOCUSES))
+        level = LEVELS[rng.choice(list(LEVELS))]
+        joined = self.today - timedelta(days=self.days)
+        created_at = datetime.combine(joined, clock(rng.randrange(24), rng.randrange(60)))
+        user = (
+            user_id, f'user{user_id}', f'user{user_id}@example.com', self.password_hash,
+            rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.randint(18, 65),
+            round(rng.uniform(50, 110), 1), round(rng.uniform(150, 200), 1), GOALS[focus],
+            created_at, created_at
+        )
+
+        # A routine of favourite exercises, each loaded exercise with a starting weight
+        category_weights = FOCUSES[focus]
+        routine = []
+        pool = list(self.exercises)
+        for _ in range(min(len(pool), rng.randint(8, 14))):
+            choice = rng.choices(pool, weights=[category_weights.get(e[1], 1) for e in pool])[0]
+            pool.remove(choice)
+            routine.append(choice)
+        loads = {e[0]: rng.uniform(15, 80) * level for e in routine if e[2]}
+
+        workouts = []
+        exercise_rows = []
+        totals = [0, 0, 0]
+        dates = sorted(self.today - timedelta(days=rng.randrange(self.days)) for _ in range(self.workouts_per_user))
+        for workout_date in dates:
+            progress = 1 - (self.today - workout_date).days / self.days
+            count = max(1, min(len(routine), round(rng.gauss(self.exercises_per_workout, 1.5))))
+            picks = rng.sample(routine, count)
+            main_category = Counter(e[1] for e in picks).most_common(1)[0][0]
+
+            for order, (exercise_id, category, loaded) in enumerate(picks, start=1):
+                exercise_rows.append((exercise_row_id, workout_id, exercise_id) + self.performance(
+                    rng, category, loaded and loads[exercise_id] * (1 + 0.3 * progress), level
+                ) + (None, order))
+                exercise_row_id += 1
+
+            duration = rng.randint(20, 90)
+            calories = int(duration * rng.uniform(5, 11))
+            logged_at = datetime.combine(workout_date, clock(rng.randint(6, 21), rng.randrange(60)))
+            workouts.append((
+                workout_id, user_id, rng.choice(WORKOUT_NAMES.get(main_category, WORKOUT_NAMES['strength'])),
+                None, workout_date, duration, calories,
+                rng.choice(NOTES) if rng.random() < 0.15 else None, logged_at, logged_at
+            ))
+            workout_id += 1
+            totals[0] += 1
+            totals[1] += calories
+            totals[2] += duration
+
+        stats = (user_id, totals[0], totals[1], totals[2], datetime.utcnow())
+        return user, stats, workouts, exercise_rows
+
+    @staticmethod
+    def performance(rng, category, load, level):
+        """(sets, reps, weight, duration_seconds, distance, calories_burned) for one exercise"""
+        if category == 'strength':
+            if load:
+                return rng.randint(3, 5), rng.choice((5, 6, 8, 10, 12)), round(load / 2.5) * 2.5, None, None, None
+            return rng.randint(3, 4), rng.randint(8, 20), None, None, None, None
+        if category == 'cardio':
+            minutes = rng.randint(5, 40)
+            distance = round(minutes * rng.uniform(0.12, 0.2) * level, 2) if rng.random() < 0.5 else None
+            return None, None, None, minutes * 60, distance, int(minutes * rng.uniform(8, 13))
+        return None, None, None, rng.randint(30, 180), None, None
+
+
+def write_chunk(connection, users, stats, workouts, exercise_rows):
+    dialect = connection.dialect
+    seq = (next_change_seq(connection),)
+    connection.exec_driver_sql(driver_insert_sql(User.__tablename__, USER_COLUMNS, dialect), users)
+    connection.exec_driver_sql(driver_insert_sql(Workout.__tablename__, WORKOUT_COLUMNS, dialect),
+                               [row + seq for row in workouts])
+    connection.exec_driver_sql(driver_insert_sql(WorkoutExercise.__tablename__, EXERCISE_COLUMNS, dialect),
+                               [row + seq for row in exercise_rows])
+    connection.exec_driver_sql(driver_insert_sql(UserStats.__tablename__, STATS_COLUMNS, dialect), stats)
+    reindex_workouts(connection, [w[0] for w in workouts])
+
+
+def next_id(connection, column):
+    return (connection.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def reset_sequences(connection):
+    # Explicit ids don't advance PostgreSQL's sequences; SQLite needs nothing
+    if connection.dialect.name != 'postgresql':
+        return
+    for table in (User.__table__, Workout.__table__, WorkoutExercise.__table__):
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table.name}))"
+        ))
+
+
+def generate(users, workouts_per_user, exercises_per_workout, days, seed, chunk_workouts):
+    rng = random.Random(seed)
+    exercises = [
+        (e.id, e.category, e.category == 'strength' and any(k in (e.equipment or '') for k in LOADED_EQUIPMENT))
+        for e in db.session.query(Exercise.id, Exercise.category, Exercise.equipment).order_by(Exercise.id)
+    ]
+    if not exercises:
+        raise SystemExit('No exercises in the catalog; run seed_db.py first')
+    generator = Generator(rng, exercises, workouts_per_user, exercises_per_workout, days,
+                          generate_password_hash('password123'))
+    db.session.commit()
+
+    started = time.perf_counter()
+    written_workouts = written_exercises = 0
+    with db.engine.connect() as connection:
+        with connection.begin():
+            user_id = next_id(connection, User.id)
+            workout_id = next_id(connection, Workout.id)
+            exercise_row_id = next_id(connection, WorkoutExercise.id)
+
+        batch = ([], [], [], [])
+        for _ in range(users):
+            user, stats, workouts, exercise_rows = generator.user(user_id, workout_id, exercise_row_id)
+            user_id += 1
+            workout_id += len(workouts)
+            exercise_row_id += len(exercise_rows)
+            batch[0].append(user)
+            batch[1].append(stats)
+            batch[2].extend(workouts)
+            batch[3].extend(exercise_rows)
+
+            if len(batch[2]) >= chunk_workouts:
+                with connection.begin():
+                    write_chunk(connection, *batch)
+                written_workouts += len(batch[2])
+                written_exercises += len(batch[3])
+                elapsed = time.perf_counter() - started
+                print(f"{written_workouts:>10} workouts {written_exercises:>10} exercises "
+                      f"{elapsed:7.1f}s  {written_workouts / elapsed:8.0f} workouts/s")
+                batch = ([], [], [], [])
+
+        with connection.begin():
+            if batch[0]:
+                write_chunk(connection, *batch)
+            reset_sequences(connection)
+        written_workouts += len(batch[2])
+        written_exercises += len(batch[3])
+
+        # Refresh planner statistics for the new table sizes
+        with connection.begin():
+            connection.execute(text('ANALYZE'))
+
+    elapsed = time.perf_counter() - started
+    print(f"Generated {users} users, {written_workouts} workouts, {written_exercises} workout exercises "
+          f"in {elapsed:.1f}s ({written_workouts / elapsed:.0f} workouts/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic users and workout history')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--workouts-per-user', type=int, default=100)
+    parser.add_argument('--exercises-per-workout', type=float, default=6, help='mean')
+    parser.add_argument('--days', type=int, default=730, help='history length')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-workouts', type=int, default=20000, help='workouts per transaction')
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        init_schema()
+        generate(args.users, args.workouts_per_user, args.exercises_per_workout, args.days,
+                 args.seed, args.chunk_workouts)
+
+
+if __name__ == '__main__':
+    main()
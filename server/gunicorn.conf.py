@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from database import database_url
+
+# Production serving profile.
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The app is imported once in the master (preload_app) and forked into workers,
+# so they share its memory and start quickly. The master applies pending schema
+# migrations before forking; each worker then drops the connection pool it
+# inherited and opens its own connections, never sharing a socket or SQLite file
+# handle with its siblings.
+#
+# Sizing (override with WEB_CONCURRENCY and GUNICORN_THREADS):
+#
+#   workers = cores + 1   the GIL runs one thread of Python per process at a
+#                         time, so a process per core uses every core; the extra
+#                         one keeps a core busy while a worker waits on a lock
+#   threads = 2 (SQLite)  one request can use the CPU while another waits on the
+#             4 (others)  database or a slow client
+#
+# SQLite has a single writer for the whole file, so every thread of every worker
+# that writes queues for the same lock, waiting up to SQLITE_BUSY_TIMEOUT_MS
+# before failing with "database is locked". Keep workers x threads x the slowest
+# write well under that timeout. More threads only lengthen the queue: with
+# 2 workers on one core and 30% writes, going from 2 threads to 4 and 8 kept
+# throughput at ~90 requests/s while p99 latency rose from 0.5s to 1.4s and 2.9s.
+# PostgreSQL takes concurrent writers, so more threads pay off there.
+#
+# benchmark_load.py measures reads across worker counts. Its only recorded run
+# (benchmarks/load.json: 10k workouts, 16 clients) is from a single CPU, where
+# extra workers just contend for the core:
+#
+#   workers   list req/s   detail req/s   list p99 ms
+#         1         81.1           81.3           192
+#         2         69.0           69.0           296
+#         4         72.8           72.8           360
+#
+# How throughput scales with cores is still unmeasured; record it with --save
+# on a machine with at least 5 cores.
+#
+# Each thread holds at most one database connection, so size the pool
+# (DB_POOL_SIZE) to at least the thread count.
+#
+# Workers write metric snapshots to METRICS_DIR (a fresh temporary directory
+# unless set) so /api/metrics can report the whole server; the master folds an
+# exited worker's counters into the directory's archive.
+#
+# Signals: HUP replaces the workers gracefully with the current config. Because
+# the app is preloaded, deploying new code needs a new master: USR2 starts one
+# next to the old, then WINCH and QUIT retire the old one once it is up.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 2 if database_url().startswith('sqlite') else 4))
+worker_class = 'gthread'
+
+preload_app = True
+
+# A request running longer than this gets its worker killed and replaced
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# Time given to in-flight requests on reload or shutdown
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't build up; jitter keeps them
+# from all restarting at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    from metrics import reset_directory
+    from migrations import init_schema
+    from wsgi import app
+
+    with app.app_context():
+        applied = init_schema()
+    if applied:
+        server.log.info("Applied migrations: %s", ', '.join(str(v) for v in applied))
+
+    if not app.config.get('METRICS_DIR'):
+        app.config['METRICS_DIR'] = tempfile.mkdtemp(prefix='fitness-metrics-')
+        app.config['METRICS_DIR_TEMPORARY'] = True
+    reset_directory(app.config['METRICS_DIR'])
+
+
+def post_fork(server, worker):
+    from database import db
+    from wsgi import app
+
+    # close=False: leave the parent's connections alone, just stop using them here
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    from metrics import archive_worker
+    from wsgi import app
+
+    archive_worker(app.config['METRICS_DIR'], worker.pid)
+
+
+def on_exit(server):
+    from wsgi import app
+
+    if app.config.get('METRICS_DIR_TEMPORARY'):
+        shutil.rmtree(app.config['METRICS_DIR'], ignore_errors=True)
@@ -0,0 +1,280 @@
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+import click
+from flask import jsonify, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import func, select, text, update
+from database import db
+from models import Job
+
+# Background jobs.
+#
+# Work too slow for a request (exports, aggregate rebuilds, backfills, large
+# imports) is queued as a row in the jobs table of the application database, so
+# there is no broker to run: the route commits the row and answers 202 with the
+# job, and the client polls /api/jobs/<id>. Job types are registered with
+# @job_type by the module that owns the work.
+#
+# Workers are separate processes (flask --app app run-jobs). A worker claims the
+# oldest runnable job of a type that is below its concurrency limit with one
+# UPDATE ... RETURNING whose WHERE clause does both the pick and the count, so
+# the limit holds across processes and machines: SQLite runs a statement as one
+# write, and on PostgreSQL claims take an advisory lock for their transaction.
+#
+# A failed attempt is retried after backoff_seconds x 2^(attempt - 1) (capped,
+# plus up to 10% jitter) until max_attempts is reached; a type whose work is not
+# safe to repeat registers with max_attempts=1. A running job's worker updates
+# heartbeat_at every HEARTBEAT_SECONDS; one that has been silent for
+# LOST_AFTER_SECONDS (the process died) counts as a failed attempt.
+
+JobType = namedtuple('JobType', ['name', 'run', 'concurrency', 'max_attempts', 'backoff_seconds'])
+# What a job function gets: payload is the decoded JSON
+ClaimedJob = namedtuple('ClaimedJob', ['id', 'type', 'user_id', 'payload', 'attempts'])
+
+JOB_TYPES = {}
+
+POLL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 10
+LOST_AFTER_SECONDS = 60
+MAX_BACKOFF_SECONDS = 3600
+DEFAULT_WORKER_PROCESSES = 2
+# pg_advisory_xact_lock key serializing claims
+CLAIM_LOCK_KEY = 0x6a6f6273
+
+
+def job_type(name, concurrency=1, max_attempts=3, backoff_seconds=30):
+    """Register the decorated function(job) -> JSON-serializable result as job type name"""
+    def register(run):
+        JOB_TYPES[name] = JobType(name, run, concurrency, max_attempts, backoff_seconds)
+        return run
+    return register
+
+
+def enqueue(type_name, payload=None, user_id=None):
+    """Add a job in the current transaction (the caller commits); raises ValueError for unknown types"""
+    spec = JOB_TYPES.get(type_name)
+    if spec is None:
+        raise ValueError(f"Unknown job type {type_name!r}")
+    job = Job(type=type_name, user_id=user_id, payload=json.dumps(payload), max_attempts=spec.max_attempts,
+              run_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+def job_accepted(job):
+    """202 response with the job, pointing the client at its status"""
+    response = jsonify({'message': 'Job queued', 'job': job.to_dict()})
+    response.status_code = 202
+    response.headers['Location'] = url_for('jobs.get_job', job_id=job.id)
+    return response
+
+
+def backoff_seconds(spec, attempts):
+    delay = min(spec.backoff_seconds * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+    return delay + random.uniform(0, delay / 10)
+
+
+_turns = itertools.count()
+
+
+def claim_job(worker):
+    """Mark the next runnable job as running by worker and return it as a ClaimedJob, or None"""
+    if not JOB_TYPES:
+        return None
+    now = datetime.utcnow()
+    table = Job.__table__
+    # Start with a different type each time, so that one busy type can't starve the rest
+    names = sorted(JOB_TYPES)
+    start = next(_turns) % len(names)
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': CLAIM_LOCK_KEY})
+        for name in names[start:] + names[:start]:
+            next_id = select(table.c.id) \
+                .where(table.c.type == name, table.c.status == 'queued', table.c.run_at <= now) \
+                .order_by(table.c.run_at, table.c.id).limit(1).scalar_subquery()
+            running = select(func.count()).select_from(table) \
+                .where(table.c.type == name, table.c.status == 'running').scalar_subquery()
+            row = connection.execute(
+                update(table).where(table.c.id == next_id, running < JOB_TYPES[name].concurrency)
+                .values(status='running', attempts=table.c.attempts + 1, started_at=now, heartbeat_at=now,
+                        worker=worker)
+                .returning(table.c.id, table.c.type, table.c.user_id, table.c.payload, table.c.attempts)
+            ).first()
+            if row is not None:
+                return ClaimedJob(row.id, row.type, row.user_id, json.loads(row.payload or 'null'), row.attempts)
+    return None
+
+
+def requeue_lost_jobs():
+    """Count a running job whose worker stopped sending heartbeats as a failed attempt; returns how many"""
+    now = datetime.utcnow()
+    table = Job.__table__
+    lost = (table.c.status == 'running') & (table.c.heartbeat_at < now - timedelta(seconds=LOST_AFTER_SECONDS))
+    error = 'Worker stopped responding'
+    with db.engine.begin() as connection:
+        retried = connection.execute(
+            update(table).where(lost, table.c.attempts < table.c.max_attempts)
+            .values(status='queued', run_at=now, error=error, heartbeat_at=None, worker=None)
+        ).rowcount
+        failed = connection.execute(
+            update(table).where(lost).values(status='failed', finished_at=now, error=error, heartbeat_at=None)
+        ).rowcount
+    return retried + failed
+
+
+class Heartbeat(threading.Thread):
+    """Keeps a running job's heartbeat_at fresh from a thread of its own"""
+    def __init__(self, engine, job_id, worker):
+        super().__init__(name=f'heartbeat-{job_id}', daemon=True)
+        self.engine = engine
+        self.job_id = job_id
+        self.worker = worker
+        self.stopped = threading.Event()
+
+    def run(self):
+        table = Job.__table__
+        while not self.stopped.wait(HEARTBEAT_SECONDS):
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(
+                        update(table).where(table.c.id == self.job_id, table.c.worker == self.worker,
+                                            table.c.status == 'running')
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+            except Exception:
+                # A busy database only delays this beat; LOST_AFTER_SECONDS allows for several
+                pass
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def _finish(job, worker, **values):
+    # Only while the claim is still ours: a job taken for lost may already run elsewhere
+    table = Job.__table__
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(table).where(table.c.id == job.id, table.c.worker == worker, table.c.status == 'running')
+            .values(heartbeat_at=None, **values)
+        )
+
+
+def run_job(job, worker):
+    """Run a claimed job and record how it went; returns True if it succeeded"""
+    spec = JOB_TYPES[job.type]
+    heartbeat = Heartbeat(db.engine, job.id, worker)
+    heartbeat.start()
+    started = time.perf_counter()
+    try:
+        result = spec.run(job)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        now = datetime.utcnow()
+        if job.attempts < spec.max_attempts:
+            delay = backoff_seconds(spec, job.attempts)
+            _finish(job, worker, status='queued', error=str(e), run_at=now + timedelta(seconds=delay))
+            outcome = f'failed, retry in {delay:.0f}s'
+        else:
+            _finish(job, worker, status='failed', error=str(e), finished_at=now)
+            outcome = 'failed'
+        click.echo(f"{worker} job {job.id} ({job.type}) attempt {job.attempts} {outcome}: {e}")
+        return False
+    finally:
+        heartbeat.stop()
+        db.session.remove()
+    _finish(job, worker, status='succeeded', result=json.dumps(result), error=None, finished_at=datetime.utcnow())
+    click.echo(f"{worker} job {job.id} ({job.type}) succeeded in {time.perf_counter() - started:.1f}s")
+    return True
+
+
+def work(worker, signals=(), once=False):
+    """Claim and run jobs until signals gets one, or with once until none is runnable; returns how many ran"""
+    ran = 0
+    checked_at = None
+    while not signals:
+        if checked_at is None or time.monotonic() - checked_at >= HEARTBEAT_SECONDS:
+            requeue_lost_jobs()
+            checked_at = time.monotonic()
+        job = claim_job(worker)
+        if job is None:
+            if once:
+                break
+            time.sleep(POLL_SECONDS)
+            continue
+        run_job(job, worker)
+        ran += 1
+    return ran
+
+
+def _note_signals(*signums):
+    """List that signal handlers append to, for loops to check between jobs"""
+    # Handlers only note the signal: anything taking a lock could deadlock
+    # with the code they interrupt
+    signals = []
+    for signum in signums:
+        signal.signal(signum, lambda signum, frame: signals.append(signum))
+    return signals
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _worker_process():
+    from app import create_app
+    # Ctrl-C reaches the whole process group; the supervisor passes it on as SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signals = _note_signals(signal.SIGTERM)
+    with create_app().app_context():
+        work(worker_name(), signals)
+
+
+def run_pool(processes):
+    """Keep processes worker processes running until SIGINT or SIGTERM, then let them finish their jobs"""
+    # Spawned, not forked: every worker opens its own connections. Stopping is
+    # by signal rather than a shared Event, whose lock a killed worker can leave held
+    context = multiprocessing.get_context('spawn')
+    signals = _note_signals(signal.SIGINT, signal.SIGTERM)
+
+    workers = [None] * processes
+    while not signals:
+        for i, process in enumerate(workers):
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                click.echo(f"Job worker {process.pid} exited with {process.exitcode}, restarting")
+            workers[i] = context.Process(target=_worker_process, name=f'job-worker-{i}')
+            workers[i].start()
+        time.sleep(POLL_SECONDS)
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join()
+
+
+@click.command('run-jobs')
+@click.option('--processes', type=int, default=lambda: int(os.environ.get('JOB_WORKERS', DEFAULT_WORKER_PROCESSES)),
+              show_default=f'JOB_WORKERS or {DEFAULT_WORKER_PROCESSES}', help='worker processes')
+@click.option('--once', is_flag=True, help='run the jobs that are runnable now in this process, then exit')
+@with_appcontext
+def run_jobs_command(processes, once):
+    """Run queued background jobs."""
+    if once:
+        ran = work(worker_name(), once=True)
+        click.echo(f"Ran {ran} jobs")
+        return
+    click.echo(f"Starting {processes} job workers for: {', '.join(sorted(JOB_TYPES))}")
+    run_pool(processes)
@@ -0,0 +1,235 @@
+import threading
+from collections import defaultdict, namedtuple
+from datetime import datetime, timezone
+from calories import estimate_workout
+from database import db, driver_insert_sql
+from loading import workout_options
+from models import Workout, WorkoutExercise, WorkoutSession, WorkoutSessionEvent
+from stats import record_workout_change
+
+# Live workout sessions.
+#
+# While a workout is in progress the client posts what happens (start, pause,
+# resume, set_completed, rest) as events, numbered by the client with seq. They
+# are only ever appended to workout_session_events: no updates to the workout,
+# nothing to recover; the only read checks that sets name exercises of the
+# session's workout. Appends are idempotent on (session_id, seq), so a client can
+# re-send a batch it got no answer for.
+#
+# Appends from concurrent requests in a process are group-committed: a request
+# queues its rows and waits for the write lock; whoever holds it writes every
+# queued row in one transaction, so a burst of events costs one commit, while an
+# append on an idle server is written straight away.
+#
+# Finalizing folds the log into the workout: active time (start/resume to pause
+# or the end) becomes duration_minutes, and each exercise with a logged set gets
+# its completed sets and the reps and weight of its heaviest set. Exercises
+# without one are left as planned, since not logging a set doesn't mean it wasn't
+# done. Calories the client never sent are then estimated (see calories.py). The
+# same fold gives a client that reloaded mid-workout its place back.
+
+EVENT_TYPES = ('start', 'pause', 'resume', 'set_completed', 'rest')
+MAX_EVENTS_PER_REQUEST = 500
+
+EVENT_COLUMNS = ('session_id', 'seq', 'type', 'at', 'workout_exercise_id', 'reps', 'weight', 'duration_seconds')
+
+# running: the clock was going at the last event; sets: workout_exercise_id ->
+# [(reps, weight, duration_seconds)] in the order they were completed
+SessionFold = namedtuple('SessionFold', ['last_seq', 'running', 'active_seconds', 'rest_seconds', 'sets'])
+
+
+def parse_time(value):
+    """ISO 8601 timestamp as naive UTC"""
+    if not isinstance(value, str):
+        raise ValueError("'at' must be an ISO 8601 timestamp")
+    try:
+        at = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError("'at' must be an ISO 8601 timestamp")
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    return at
+
+
+def _number(event, key, kind):
+    value = event.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float) if kind is float else int) or value < 0:
+        raise ValueError(f"'{key}' must be a non-negative {'number' if kind is float else 'integer'}")
+    return kind(value)
+
+
+def workout_exercise_ids(session):
+    """Ids sets can be logged against: the exercises of the session's workout"""
+    return {row.id for row in db.session.query(WorkoutExercise.id).filter_by(workout_id=session.workout_id)}
+
+
+def parse_events(session_id, items, exercise_ids):
+    """Validate posted events against exercise_ids; returns insert rows in EVENT_COLUMNS order or raises ValueError"""
+    if not isinstance(items, list) or not items:
+        raise ValueError('Expected a non-empty list of events')
+    if len(items) > MAX_EVENTS_PER_REQUEST:
+        raise ValueError(f'At most {MAX_EVENTS_PER_REQUEST} events per request')
+
+    rows = []
+    for i, event in enumerate(items):
+        try:
+            if not isinstance(event, dict):
+                raise ValueError('Event must be a JSON object')
+            seq = event.get('seq')
+            if isinstance(seq, bool) or not isinstance(seq, int) or seq < 1:
+                raise ValueError("'seq' must be a positive integer")
+            if event.get('type') not in EVENT_TYPES:
+                raise ValueError(f"'type' must be one of: {', '.join(EVENT_TYPES)}")
+            workout_exercise_id = _number(event, 'workout_exercise_id', int)
+            if event['type'] == 'set_completed' and workout_exercise_id is None:
+                raise ValueError("'workout_exercise_id' is required for set_completed")
+            if workout_exercise_id is not None and workout_exercise_id not in exercise_ids:
+                raise ValueError(f"'workout_exercise_id' {workout_exercise_id} is not an exercise of this workout")
+            rows.append((
+                session_id, seq, event['type'], parse_time(event.get('at')), workout_exercise_id,
+                _number(event, 'reps', int), _number(event, 'weight', float), _number(event, 'duration_seconds', int)
+            ))
+        except ValueError as e:
+            raise ValueError(f'events[{i}]: {e}')
+    return rows
+
+
+class _Append:
+    __slots__ = ('rows', 'done', 'error')
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = False
+        self.error = None
+
+
+class EventLog:
+    """Group-committing appender for session events, one per process"""
+
+    def __init__(self):
+        self._queue = []
+        self._lock = threading.Lock()  # guards _queue
+        self._write_lock = threading.Lock()  # one writing transaction at a time
+
+    def append(self, rows):
+        """Durably append rows, possibly in the same commit as other requests' rows"""
+        entry = _Append(rows)
+        with self._lock:
+            self._queue.append(entry)
+        with self._write_lock:
+            if not entry.done:
+                with self._lock:
+                    batch, self._queue = self._queue, []
+                self._write(batch)
+        if entry.error is not None:
+            raise entry.error
+
+    def _write(self, batch):
+        try:
+            self._insert([row for entry in batch for row in entry.rows])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+            else:
+                # Don't fail everyone for one bad append: retry them one by one
+                for entry in batch:
+                    try:
+                        self._insert(entry.rows)
+                    except Exception as entry_error:
+                        entry.error = entry_error
+        for entry in batch:
+            entry.done = True
+
+    def _insert(self, rows):
+        with db.engine.begin() as connection:
+            sql = driver_insert_sql(WorkoutSessionEvent.__tablename__, EVENT_COLUMNS, connection.dialect)
+            connection.exec_driver_sql(f'{sql} ON CONFLICT DO NOTHING', rows)
+
+
+event_log = EventLog()
+
+
+def session_events(session_id):
+    return WorkoutSessionEvent.query.filter_by(session_id=session_id).order_by(WorkoutSessionEvent.seq).all()
+
+
+def fold_events(events, ended_at=None):
+    """Replay events in seq order; a clock still running is stopped at ended_at, if given"""
+    running_since = None
+    active = 0.0
+    rest = 0
+    sets = defaultdict(list)
+    last_seq = 0
+    for event in events:
+        last_seq = event.seq
+        if event.type in ('start', 'resume'):
+            if running_since is None:
+                running_since = event.at
+        elif event.type == 'pause':
+            if running_since is not None:
+                active += max((event.at - running_since).total_seconds(), 0)
+                running_since = None
+        elif event.type == 'set_completed':
+            sets[event.workout_exercise_id].append((event.reps, event.weight, event.duration_seconds))
+        elif event.type == 'rest':
+            rest += event.duration_seconds or 0
+    if running_since is not None and ended_at is not None:
+        active += max((ended_at - running_since).total_seconds(), 0)
+    return SessionFold(last_seq, running_since is not None, int(active + 0.5), rest, dict(sets))
+
+
+def session_state(session):
+    """Where a session stands, for a client picking it up again"""
+    events = session_events(session.id)
+    active = session.status == 'active'
+    fold = fold_events(events, datetime.utcnow() if active else None)
+    return {
+        'session': session.to_dict(),
+        'last_seq': fold.last_seq,
+        'running': fold.running and active,
+        'active_seconds': fold.active_seconds if active else session.active_seconds,
+        'rest_seconds': fold.rest_seconds,
+        'exercises': [
+            {'workout_exercise_id': workout_exercise_id, 'sets_completed': len(sets)}
+            for workout_exercise_id, sets in sorted(fold.sets.items())
+        ]
+    }
+
+
+def finalize_session(session, ended_at=None):
+    """Fold the session's log into its workout and close it; returns the workout"""
+    events = session_events(session.id)
+    if ended_at is None:
+        ended_at = events[-1].at if events else datetime.utcnow()
+    fold = fold_events(events, ended_at)
+
+    workout = Workout.query.options(*workout_options()).filter_by(id=session.workout_id).one()
+    old_calories = workout.calories_burned or 0
+    old_duration = workout.duration_minutes or 0
+    workout.duration_minutes = int(fold.active_seconds / 60 + 0.5)
+
+    for workout_exercise in workout.workout_exercises:
+        sets = fold.sets.get(workout_exercise.id)
+        if not sets:
+            continue
+        reps, weight, _ = max(sets, key=lambda s: (s[1] or 0, s[0] or 0))
+        workout_exercise.sets = len(sets)
+        workout_exercise.reps = reps
+        workout_exercise.weight = weight
+        durations = [s[2] for s in sets if s[2]]
+        if durations:
+            workout_exercise.duration_seconds = sum(durations)
+    if workout.calories_burned is None or workout.calories_estimated:
+        estimate_workout(workout)
+
+    db.session.flush()
+    record_workout_change(workout.user_id, calories=(workout.calories_burned or 0) - old_calories,
+                          duration_minutes=workout.duration_minutes - old_duration)
+
+    session.status = 'finalized'
+    session.finalized_at = datetime.utcnow()
+    session.active_seconds = fold.active_seconds
+    session.rest_seconds = fold.rest_seconds
+    return workout
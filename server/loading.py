@@ -0,0 +1,29 @@
+from sqlalchemy.orm import selectinload, joinedload
+from models import Exercise, Workout, WorkoutExercise, WorkoutTemplate, WorkoutTemplateExercise
+
+# Loader options for the read endpoints.
+#
+# Workout.to_dict() and WorkoutTemplate.to_dict() walk their child collections and
+# each child reads from its exercise, so with the default lazy loading a list of N
+# workouts costs 1 + N + N*M queries. These options fetch each collection with a
+# single SELECT ... WHERE parent_id IN (...) and join the exercise columns the
+# serializers need into that same statement, which keeps the number of queries per
+# request constant regardless of how many rows come back.
+
+
+def workout_options():
+    """Eager-load everything Workout.to_dict() touches"""
+    return (
+        selectinload(Workout.workout_exercises)
+        .joinedload(WorkoutExercise.exercise)
+        .load_only(Exercise.name),
+    )
+
+
+def template_options():
+    """Eager-load everything WorkoutTemplate.to_dict() touches"""
+    return (
+        selectinload(WorkoutTemplate.template_exercises)
+        .joinedload(WorkoutTemplateExercise.exercise)
+        .load_only(Exercise.name, Exercise.description, Exercise.instructions),
+    )
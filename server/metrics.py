@@ -0,0 +1,364 @@
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import request
+from sqlalchemy import event
+from database import db, pool_status
+
+# Request metrics in Prometheus text format, served at /api/metrics.
+#
+# RequestMetrics wraps the WSGI app, so each request is timed from the moment the
+# server hands it over until the last byte of its body has gone out (streamed
+# exports and NDJSON included), and its body bytes are counted as they are sent.
+# Cursor hooks on the engine count and time SQL statements and charge them to the
+# request running on the same thread. The cost per request is a few dict updates
+# under one lock.
+#
+# Every process counts on its own. With METRICS_DIR set (gunicorn.conf.py sets one
+# up per master) a background thread in each worker also writes a snapshot of its
+# counts there every METRICS_FLUSH_SECONDS, and a scrape sums the snapshots of all
+# workers, so it sees the whole server whichever worker answers it. When a worker exits its
+# counters are folded into ARCHIVE_FILE; gauges only include live workers.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_FLUSH_SECONDS = 1.0
+ARCHIVE_FILE = 'archive.json'
+ARCHIVE_KEEP_MERGED = 100
+ENDPOINT_KEY = 'metrics.endpoint'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name -> (type, label names, help)
+METRICS = {
+    'http_requests_total': ('counter', ('method', 'endpoint', 'status'), 'Requests handled'),
+    'http_request_duration_seconds': ('histogram', ('method', 'endpoint'),
+                                      'Time from receiving a request to sending the last byte of its response'),
+    'http_response_bytes_total': ('counter', ('method', 'endpoint'), 'Response body bytes sent'),
+    'db_queries_total': ('counter', ('method', 'endpoint'), 'SQL statements executed while handling requests'),
+    'db_query_duration_seconds_total': ('counter', ('method', 'endpoint'),
+                                        'Time spent in SQL statements while handling requests'),
+    'http_requests_in_flight': ('gauge', (), 'Requests being handled'),
+    'db_pool_size': ('gauge', (), 'Connections the database pools keep open'),
+    'db_pool_checked_out': ('gauge', (), 'Database connections in use'),
+}
+
+_local = threading.local()
+
+
+class _Request:
+    __slots__ = ('status', 'bytes', 'queries', 'sql_seconds', 'finished')
+
+    def __init__(self):
+        self.status = '500'
+        self.bytes = 0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.finished = False
+
+
+class _Body:
+    """Response iterable that counts bytes and reports the request when done"""
+
+    def __init__(self, iterable, record, finish):
+        self._iterable = iterable
+        self._record = record
+        self._finish = finish
+
+    def __iter__(self):
+        record = self._record
+        for chunk in self._iterable:
+            record.bytes += len(chunk)
+            yield chunk
+        self._finish()
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._finish()
+
+
+class RequestMetrics:
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._owner = None
+        self._flusher_pid = None
+        self._written = None
+        self.counters = {name: {} for name, (kind, _, _) in METRICS.items() if kind == 'counter'}
+        self.durations = {}  # (method, endpoint) -> bucket counts, then +Inf, then sum
+        self.in_flight = 0
+
+        with app.app_context():
+            self.engine = db.engine
+        event.listen(self.engine, 'before_cursor_execute', _start_statement)
+        event.listen(self.engine, 'after_cursor_execute', _end_statement)
+        app.before_request(_label_endpoint)
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        record = _local.request = _Request()
+        with self._lock:
+            self.in_flight += 1
+        if self._flusher_pid != os.getpid() and self.app.config.get('METRICS_DIR'):
+            self._start_flusher()
+
+        def capture_status(status, headers, exc_info=None):
+            record.status = status.split(' ', 1)[0]
+            return start_response(status, headers, exc_info)
+
+        def finish():
+            if not record.finished:
+                record.finished = True
+                self._observe(environ, record, time.perf_counter() - started)
+
+        try:
+            return _Body(self.wsgi_app(environ, capture_status), record, finish)
+        except BaseException:
+            finish()
+            raise
+
+    def _observe(self, environ, record, elapsed):
+        method = environ.get('REQUEST_METHOD', '')
+        key = (method, environ.get(ENDPOINT_KEY) or 'unmatched')
+        counters = self.counters
+        with self._lock:
+            self.in_flight -= 1
+            _add(counters['http_requests_total'], key + (record.status,), 1)
+            _add(counters['http_response_bytes_total'], key, record.bytes)
+            _add(counters['db_queries_total'], key, record.queries)
+            _add(counters['db_query_duration_seconds_total'], key, record.sql_seconds)
+            histogram = self.durations.get(key)
+            if histogram is None:
+                histogram = self.durations[key] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+            histogram[bisect_left(DURATION_BUCKETS, elapsed)] += 1
+            histogram[-1] += elapsed
+
+    def _start_flusher(self):
+        # Once per process: threads don't survive a fork, so each worker starts its own
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        interval = self.app.config.get('METRICS_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.flush()
+
+        threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+    def snapshot(self):
+        """This process's metrics as a JSON-serializable dict"""
+        pool = pool_status(self.engine, self.app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'counters': {name: [list(labels) + [value] for labels, value in series.items()]
+                             for name, series in self.counters.items()},
+                'histograms': {'http_request_duration_seconds': [list(labels) + [list(counts)]
+                                                                 for labels, counts in self.durations.items()]},
+                'gauges': {
+                    'http_requests_in_flight': self.in_flight,
+                    'db_pool_size': pool['size'] if pool else 0,
+                    'db_pool_checked_out': pool['checked_out'] if pool else 0,
+                },
+            }
+
+    def _snapshot_path(self, directory):
+        pid = os.getpid()
+        if self._owner is None or self._owner[0] != pid:
+            self._owner = (pid, f'{pid}-{time.time_ns()}.json')
+        return os.path.join(directory, self._owner[1])
+
+    def flush(self):
+        """Write this process's snapshot to METRICS_DIR, unless another thread is at it"""
+        directory = self.app.config.get('METRICS_DIR')
+        if not directory or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            data = json.dumps(self.snapshot(), separators=(',', ':'))
+            if data != self._written:  # an idle worker's file stays as it is
+                _write(self._snapshot_path(directory), data)
+                self._written = data
+        finally:
+            self._flush_lock.release()
+
+    def render(self):
+        """All processes' metrics in Prometheus text format"""
+        directory = self.app.config.get('METRICS_DIR')
+        if not directory:
+            return render([self.snapshot()])
+        self.flush()
+        return render(read_snapshots(directory))
+
+
+def _add(series, key, value):
+    series[key] = series.get(key, 0) + value
+
+
+def _label_endpoint():
+    # Route name rather than path, so ids don't each get their own series
+    request.environ[ENDPOINT_KEY] = request.endpoint
+
+
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    record = getattr(_local, 'request', None)
+    started = getattr(context, '_metrics_started', None)
+    if record is not None and not record.finished and started is not None:
+        record.queries += 1
+        record.sql_seconds += time.perf_counter() - started
+
+
+def init_metrics(app):
+    """Wrap the app in RequestMetrics; returns the instance, also in app.extensions['metrics']"""
+    metrics = RequestMetrics(app)
+    app.wsgi_app = metrics
+    app.extensions['metrics'] = metrics
+    return metrics
+
+
+def _write(path, data):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_snapshots(directory):
+    """Snapshots of the workers, plus the archive of exited ones"""
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, '*-*.json')):
+        snapshot = _read_json(path)
+        if snapshot is not None:
+            snapshot['file'] = os.path.basename(path)
+            snapshots.append(snapshot)
+
+    # Read after the workers' files: a file folded in meanwhile is listed as merged
+    archive = _read_json(os.path.join(directory, ARCHIVE_FILE))
+    if archive is None:
+        return snapshots
+    merged = set(archive.get('merged', ()))
+    return [s for s in snapshots if s['file'] not in merged] + [archive]
+
+
+def reset_directory(directory):
+    """Remove snapshots left over from an earlier server"""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def archive_worker(directory, pid):
+    """Fold an exited worker's counters into the archive and remove its snapshot"""
+    paths = glob.glob(os.path.join(directory, f'{pid}-*.json'))
+    if not paths:
+        return
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    archive = _read_json(archive_path) or {'counters': {}, 'histograms': {}, 'merged': []}
+    for path in paths:
+        snapshot = _read_json(path)
+        if snapshot is not None:
+            archive = _merge([archive, snapshot], gauges=False)
+        archive['merged'] = (archive.get('merged', []) + [os.path.basename(path)])[-ARCHIVE_KEEP_MERGED:]
+    _write(archive_path, json.dumps(archive, separators=(',', ':')))
+    for path in paths:
+        os.remove(path)
+
+
+def _merge(snapshots, gauges=True):
+    counters = {}
+    histograms = {}
+    totals = {}
+    for snapshot in snapshots:
+        for name, series in snapshot.get('counters', {}).items():
+            merged = counters.setdefault(name, {})
+            for *labels, value in series:
+                merged[tuple(labels)] = merged.get(tuple(labels), 0) + value
+        for name, series in snapshot.get('histograms', {}).items():
+            merged = histograms.setdefault(name, {})
+            for *labels, counts in series:
+                existing = merged.get(tuple(labels))
+                merged[tuple(labels)] = [a + b for a, b in zip(existing, counts)] if existing else list(counts)
+        if gauges and 'pid' in snapshot and _alive(snapshot['pid']):
+            for name, value in snapshot.get('gauges', {}).items():
+                totals[name] = totals.get(name, 0) + value
+
+    result = {
+        'counters': {name: [list(labels) + [value] for labels, value in series.items()]
+                     for name, series in counters.items()},
+        'histograms': {name: [list(labels) + [counts] for labels, counts in series.items()]
+                       for name, series in histograms.items()},
+        'merged': [f for s in snapshots for f in s.get('merged', ())],
+    }
+    if gauges:
+        result['gauges'] = totals
+    return result
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshots):
+    """Prometheus text exposition of the summed snapshots"""
+    merged = _merge(snapshots)
+    lines = []
+    for name, (kind, label_names, description) in METRICS.items():
+        lines.append(f'# HELP {name} {description}.')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'gauge':
+            lines.append(f"{name} {_number(merged['gauges'].get(name, 0))}")
+        elif kind == 'counter':
+            for *labels, value in sorted(merged['counters'].get(name, ()), key=lambda s: s[:-1]):
+                lines.append(f'{name}{_labels(label_names, labels)} {_number(value)}')
+        else:
+            for *labels, counts in sorted(merged['histograms'].get(name, ()), key=lambda s: s[:-1]):
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + ('+Inf',), counts):
+                    cumulative += count
+                    bucket = _labels(label_names, labels, 'le="%s"' % bound)
+                    lines.append(f'{name}_bucket{bucket} {cumulative}')
+                lines.append(f'{name}_sum{_labels(label_names, labels)} {_number(float(counts[-1]))}')
+                lines.append(f'{name}_count{_labels(label_names, labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,130 @@
+import click
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text
+from database import db
+from models import SchemaMigration
+from tags import backfill_tags
+from search import create_search_index, drop_insert_triggers
+
+# Versioned schema migrations.
+#
+# db.create_all() only creates tables that don't exist yet, so anything that has
+# to change an existing database (indexes, new columns, backfills) goes here as a
+# numbered migration. Each step is either a SQL string or a callable taking the
+# connection. A migration and its schema_migrations row commit together, but
+# steps must still be idempotent (IF NOT EXISTS and friends): SQLite's DDL is
+# transactional, yet Python's sqlite3 driver only opens a transaction at the
+# first INSERT/UPDATE/DELETE, so DDL ahead of that commits on its own. A
+# migration that fails halfway can leave such steps behind and is re-run from
+# the top next time.
+
+
+def add_column(table, column, ddl):
+    """Migration step adding a column unless create_all() already made it"""
+    def step(connection):
+        if column not in {c['name'] for c in inspect(connection).get_columns(table)}:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    return step
+
+
+MIGRATIONS = [
+    (1, 'Indexes on hot foreign keys', [
+        'CREATE INDEX IF NOT EXISTS ix_workouts_user_id_date ON workouts (user_id, date DESC)',
+        'CREATE INDEX IF NOT EXISTS ix_workout_exercises_workout_id_order ON workout_exercises (workout_id, order_in_workout)',
+        'CREATE INDEX IF NOT EXISTS ix_workout_exercises_exercise_id ON workout_exercises (exercise_id)',
+        'CREATE INDEX IF NOT EXISTS ix_workout_template_exercises_template_id ON workout_template_exercises (template_id, order_in_template)',
+    ]),
+    (2, 'Backfill muscle group and equipment tags', [
+        backfill_tags,
+    ]),
+    (3, 'Catalog version row', [
+        'INSERT INTO catalog_state (id, version) SELECT 1, 1 WHERE NOT EXISTS (SELECT 1 FROM catalog_state WHERE id = 1)',
+    ]),
+    (4, 'updated_at columns for HTTP validators', [
+        add_column('users', 'updated_at', 'DATETIME'),
+        add_column('workouts', 'updated_at', 'DATETIME'),
+        add_column('exercises', 'updated_at', 'DATETIME'),
+        add_column('workout_templates', 'updated_at', 'DATETIME'),
+        'UPDATE users SET updated_at = created_at WHERE updated_at IS NULL',
+        'UPDATE workouts SET updated_at = created_at WHERE updated_at IS NULL',
+        'UPDATE exercises SET updated_at = created_at WHERE updated_at IS NULL',
+        'UPDATE workout_templates SET updated_at = created_at WHERE updated_at IS NULL',
+        'CREATE INDEX IF NOT EXISTS ix_workouts_user_id_updated_at ON workouts (user_id, updated_at)',
+    ]),
+    (5, 'Full-text search index over workouts', [
+        create_search_index,
+    ]),
+    (6, 'Index new workouts from the write path instead of per-row triggers', [
+        drop_insert_triggers,
+    ]),
+    (7, 'Change sequence numbers for delta sync', [
+        add_column('workouts', 'change_seq', 'INTEGER'),
+        add_column('workout_exercises', 'change_seq', 'INTEGER'),
+        add_column('exercises', 'change_seq', 'INTEGER'),
+        add_column('workout_templates', 'change_seq', 'INTEGER'),
+        add_column('workout_template_exercises', 'change_seq', 'INTEGER'),
+        'CREATE INDEX IF NOT EXISTS ix_workouts_user_id_change_seq ON workouts (user_id, change_seq)',
+        'INSERT INTO sync_state (id, seq) SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM sync_state WHERE id = 1)',
+    ]),
+    (8, 'Mark estimated calories', [
+        add_column('workouts', 'calories_estimated', 'BOOLEAN'),
+        add_column('workout_exercises', 'calories_estimated', 'BOOLEAN'),
+    ]),
+    # Partial: rows from before migration 7 have no change_seq and only come with a full sync
+    (9, 'Index catalog change sequence numbers for delta sync', [
+        'CREATE INDEX IF NOT EXISTS ix_exercises_change_seq ON exercises (change_seq) WHERE change_seq IS NOT NULL',
+        'CREATE INDEX IF NOT EXISTS ix_workout_templates_change_seq ON workout_templates (change_seq) '
+        'WHERE change_seq IS NOT NULL',
+        'CREATE INDEX IF NOT EXISTS ix_workout_template_exercises_change_seq ON workout_template_exercises (change_seq) '
+        'WHERE change_seq IS NOT NULL',
+    ]),
+    (10, 'Index running jobs by heartbeat for the lost job check', [
+        'CREATE INDEX IF NOT EXISTS ix_jobs_heartbeat_at ON jobs (heartbeat_at)',
+    ]),
+]
+
+
+def applied_versions():
+    """Return the set of migration versions already applied"""
+    return {row.version for row in SchemaMigration.query.all()}
+
+
+def upgrade():
+    """Apply every pending migration in order, returning the versions applied"""
+    done = applied_versions()
+    applied = []
+
+    for version, description, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            continue
+
+        connection = db.session.connection()
+        for step in steps:
+            if callable(step):
+                step(connection)
+            else:
+                connection.execute(text(step))
+
+        db.session.add(SchemaMigration(version=version, description=description, applied_at=datetime.utcnow()))
+        db.session.commit()
+        applied.append(version)
+
+    return applied
+
+
+def init_schema():
+    """Create missing tables and bring the schema up to the latest version"""
+    db.create_all()
+    return upgrade()
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create missing tables and apply pending migrations."""
+    applied = init_schema()
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        click.echo('Schema is up to date')
@@ -1,3 +1,4 @@
+import json
 from database import db
 from datetime import datetime
 
@@ -15,6 +16,7 @@ class User(db.Model):
     height = db.Column(db.Float)
     fitness_goal = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     workouts = db.relationship('Workout', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -33,6 +35,50 @@ class User(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class UserStats(db.Model):
+    __tablename__ = 'user_stats'
+    
+    # One row per user, kept up to date by the workout write routes (see stats.py)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_workouts = db.Column(db.Integer, nullable=False, default=0)
+    total_calories = db.Column(db.Integer, nullable=False, default=0)
+    total_duration_minutes = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'total_workouts': self.total_workouts,
+            'total_calories': self.total_calories,
+            'total_duration_minutes': self.total_duration_minutes,
+            'avg_duration_minutes': int(self.total_duration_minutes / self.total_workouts + 0.5) if self.total_workouts else 0
+        }
+
+# Normalized tags behind the comma-separated muscle group and equipment columns.
+# The string columns stay the source of truth for to_dict(); tags.py keeps these
+# tables in sync on flush so filters can use an index instead of LIKE '%x%'.
+exercise_tags = db.Table(
+    'exercise_tags',
+    db.Column('exercise_id', db.Integer, db.ForeignKey('exercises.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True),
+    db.Index('ix_exercise_tags_tag_id', 'tag_id', 'exercise_id')
+)
+
+template_tags = db.Table(
+    'template_tags',
+    db.Column('template_id', db.Integer, db.ForeignKey('workout_templates.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True),
+    db.Index('ix_template_tags_tag_id', 'tag_id', 'template_id')
+)
+
+class Tag(db.Model):
+    __tablename__ = 'tags'
+    __table_args__ = (db.UniqueConstraint('kind', 'name', name='uq_tags_kind_name'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # muscle_group, equipment
+    name = db.Column(db.String(100), nullable=False)  # lower-cased, trimmed
+
 class Exercise(db.Model):
     __tablename__ = 'exercises'
     
@@ -45,10 +91,13 @@ class Exercise(db.Model):
     difficulty_level = db.Column(db.String(20))  # beginner, intermediate, advanced
     instructions = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = db.Column(db.Integer)  # last change, see sync.py
     
     # Relationships
     workout_exercises = db.relationship('WorkoutExercise', backref='exercise', lazy=True)
     template_exercises = db.relationship('WorkoutTemplateExercise', backref='exercise', lazy=True)
+    tags = db.relationship('Tag', secondary=exercise_tags, lazy=True)
     
     def to_dict(self):
         return {
@@ -73,11 +122,15 @@ class Workout(db.Model):
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     duration_minutes = db.Column(db.Integer)  # total workout duration
     calories_burned = db.Column(db.Integer)
+    calories_estimated = db.Column(db.Boolean)  # calories_burned is ours, see calories.py
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = db.Column(db.Integer)  # last change, see sync.py
     
     # Relationships
-    workout_exercises = db.relationship('WorkoutExercise', backref='workout', lazy=True, cascade='all, delete-orphan')
+    workout_exercises = db.relationship('WorkoutExercise', backref='workout', lazy=True, cascade='all, delete-orphan',
+                                        order_by='[WorkoutExercise.workout_id, WorkoutExercise.id]')
     
     def to_dict(self):
         return {
@@ -105,8 +158,10 @@ class WorkoutExercise(db.Model):
     duration_seconds = db.Column(db.Integer)  # for cardio exercises
     distance = db.Column(db.Float)  # for running/cycling in km
     calories_burned = db.Column(db.Integer)
+    calories_estimated = db.Column(db.Boolean)  # calories_burned is ours, see calories.py
     notes = db.Column(db.Text)
     order_in_workout = db.Column(db.Integer, default=1)
+    change_seq = db.Column(db.Integer)  # last change, see sync.py
     
     def to_dict(self):
         return {
@@ -138,9 +193,13 @@ class WorkoutTemplate(db.Model):
     equipment_needed = db.Column(db.String(200))  # comma-separated list
     target_muscle_groups = db.Column(db.String(200))  # comma-separated list
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = db.Column(db.Integer)  # last change, see sync.py
     
     # Relationships
-    template_exercises = db.relationship('WorkoutTemplateExercise', backref='template', lazy=True, cascade='all, delete-orphan')
+    template_exercises = db.relationship('WorkoutTemplateExercise', backref='template', lazy=True, cascade='all, delete-orphan',
+                                         order_by='[WorkoutTemplateExercise.template_id, WorkoutTemplateExercise.id]')
+    tags = db.relationship('Tag', secondary=template_tags, lazy=True)
     
     def to_dict(self):
         return {
@@ -170,6 +229,7 @@ class WorkoutTemplateExercise(db.Model):
     duration_seconds = db.Column(db.Integer)  # for timed exercises
     rest_seconds = db.Column(db.Integer, default=60)  # rest time after this exercise
     notes = db.Column(db.String(200))  # special instructions for this exercise in template
+    change_seq = db.Column(db.Integer)  # last change, see sync.py
     
     def to_dict(self):
         return {
@@ -185,4 +245,165 @@ class WorkoutTemplateExercise(db.Model):
             'duration_seconds': self.duration_seconds,
             'rest_seconds': self.rest_seconds,
             'notes': self.notes
-        }
\ No newline at end of file
+        }
+
+class ExerciseProgress(db.Model):
+    __tablename__ = 'exercise_progress'
+    __table_args__ = (
+        db.Index('ix_exercise_progress_workout_id', 'workout_id'),
+        {'sqlite_with_rowid': False}
+    )
+    
+    # One row per workout x rep-based exercise, derived from workout_exercises by
+    # progress.py. No foreign key to workouts: rows are re-derived after a workout
+    # is deleted, in the same flush.
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercises.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    workout_id = db.Column(db.Integer, primary_key=True)
+    sets = db.Column(db.Integer, nullable=False)
+    reps = db.Column(db.Integer, nullable=False)  # total over all sets
+    volume = db.Column(db.Float, nullable=False)  # sets x reps x weight, in kg
+    best_weight = db.Column(db.Float, nullable=False)
+    best_reps = db.Column(db.Integer, nullable=False)
+    e1rm_epley = db.Column(db.Float, nullable=False)
+    e1rm_brzycki = db.Column(db.Float)  # undefined past 36 reps
+
+class ProgressState(db.Model):
+    __tablename__ = 'progress_state'
+    
+    # One row per user whose exercise_progress has been built from their history
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    built_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class WorkoutSession(db.Model):
+    __tablename__ = 'workout_sessions'
+    
+    # A live run through a workout, recorded as an event log and folded into the
+    # workout when it is finalized (see live_sessions.py)
+    id = db.Column(db.Integer, primary_key=True)
+    workout_id = db.Column(db.Integer, db.ForeignKey('workouts.id'), nullable=False, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='active')  # active, finalized
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finalized_at = db.Column(db.DateTime)
+    active_seconds = db.Column(db.Integer)  # set on finalize
+    rest_seconds = db.Column(db.Integer)
+    
+    # Relationships
+    workout = db.relationship('Workout', backref=db.backref('sessions', lazy=True, cascade='all, delete-orphan'))
+    events = db.relationship('WorkoutSessionEvent', lazy=True, cascade='all, delete-orphan')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'workout_id': self.workout_id,
+            'user_id': self.user_id,
+            'status': self.status,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finalized_at': self.finalized_at.isoformat() if self.finalized_at else None,
+            'active_seconds': self.active_seconds,
+            'rest_seconds': self.rest_seconds
+        }
+
+class WorkoutSessionEvent(db.Model):
+    __tablename__ = 'workout_session_events'
+    __table_args__ = {'sqlite_with_rowid': False}
+    
+    # Append-only; seq is numbered by the client, so a retried batch is a no-op
+    session_id = db.Column(db.Integer, db.ForeignKey('workout_sessions.id'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(20), nullable=False)  # start, pause, resume, set_completed, rest
+    at = db.Column(db.DateTime, nullable=False)
+    workout_exercise_id = db.Column(db.Integer)  # set_completed
+    reps = db.Column(db.Integer)
+    weight = db.Column(db.Float)
+    duration_seconds = db.Column(db.Integer)  # set_completed, rest
+    
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'type': self.type,
+            'at': self.at.isoformat() if self.at else None,
+            'workout_exercise_id': self.workout_exercise_id,
+            'reps': self.reps,
+            'weight': self.weight,
+            'duration_seconds': self.duration_seconds
+        }
+
+class CatalogState(db.Model):
+    __tablename__ = 'catalog_state'
+    
+    # Single row whose version is bumped on every exercise/template write (see cache.py)
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+class SyncState(db.Model):
+    __tablename__ = 'sync_state'
+    
+    # Single row holding the last change sequence number handed out (see sync.py)
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.Integer, nullable=False, default=0)
+
+class SyncTombstone(db.Model):
+    __tablename__ = 'sync_tombstones'
+    __table_args__ = (
+        db.Index('ix_sync_tombstones_user_id_seq', 'user_id', 'seq'),
+    )
+    
+    # A deleted synced row; user_id is None for catalog rows
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # workout, workout_exercise, exercise, template, template_exercise
+    object_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_type_status_run_at', 'type', 'status', 'run_at'),
+        db.Index('ix_jobs_user_id_id', 'user_id', 'id'),
+        db.Index('ix_jobs_heartbeat_at', 'heartbeat_at'),  # only running jobs have one
+    )
+    
+    # A unit of background work, claimed and run by the job workers (see jobs.py)
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # None for maintenance jobs
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload = db.Column(db.Text)  # JSON
+    result = db.Column(db.Text)  # JSON, once succeeded
+    error = db.Column(db.Text)  # of the last failed attempt
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # not claimed before this
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # while running
+    worker = db.Column(db.String(100))
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'user_id': self.user_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'run_at': self.run_at.isoformat() if self.run_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    
+    # One row per applied migration (see migrations.py)
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,40 @@
+import base64
+from datetime import datetime
+from sqlalchemy import tuple_
+
+# Keyset pagination over (date, id), the order the workout list is served in.
+# A cursor names the last row of the previous page, so each page is an index
+# range scan that costs the same no matter how deep into the history it is,
+# unlike OFFSET which has to walk and discard every earlier row.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(row_date, row_id):
+    """Build an opaque cursor pointing at the given (date, id) row"""
+    raw = f"{row_date.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (date, id) pair encoded by encode_cursor, or raise ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_date, raw_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.strptime(raw_date, '%Y-%m-%d').date(), int(raw_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def page_size(limit):
+    """Clamp a requested page size to [1, MAX_PAGE_SIZE]"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def after_cursor(date_column, id_column, cursor):
+    """Filter selecting rows that sort after the cursor in (date DESC, id DESC) order"""
+    cursor_date, cursor_id = decode_cursor(cursor)
+    return tuple_(date_column, id_column) < tuple_(cursor_date, cursor_id)
@@ -0,0 +1,229 @@
+from datetime import datetime
+from sqlalchemy import bindparam, delete, event, inspect, select
+from sqlalchemy.orm import Session
+from database import db, driver_insert_sql
+from models import ExerciseProgress, ProgressState, Workout, WorkoutExercise
+
+# Strength progression: volume, best set, estimated one-rep max and PR events.
+#
+# exercise_progress holds one row per workout x exercise, the aggregate of that
+# exercise's rows in that workout, for rows with reps. Aggregates are computed
+# with NumPy over column arrays, a whole batch of workouts at once:
+#
+#   volume        sum of sets x reps x weight (no weight counts as 0 kg)
+#   best set      the set with the highest Epley estimate, more reps on a tie
+#   e1rm_epley    weight x (1 + reps / 30), or the weight itself for a single
+#   e1rm_brzycki  weight x 36 / (37 - reps), undefined past 36 reps
+#
+# Rows are kept current in the transaction that writes the workout: an after_flush
+# hook re-derives every workout an ORM flush touched, and the Core write paths
+# (bulk import, template starts) hand their new rows to store_progress(). A user
+# whose history predates all that (existing or generated data) gets it built in
+# one pass on first use, and progress_state records that it has been.
+#
+# A read is then a primary key range scan of one user's sessions for one exercise,
+# with PR events found by running maxima over them.
+
+# Kept under SQLite's bound parameter limit
+REFRESH_BATCH_SIZE = 500
+
+# (event type, session column) in the order events are listed for the same session
+PR_TYPES = (
+    ('e1rm', 'e1rm_epley'),
+    ('weight', 'best_weight'),
+    ('volume', 'volume'),
+)
+
+SESSION_COLUMNS = ('date', 'workout_id', 'sets', 'reps', 'volume', 'best_weight', 'best_reps',
+                   'e1rm_epley', 'e1rm_brzycki')
+
+# exercise_progress rows as aggregate_sessions() returns them; they go to the
+# driver's executemany() as plain tuples, like the bulk import's exercise rows
+PROGRESS_COLUMNS = ('user_id', 'workout_id', 'date', 'exercise_id') + SESSION_COLUMNS[2:]
+
+
+def _history_query():
+    """(user_id, workout_id, date, exercise_id, sets, reps, weight) for every exercise row with reps"""
+    return select(Workout.user_id, Workout.id, Workout.date, WorkoutExercise.exercise_id,
+                  WorkoutExercise.sets, WorkoutExercise.reps, WorkoutExercise.weight) \
+        .join(WorkoutExercise, WorkoutExercise.workout_id == Workout.id) \
+        .where(WorkoutExercise.reps > 0)
+
+
+def aggregate_sessions(rows):
+    """Collapse (user_id, workout_id, date, exercise_id, sets, reps, weight) rows into PROGRESS_COLUMNS tuples"""
+    rows = [row for row in rows if row[5] and row[5] > 0]
+    if not rows:
+        return []
+    import numpy as np
+
+    user_ids, workout_ids, dates, exercise_ids, sets, reps, weights = zip(*rows)
+    workout = np.array(workout_ids, dtype=np.int64)
+    exercise = np.array(exercise_ids, dtype=np.int64)
+    reps = np.array(reps, dtype=np.float64)
+    sets = np.array(sets, dtype=np.float64)
+    sets = np.where(np.isnan(sets) | (sets < 1), 1, sets)
+    weight = np.nan_to_num(np.array(weights, dtype=np.float64), nan=0.0).clip(min=0)
+
+    epley = np.where(reps == 1, weight, weight * (1 + reps / 30))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        brzycki = np.where(reps < 37, weight * 36 / (37 - reps), np.nan)
+
+    # Group by (workout, exercise); within a group the best set sorts last
+    order = np.lexsort((reps, epley, exercise, workout))
+    workout, exercise, reps, sets, weight = workout[order], exercise[order], reps[order], sets[order], weight[order]
+    epley, brzycki = epley[order], brzycki[order]
+    starts = np.flatnonzero(np.r_[True, (workout[1:] != workout[:-1]) | (exercise[1:] != exercise[:-1])])
+    ends = np.r_[starts[1:], len(order)] - 1
+
+    first = order[starts]
+    columns = {
+        'user_id': np.array(user_ids, dtype=np.int64)[first].tolist(),
+        'workout_id': workout[starts].tolist(),
+        'date': [dates[i] for i in first.tolist()],
+        'exercise_id': exercise[starts].tolist(),
+        'sets': np.add.reduceat(sets, starts).astype(np.int64).tolist(),
+        'reps': np.add.reduceat(sets * reps, starts).astype(np.int64).tolist(),
+        'volume': np.add.reduceat(sets * reps * weight, starts).round(2).tolist(),
+        'best_weight': weight[ends].tolist(),
+        'best_reps': reps[ends].astype(np.int64).tolist(),
+        'e1rm_epley': epley[ends].round(2).tolist(),
+        'e1rm_brzycki': _nullable(np.fmax.reduceat(brzycki, starts).round(2)),
+    }
+    return list(zip(*(columns[name] for name in PROGRESS_COLUMNS)))
+
+
+def _nullable(array):
+    return [None if value != value else value for value in array.tolist()]
+
+
+def store_progress(connection, rows):
+    """Add the sessions for freshly inserted exercise rows (see aggregate_sessions for the row shape)"""
+    sessions = aggregate_sessions(rows)
+    if sessions:
+        connection.exec_driver_sql(
+            driver_insert_sql(ExerciseProgress.__tablename__, PROGRESS_COLUMNS, connection.dialect), sessions)
+
+
+def refresh_progress(connection, workout_ids, removed=()):
+    """Re-derive the sessions of the given workouts from their current rows; removed workouts just lose theirs"""
+    table = ExerciseProgress.__table__
+    workout_ids = sorted(set(workout_ids))
+    for start in range(0, len(workout_ids), REFRESH_BATCH_SIZE):
+        batch = workout_ids[start:start + REFRESH_BATCH_SIZE]
+        connection.execute(delete(table).where(table.c.workout_id.in_(bindparam('ids', expanding=True))),
+                           {'ids': batch})
+        remaining = [workout_id for workout_id in batch if workout_id not in removed]
+        if remaining:
+            rows = connection.execute(
+                _history_query().where(Workout.id.in_(bindparam('ids', expanding=True))), {'ids': remaining}
+            ).all()
+            store_progress(connection, rows)
+
+
+def rebuild_user_progress(user_id):
+    """Re-derive all of a user's sessions from their workout history"""
+    connection = db.session.connection()
+    table = ExerciseProgress.__table__
+    connection.execute(delete(table).where(table.c.user_id == user_id))
+    store_progress(connection, connection.execute(_history_query().where(Workout.user_id == user_id)).all())
+
+    state = db.session.get(ProgressState, user_id)
+    if state is None:
+        state = ProgressState(user_id=user_id)
+        db.session.add(state)
+    state.built_at = datetime.utcnow()
+    db.session.flush()
+
+
+@event.listens_for(Session, 'after_flush')
+def refresh_flushed_progress(session, flush_context):
+    workout_ids = set()
+    removed = set()
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, WorkoutExercise):
+            workout_ids.add(obj.workout_id)
+            # Moved to another workout: the old one loses the row
+            workout_ids.update(inspect(obj).attrs.workout_id.history.deleted or ())
+        elif isinstance(obj, Workout) and obj not in session.new:
+            state = inspect(obj)
+            if obj in session.deleted:
+                removed.add(obj.id)
+            elif state.attrs.date.history.has_changes() or state.attrs.user_id.history.has_changes():
+                workout_ids.add(obj.id)
+    workout_ids |= removed
+    workout_ids.discard(None)
+    if workout_ids:
+        refresh_progress(session.connection(), workout_ids, removed)
+
+
+def _pr_events(np, columns):
+    events = []
+    for pr_type, name in PR_TYPES:
+        values = np.array(columns[name], dtype=np.float64)
+        # Best of every earlier session; the first session sets the baseline
+        previous = np.r_[np.inf, np.maximum.accumulate(values)[:-1]]
+        for i in np.flatnonzero(values > previous).tolist():
+            events.append({
+                'date': columns['date'][i].isoformat(),
+                'workout_id': columns['workout_id'][i],
+                'type': pr_type,
+                'value': columns[name][i],
+                'previous': float(previous[i])
+            })
+    order = {pr_type: i for i, (pr_type, _) in enumerate(PR_TYPES)}
+    events.sort(key=lambda e: (e['date'], e['workout_id'], order[e['type']]))
+    return events
+
+
+def _records(np, columns):
+    records = {}
+    for pr_type, name in PR_TYPES:
+        values = np.array(columns[name], dtype=np.float64)
+        if not len(values) or values.max() <= 0:
+            records[pr_type] = None
+            continue
+        i = int(np.argmax(values))
+        records[pr_type] = {
+            'value': columns[name][i],
+            'date': columns['date'][i].isoformat(),
+            'workout_id': columns['workout_id'][i]
+        }
+    return records
+
+
+def get_exercise_progress(user_id, exercise_id):
+    """Session series, current records and PR events for one user and exercise"""
+    import numpy as np
+
+    if db.session.get(ProgressState, user_id) is None:
+        rebuild_user_progress(user_id)
+        db.session.commit()
+
+    table = ExerciseProgress.__table__
+    rows = db.session.execute(
+        select(*[table.c[name] for name in SESSION_COLUMNS])
+        .where(table.c.user_id == user_id, table.c.exercise_id == exercise_id)
+        .order_by(table.c.date, table.c.workout_id)
+    ).all()
+    columns = dict(zip(SESSION_COLUMNS, zip(*rows))) if rows else {name: () for name in SESSION_COLUMNS}
+
+    return {
+        'user_id': user_id,
+        'exercise_id': exercise_id,
+        'sessions': [
+            {
+                'date': row.date.isoformat(),
+                'workout_id': row.workout_id,
+                'sets': row.sets,
+                'reps': row.reps,
+                'volume': row.volume,
+                'best_set': {'weight': row.best_weight, 'reps': row.best_reps},
+                'e1rm_epley': row.e1rm_epley,
+                'e1rm_brzycki': row.e1rm_brzycki
+            }
+            for row in rows
+        ],
+        'personal_records': _records(np, columns),
+        'pr_events': _pr_events(np, columns) if rows else []
+    }
@@ -1,8 +1,37 @@
-from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from models import User, Workout, Exercise, WorkoutExercise, WorkoutTemplate, WorkoutTemplateExercise
+from flask import Blueprint, Response, current_app, request, jsonify, send_file, stream_with_context
+from models import User, Workout, Exercise, WorkoutExercise, WorkoutSession, Job, WorkoutTemplate, WorkoutTemplateExercise, exercise_tags, template_tags
 from database import db
+from auth import (HasherBusy, current_user_id, forbidden_user, hash_password, issue_token,
+                  needs_rehash, verify_password)
+from loading import workout_options, template_options
+from pagination import after_cursor, encode_cursor, page_size
+from stats import get_user_stats, record_workout_change
+from progress import get_exercise_progress
+from calories import estimate_workout
+from bulk_import import BulkImport, read_ndjson
+from export import EXPORT_FORMATS, export_query, export_stream
+from jobs import enqueue, job_accepted
+from cache import cached_body, cached_json, catalog_cache
+from conditional import not_modified, user_etag, with_etag, workout_etag, workout_list_etag
+from search import search_workout_ids
+from sync import get_changes, parse_since
+from serializers import (EXERCISE_JSON, TEMPLATE_INCLUDES, TEMPLATE_JSON, WORKOUT_INCLUDES, WORKOUT_JSON,
+                         encode_exercises, encode_templates, encode_workouts, json_array, json_body, json_object,
+                         json_response, stream_workouts)
+from live_sessions import event_log, finalize_session, parse_events, parse_time, session_state, workout_exercise_ids
+from template_snapshots import start_workout, started_response_body, template_snapshot
+from tags import EQUIPMENT, MUSCLE_GROUP, filter_tagged, split_tags
 from datetime import datetime, date
+import json
+import os
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_BATCH_SIZE = 500
+
+
+def prefers_async():
+    """Whether the client asked for a 202 and a job instead of waiting (RFC 7240 Prefer: respond-async)"""
+    return 'respond-async' in request.headers.get('Prefer', '')
 
 # Authentication routes
 auth_bp = Blueprint('auth', __name__)
@@ -23,7 +52,7 @@ def register():
         user = User(
             username=data['username'],
             email=data['email'],
-            password_hash=generate_password_hash(data['password']),
+            password_hash=hash_password(data['password']),
             first_name=data['first_name'],
             last_name=data['last_name'],
             age=data.get('age'),
@@ -35,8 +64,12 @@ def register():
         db.session.add(user)
         db.session.commit()
         
-        return jsonify({'message': 'User created successfully', 'user': user.to_dict()}), 201
+        token, expires_at = issue_token(user.id)
+        return jsonify({'message': 'User created successfully', 'user': user.to_dict(),
+                        'token': token, 'expires_at': expires_at}), 201
     
+    except HasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -46,25 +79,46 @@ def login():
         data = request.get_json()
         user = User.query.filter_by(username=data['username']).first()
         
-        if user and check_password_hash(user.password_hash, data['password']):
-            return jsonify({'message': 'Login successful', 'user': user.to_dict()}), 200
+        if user and verify_password(user.password_hash, data['password']):
+            # Move old hashes to the configured cost while the password is at hand
+            if needs_rehash(user.password_hash):
+                user.password_hash = hash_password(data['password'])
+                db.session.commit()
+            token, expires_at = issue_token(user.id)
+            return jsonify({'message': 'Login successful', 'user': user.to_dict(),
+                            'token': token, 'expires_at': expires_at}), 200
         else:
             return jsonify({'error': 'Invalid credentials'}), 401
     
+    except HasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     try:
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
+        etag = user_etag(user_id)
+        cached = etag and not_modified(etag)
+        if cached:
+            return cached
+        
         user = User.query.get_or_404(user_id)
-        return jsonify(user.to_dict()), 200
+        return with_etag(jsonify(user.to_dict()), etag), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     try:
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
         user = User.query.get_or_404(user_id)
         data = request.get_json()
         
@@ -82,27 +136,227 @@ def update_user(user_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# User routes
+user_bp = Blueprint('users', __name__)
+
+@user_bp.route('/<int:user_id>/stats', methods=['GET'])
+def get_stats(user_id):
+    try:
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
+        User.query.get_or_404(user_id)
+        return jsonify(get_user_stats(user_id)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@user_bp.route('/<int:user_id>/progress', methods=['GET'])
+def get_progress(user_id):
+    try:
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
+        exercise_id = request.args.get('exercise_id', type=int)
+        if exercise_id is None:
+            return jsonify({'error': 'exercise_id is required'}), 400
+        
+        User.query.get_or_404(user_id)
+        Exercise.query.get_or_404(exercise_id)
+        return jsonify(get_exercise_progress(user_id, exercise_id)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _export_params():
+    """(format, from, to) of an export request; raises ValueError"""
+    export_format = request.args.get('format', 'csv')
+    try:
+        date_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError:
+        raise ValueError('from and to must be in YYYY-MM-DD format')
+    return export_format, date_from, date_to
+
+@user_bp.route('/<int:user_id>/export', methods=['GET'])
+def export_history(user_id):
+    try:
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
+        User.query.get_or_404(user_id)
+        
+        try:
+            export_format, date_from, date_to = _export_params()
+            stream = export_stream(export_format)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        rows = stream(db.session.connection(), export_query(user_id, date_from, date_to))
+        response = Response(stream_with_context(rows), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename=workouts-{user_id}.{extension}'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@user_bp.route('/<int:user_id>/export', methods=['POST'])
+def queue_export(user_id):
+    try:
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
+        User.query.get_or_404(user_id)
+        
+        try:
+            export_format, date_from, date_to = _export_params()
+            export_stream(export_format)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        job = enqueue('export', {
+            'format': export_format,
+            'from': date_from.isoformat() if date_from else None,
+            'to': date_to.isoformat() if date_to else None
+        }, user_id=user_id)
+        db.session.commit()
+        return job_accepted(job)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@user_bp.route('/<int:user_id>/rebuild', methods=['POST'])
+def queue_rebuild(user_id):
+    try:
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
+        User.query.get_or_404(user_id)
+        job = enqueue('rebuild_user', user_id=user_id)
+        db.session.commit()
+        return job_accepted(job)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Workout routes
 workout_bp = Blueprint('workouts', __name__)
 
 @workout_bp.route('', methods=['GET'])
 def get_workouts():
     try:
-        user_id = request.args.get('user_id')
+        user_id = request.args.get('user_id', type=int) or current_user_id()
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
+        try:
+            fieldset = WORKOUT_JSON.fieldset(request.args, WORKOUT_INCLUDES)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Plain rows, not Workout objects: serializers.py turns them into JSON.
+        # The date is selected either way for the next cursor.
+        view = WORKOUT_JSON.view(fieldset.fields, 'exercises' in fieldset.include, hidden=('date',))
+        query = Workout.query.with_entities(*view.columns)
         if user_id:
-            workouts = Workout.query.filter_by(user_id=user_id).order_by(Workout.date.desc()).all()
-        else:
-            workouts = Workout.query.order_by(Workout.date.desc()).all()
-        
-        return jsonify([workout.to_dict() for workout in workouts]), 200
+            query = query.filter_by(user_id=user_id)
+        if cursor:
+            try:
+                query = query.filter(after_cursor(Workout.date, Workout.id, cursor))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        query = query.order_by(Workout.date.desc(), Workout.id.desc())
+        
+        etag = workout_list_etag(user_id, catalog_cache.version(), request.args)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        # Streaming mode: one JSON document per line, read through a server-side cursor
+        if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == NDJSON_MIMETYPE:
+            size = page_size(limit) if limit is not None else None
+            return with_etag(Response(stream_with_context(_stream_workouts(query, view, size)),
+                                      mimetype=NDJSON_MIMETYPE), etag)
+        
+        # Without paging parameters keep returning the full list for older clients
+        if limit is None and cursor is None:
+            return with_etag(json_response(json_array(encode_workouts(
+                db.session, query.all(), view, parents=query.with_entities(Workout.id).order_by(None).statement
+            ))), etag), 200
+        
+        size = page_size(limit)
+        rows = query.limit(size + 1).all()
+        next_cursor = None
+        if len(rows) > size:
+            rows = rows[:size]
+            next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+        
+        return with_etag(json_response(json_object(
+            workouts=json_array(encode_workouts(db.session, rows, view)),
+            next_cursor=json.dumps(next_cursor)
+        )), etag), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _stream_workouts(query, view, limit):
+    for workouts in stream_workouts(db.session, query, view, STREAM_BATCH_SIZE, limit):
+        yield ''.join(f'{workout}\n' for workout in workouts)
+
+@workout_bp.route('/search', methods=['GET'])
+def search_workouts():
+    try:
+        q = request.args.get('q', '').strip()
+        user_id = request.args.get('user_id', type=int) or current_user_id()
+        limit = page_size(request.args.get('limit', type=int))
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
+        if not q:
+            return jsonify({'error': 'Search query is required'}), 400
+        
+        try:
+            fieldset = WORKOUT_JSON.fieldset(request.args, WORKOUT_INCLUDES)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        view = WORKOUT_JSON.view(fieldset.fields, 'exercises' in fieldset.include)
+        
+        ids = search_workout_ids(db.session.connection(), q, user_id, limit + 1, offset)
+        has_more = len(ids) > limit
+        ids = ids[:limit]
+        
+        # Load the page in one go and put it back in rank order
+        rows = {row.id: row for row in Workout.query.with_entities(*view.columns).filter(Workout.id.in_(ids))}
+        return json_response(json_object(
+            workouts=json_array(encode_workouts(db.session, [rows[i] for i in ids if i in rows], view)),
+            next_offset=json.dumps(offset + limit if has_more else None)
+        )), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @workout_bp.route('/<int:workout_id>', methods=['GET'])
 def get_workout(workout_id):
     try:
-        workout = Workout.query.get_or_404(workout_id)
-        return jsonify(workout.to_dict()), 200
+        # Ownership before the ETag: a 304 would tell others the workout exists
+        owner_id, etag = workout_etag(workout_id, catalog_cache.version())
+        if owner_id is None:
+            return jsonify({'error': 'Workout not found'}), 404
+        forbidden = forbidden_user(owner_id)
+        if forbidden:
+            return forbidden
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        workout = Workout.query.options(*workout_options()).get_or_404(workout_id)
+        return with_etag(jsonify(workout.to_dict()), etag), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -110,9 +364,14 @@ def get_workout(workout_id):
 def create_workout():
     try:
         data = request.get_json()
+        user_id = data.get('user_id') or current_user_id()
+        
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
         
         workout = Workout(
-            user_id=data['user_id'],
+            user_id=user_id,
             name=data['name'],
             description=data.get('description'),
             date=datetime.strptime(data['date'], '%Y-%m-%d').date() if data.get('date') else date.today(),
@@ -125,6 +384,7 @@ def create_workout():
         db.session.flush()  # Get the workout ID
         
         # Add exercises to workout
+        workout_exercises = []
         if 'exercises' in data:
             for i, exercise_data in enumerate(data['exercises']):
                 workout_exercise = WorkoutExercise(
@@ -140,6 +400,12 @@ def create_workout():
                     order_in_workout=i + 1
                 )
                 db.session.add(workout_exercise)
+                workout_exercises.append(workout_exercise)
+        
+        estimate_workout(workout, workout_exercises)
+        db.session.flush()
+        record_workout_change(workout.user_id, workouts=1, calories=workout.calories_burned,
+                              duration_minutes=workout.duration_minutes)
         
         db.session.commit()
         return jsonify({'message': 'Workout created successfully', 'workout': workout.to_dict()}), 201
@@ -147,21 +413,71 @@ def create_workout():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@workout_bp.route('/bulk', methods=['POST'])
+def bulk_create_workouts():
+    try:
+        if prefers_async():
+            # Validated by the job; the body is kept as sent
+            payload = {'owner_id': current_user_id()}
+            if request.mimetype == NDJSON_MIMETYPE:
+                payload['ndjson'] = request.get_data(as_text=True)
+            else:
+                payload['items'] = request.get_json()
+                if not isinstance(payload['items'], list):
+                    return jsonify({'error': 'Expected a JSON array of workouts'}), 400
+            job = enqueue('bulk_import', payload, user_id=current_user_id())
+            db.session.commit()
+            return job_accepted(job)
+        
+        if request.mimetype == NDJSON_MIMETYPE:
+            items = read_ndjson(request.stream)
+        else:
+            items = request.get_json()
+            if not isinstance(items, list):
+                return jsonify({'error': 'Expected a JSON array of workouts'}), 400
+        
+        result = BulkImport(owner_id=current_user_id()).run(items)
+        
+        if result['created'] == 0:
+            status = 400
+        elif result['failed']:
+            status = 200
+        else:
+            status = 201
+        return jsonify(result), status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @workout_bp.route('/<int:workout_id>', methods=['PUT'])
 def update_workout(workout_id):
     try:
         workout = Workout.query.get_or_404(workout_id)
+        forbidden = forbidden_user(workout.user_id)
+        if forbidden:
+            return forbidden
+        
         data = request.get_json()
+        old_calories = workout.calories_burned or 0
+        old_duration = workout.duration_minutes or 0
         
         workout.name = data.get('name', workout.name)
         workout.description = data.get('description', workout.description)
         workout.duration_minutes = data.get('duration_minutes', workout.duration_minutes)
         workout.calories_burned = data.get('calories_burned', workout.calories_burned)
         workout.notes = data.get('notes', workout.notes)
+        if 'calories_burned' in data:
+            workout.calories_estimated = False
         
         if data.get('date'):
             workout.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
         
+        if workout.calories_burned is None or workout.calories_estimated:
+            estimate_workout(workout)
+        db.session.flush()
+        record_workout_change(workout.user_id,
+                              calories=(workout.calories_burned or 0) - old_calories,
+                              duration_minutes=(workout.duration_minutes or 0) - old_duration)
+        
         db.session.commit()
         return jsonify({'message': 'Workout updated successfully', 'workout': workout.to_dict()}), 200
     
@@ -172,12 +488,39 @@ def update_workout(workout_id):
 def delete_workout(workout_id):
     try:
         workout = Workout.query.get_or_404(workout_id)
+        forbidden = forbidden_user(workout.user_id)
+        if forbidden:
+            return forbidden
+        
         db.session.delete(workout)
+        db.session.flush()
+        record_workout_change(workout.user_id, workouts=-1, calories=-(workout.calories_burned or 0),
+                              duration_minutes=-(workout.duration_minutes or 0))
         db.session.commit()
         return jsonify({'message': 'Workout deleted successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@workout_bp.route('/<int:workout_id>/session', methods=['POST'])
+def open_workout_session(workout_id):
+    try:
+        workout = Workout.query.get_or_404(workout_id)
+        forbidden = forbidden_user(workout.user_id)
+        if forbidden:
+            return forbidden
+        
+        # One session per workout: opening it again picks the existing one up
+        session = WorkoutSession.query.filter_by(workout_id=workout_id).first()
+        if session:
+            return jsonify(session_state(session)), 200
+        
+        session = WorkoutSession(workout_id=workout_id, user_id=workout.user_id)
+        db.session.add(session)
+        db.session.commit()
+        return jsonify(session_state(session)), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Exercise routes
 exercise_bp = Blueprint('exercises', __name__)
 
@@ -185,28 +528,38 @@ exercise_bp = Blueprint('exercises', __name__)
 def get_exercises():
     try:
         category = request.args.get('category')
-        muscle_group = request.args.get('muscle_group')
+        muscle_groups = split_tags(request.args.getlist('muscle_group'))
+        equipment = split_tags(request.args.getlist('equipment'))
         difficulty = request.args.get('difficulty')
+        match = request.args.get('match', 'any')
+        
+        if match not in ('any', 'all'):
+            return jsonify({'error': "match must be 'any' or 'all'"}), 400
         
         query = Exercise.query
         
         if category:
             query = query.filter(Exercise.category == category)
-        if muscle_group:
-            query = query.filter(Exercise.muscle_groups.contains(muscle_group))
+        if muscle_groups:
+            query = filter_tagged(query, Exercise.id, exercise_tags.c.exercise_id, MUSCLE_GROUP, muscle_groups,
+                                  match == 'all')
+        if equipment:
+            query = filter_tagged(query, Exercise.id, exercise_tags.c.exercise_id, EQUIPMENT, equipment,
+                                  match == 'all')
         if difficulty:
             query = query.filter(Exercise.difficulty_level == difficulty)
         
-        exercises = query.all()
-        return jsonify([exercise.to_dict() for exercise in exercises]), 200
+        key = ('exercises', category, tuple(muscle_groups), tuple(equipment), difficulty, match)
+        return cached_body(key, lambda: json_body(json_array(
+            encode_exercises(query.with_entities(*EXERCISE_JSON.columns).all()))))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @exercise_bp.route('/<int:exercise_id>', methods=['GET'])
 def get_exercise(exercise_id):
     try:
-        exercise = Exercise.query.get_or_404(exercise_id)
-        return jsonify(exercise.to_dict()), 200
+        return cached_json(('exercise', exercise_id),
+                           lambda: Exercise.query.get_or_404(exercise_id).to_dict())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -241,6 +594,18 @@ def get_workout_templates():
     try:
         category = request.args.get('category')
         difficulty = request.args.get('difficulty')
+        muscle_groups = split_tags(request.args.getlist('muscle_group'))
+        equipment = split_tags(request.args.getlist('equipment'))
+        match = request.args.get('match', 'any')
+        
+        if match not in ('any', 'all'):
+            return jsonify({'error': "match must be 'any' or 'all'"}), 400
+        
+        try:
+            fieldset = TEMPLATE_JSON.fieldset(request.args, TEMPLATE_INCLUDES)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        view = TEMPLATE_JSON.view(fieldset.fields, bool(fieldset.include))
         
         query = WorkoutTemplate.query
         
@@ -248,17 +613,26 @@ def get_workout_templates():
             query = query.filter(WorkoutTemplate.category == category)
         if difficulty:
             query = query.filter(WorkoutTemplate.difficulty_level == difficulty)
-        
-        templates = query.all()
-        return jsonify([template.to_dict() for template in templates]), 200
+        if muscle_groups:
+            query = filter_tagged(query, WorkoutTemplate.id, template_tags.c.template_id, MUSCLE_GROUP, muscle_groups,
+                                  match == 'all')
+        if equipment:
+            query = filter_tagged(query, WorkoutTemplate.id, template_tags.c.template_id, EQUIPMENT, equipment,
+                                  match == 'all')
+        
+        key = ('templates', category, difficulty, tuple(muscle_groups), tuple(equipment), match,
+               fieldset.fields, tuple(sorted(fieldset.include)))
+        return cached_body(key, lambda: json_body(json_array(encode_templates(
+            db.session, query.with_entities(*view.columns).all(), view, 'exercise_details' in fieldset.include,
+            parents=query.with_entities(WorkoutTemplate.id).statement))))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @template_bp.route('/<int:template_id>', methods=['GET'])
 def get_workout_template(template_id):
     try:
-        template = WorkoutTemplate.query.get_or_404(template_id)
-        return jsonify(template.to_dict()), 200
+        return cached_json(('template', template_id),
+                           lambda: WorkoutTemplate.query.options(*template_options()).get_or_404(template_id).to_dict())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -266,43 +640,165 @@ def get_workout_template(template_id):
 def start_workout_from_template(template_id):
     try:
         data = request.get_json()
-        user_id = data.get('user_id')
+        user_id = data.get('user_id') or current_user_id()
         
         if not user_id:
             return jsonify({'error': 'User ID is required'}), 400
         
-        template = WorkoutTemplate.query.get_or_404(template_id)
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
         
-        # Create a new workout based on the template
-        workout = Workout(
-            user_id=user_id,
-            name=template.name,
-            description=template.description,
-            date=datetime.utcnow().date()
-        )
+        template = template_snapshot(template_id)
+        if template is None:
+            return jsonify({'error': 'Template not found'}), 404
         
-        db.session.add(workout)
-        db.session.flush()  # Get the workout ID
+        # Copy the template's rows into a new workout, then answer with the cached template JSON
+        workout = start_workout(template, user_id)
+        db.session.commit()
         
-        # Add exercises from template to workout
-        for template_exercise in template.template_exercises:
-            workout_exercise = WorkoutExercise(
-                workout_id=workout.id,
-                exercise_id=template_exercise.exercise_id,
-                sets=template_exercise.sets,
-                reps=template_exercise.reps,
-                duration_seconds=template_exercise.duration_seconds,
-                order_in_workout=template_exercise.order_in_template
-            )
-            db.session.add(workout_exercise)
+        return Response(started_response_body(template, workout), status=201, mimetype='application/json')
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+# Live workout session routes
+session_bp = Blueprint('sessions', __name__)
+
+def _owned_session(session_id):
+    """Return (session, None), or (None, error response) if it is missing or someone else's"""
+    session = db.session.get(WorkoutSession, session_id)
+    if session is None:
+        return None, (jsonify({'error': 'Session not found'}), 404)
+    return session, forbidden_user(session.user_id)
+
+@session_bp.route('/<int:session_id>', methods=['GET'])
+def get_workout_session(session_id):
+    try:
+        session, error = _owned_session(session_id)
+        if error:
+            return error
+        return jsonify(session_state(session)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@session_bp.route('/<int:session_id>/events', methods=['POST'])
+def append_session_events(session_id):
+    try:
+        session, error = _owned_session(session_id)
+        if error:
+            return error
+        if session.status != 'active':
+            return jsonify({'error': 'Session is already finalized'}), 409
         
+        data = request.get_json()
+        try:
+            rows = parse_events(session_id, data.get('events') if isinstance(data, dict) else data,
+                                workout_exercise_ids(session))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        event_log.append(rows)
+        return jsonify({'session_id': session_id, 'accepted': len(rows), 'last_seq': max(row[1] for row in rows)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@session_bp.route('/<int:session_id>/finalize', methods=['POST'])
+def finalize_workout_session(session_id):
+    try:
+        session, error = _owned_session(session_id)
+        if error:
+            return error
+        if session.status != 'active':
+            workout = Workout.query.options(*workout_options()).get(session.workout_id)
+            return jsonify({'session': session.to_dict(), 'workout': workout.to_dict()}), 200
+        
+        # The tail of the log can come along with the finalize
+        data = request.get_json(silent=True) or {}
+        try:
+            rows = parse_events(session_id, data['events'], workout_exercise_ids(session)) if data.get('events') else []
+            ended_at = parse_time(data['at']) if data.get('at') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if rows:
+            event_log.append(rows)
+        
+        workout = finalize_session(session, ended_at)
         db.session.commit()
-        
         return jsonify({
-            'message': 'Workout started successfully',
-            'workout': workout.to_dict(),
-            'template': template.to_dict()
-        }), 201
-    
+            'message': 'Workout session finalized',
+            'session': session.to_dict(),
+            'workout': workout.to_dict()
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Delta sync routes
+sync_bp = Blueprint('sync', __name__)
+
+@sync_bp.route('', methods=['GET'])
+def sync_changes():
+    try:
+        user_id = request.args.get('user_id', type=int) or current_user_id()
+        if not user_id:
+            return jsonify({'error': 'user_id is required'}), 400
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
+        try:
+            since = parse_since(request.args.get('since'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return json_response(get_changes(user_id, since)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Background job routes
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('', methods=['GET'])
+def get_jobs():
+    try:
+        user_id = request.args.get('user_id', type=int) or current_user_id()
+        if not user_id:
+            return jsonify({'error': 'user_id is required'}), 400
+        forbidden = forbidden_user(user_id)
+        if forbidden:
+            return forbidden
+        
+        query = Job.query.filter_by(user_id=user_id)
+        if request.args.get('status'):
+            query = query.filter_by(status=request.args['status'])
+        jobs = query.order_by(Job.id.desc()).limit(page_size(request.args.get('limit', type=int))).all()
+        return jsonify([job.to_dict() for job in jobs]), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@jobs_bp.route('/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = Job.query.get_or_404(job_id)
+        forbidden = forbidden_user(job.user_id)
+        if forbidden:
+            return forbidden
+        return jsonify(job.to_dict()), 200
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@jobs_bp.route('/<int:job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    try:
+        job = Job.query.get_or_404(job_id)
+        forbidden = forbidden_user(job.user_id)
+        if forbidden:
+            return forbidden
+        
+        result = job.to_dict()['result']
+        if job.status != 'succeeded' or not isinstance(result, dict) or 'file' not in result:
+            return jsonify({'error': 'Job has no file to download', 'status': job.status}), 404
+        path = os.path.join(current_app.config['JOBS_DIR'], result['file'])
+        if not os.path.exists(path):
+            return jsonify({'error': 'Job file is no longer available'}), 410
+        return send_file(path, mimetype=result['mimetype'], as_attachment=True, download_name=result['filename'])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,160 @@
+import re
+from sqlalchemy import bindparam, event, or_, select, text
+from sqlalchemy.orm import Session
+from models import Exercise, Workout, WorkoutExercise
+
+# Full-text search over workout history, backed by an SQLite FTS5 table.
+#
+# workout_search has one row per workout (rowid = workouts.id) holding its name,
+# description, notes and the names of its exercises, plus an "owner" column with
+# a u<user_id> token so per-user searches intersect posting lists inside FTS
+# instead of filtering matches afterwards.
+#
+# Updates, deletes and exercise renames are propagated by triggers. New rows are
+# indexed by reindex_workouts(): an after_flush hook calls it for every ORM flush
+# that adds workouts or exercises, and Core bulk inserts call it once per chunk,
+# which is far cheaper than re-tokenizing a workout once per exercise row.
+#
+# Other databases (PostgreSQL) have no workout_search table; searches there fall
+# back to case-insensitive substring matching, newest first.
+
+SEARCH_TABLE = 'workout_search'
+
+# bm25() weights for owner, name, description, notes, exercise_names
+RANK_WEIGHTS = (0.0, 10.0, 2.0, 1.0, 5.0)
+
+EXERCISE_NAMES_SQL = (
+    "(SELECT group_concat(e.name, ' ') FROM workout_exercises we "
+    "JOIN exercises e ON e.id = we.exercise_id WHERE we.workout_id = {workout_id})"
+)
+
+SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "owner, name, description, notes, exercise_names, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+
+    "CREATE TRIGGER IF NOT EXISTS workouts_search_update "
+    "AFTER UPDATE OF user_id, name, description, notes ON workouts BEGIN "
+    f"UPDATE {SEARCH_TABLE} SET owner = 'u' || new.user_id, name = new.name, "
+    "description = new.description, notes = new.notes WHERE rowid = new.id; END",
+
+    "CREATE TRIGGER IF NOT EXISTS workouts_search_delete AFTER DELETE ON workouts BEGIN "
+    f"DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id; END",
+
+    "CREATE TRIGGER IF NOT EXISTS workout_exercises_search_update "
+    "AFTER UPDATE OF workout_id, exercise_id ON workout_exercises BEGIN "
+    f"UPDATE {SEARCH_TABLE} SET exercise_names = {EXERCISE_NAMES_SQL.format(workout_id=f'{SEARCH_TABLE}.rowid')} "
+    "WHERE rowid IN (old.workout_id, new.workout_id); END",
+
+    "CREATE TRIGGER IF NOT EXISTS workout_exercises_search_delete AFTER DELETE ON workout_exercises BEGIN "
+    f"UPDATE {SEARCH_TABLE} SET exercise_names = {EXERCISE_NAMES_SQL.format(workout_id='old.workout_id')} "
+    "WHERE rowid = old.workout_id; END",
+
+    "CREATE TRIGGER IF NOT EXISTS exercises_search_rename AFTER UPDATE OF name ON exercises BEGIN "
+    f"UPDATE {SEARCH_TABLE} SET exercise_names = {EXERCISE_NAMES_SQL.format(workout_id=f'{SEARCH_TABLE}.rowid')} "
+    "WHERE rowid IN (SELECT workout_id FROM workout_exercises WHERE exercise_id = new.id); END",
+]
+
+
+def create_search_index(connection):
+    """Create the FTS table and its triggers, then index every existing workout"""
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in SCHEMA:
+        connection.execute(text(statement))
+    rebuild_search_index(connection)
+
+
+INDEX_SQL = (
+    f"INSERT INTO {SEARCH_TABLE} (rowid, owner, name, description, notes, exercise_names) "
+    "SELECT w.id, 'u' || w.user_id, w.name, w.description, w.notes, "
+    f"{EXERCISE_NAMES_SQL.format(workout_id='w.id')} FROM workouts w"
+)
+
+# Keeps the IN (...) lists well under SQLite's bound parameter limit
+REINDEX_BATCH_SIZE = 500
+
+
+def drop_insert_triggers(connection):
+    """Remove the per-row insert triggers replaced by reindex_workouts()"""
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.execute(text("DROP TRIGGER IF EXISTS workouts_search_insert"))
+    connection.execute(text("DROP TRIGGER IF EXISTS workout_exercises_search_insert"))
+
+
+def rebuild_search_index(connection):
+    """Re-index every workout from scratch"""
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    connection.execute(text(INDEX_SQL))
+
+
+def reindex_workouts(connection, workout_ids, new=False):
+    """(Re-)index the given workouts with one delete and one insert per batch; new ones need no delete"""
+    if connection.dialect.name != 'sqlite':
+        return
+    workout_ids = sorted(set(workout_ids))
+    for start in range(0, len(workout_ids), REINDEX_BATCH_SIZE):
+        batch = {'ids': workout_ids[start:start + REINDEX_BATCH_SIZE]}
+        if not new:
+            connection.execute(
+                text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN :ids").bindparams(bindparam('ids', expanding=True)),
+                batch
+            )
+        connection.execute(
+            text(f"{INDEX_SQL} WHERE w.id IN :ids").bindparams(bindparam('ids', expanding=True)),
+            batch
+        )
+
+
+@event.listens_for(Session, 'after_flush')
+def index_new_workouts(session, flush_context):
+    workout_ids = {obj.id for obj in session.new if isinstance(obj, Workout)}
+    workout_ids |= {obj.workout_id for obj in session.new if isinstance(obj, WorkoutExercise)}
+    workout_ids.discard(None)
+    if workout_ids:
+        reindex_workouts(session.connection(), workout_ids)
+
+
+def match_expression(q, user_id=None):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    terms = re.findall(r'\w+', q.lower())
+    if not terms:
+        return None
+    expression = ' '.join(f'"{term}"*' for term in terms)
+    if user_id is not None:
+        expression = f'owner : "u{int(user_id)}" AND ({expression})'
+    return expression
+
+
+def search_workout_ids(connection, q, user_id=None, limit=20, offset=0):
+    """Return workout ids matching q, best match first"""
+    if connection.dialect.name != 'sqlite':
+        return _substring_search_ids(connection, q, user_id, limit, offset)
+    expression = match_expression(q, user_id)
+    if expression is None:
+        return []
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    rows = connection.execute(
+        text(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :expression "
+             f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT :limit OFFSET :offset"),
+        {'expression': expression, 'limit': limit, 'offset': offset}
+    )
+    return [row[0] for row in rows]
+
+
+def _substring_search_ids(connection, q, user_id, limit, offset):
+    terms = re.findall(r'\w+', q.lower())
+    if not terms:
+        return []
+    query = select(Workout.id)
+    if user_id is not None:
+        query = query.where(Workout.user_id == user_id)
+    for term in terms:
+        pattern = f'%{term}%'
+        exercise_match = select(WorkoutExercise.workout_id).join(Exercise) \
+            .where(Exercise.name.ilike(pattern))
+        query = query.where(or_(Workout.name.ilike(pattern), Workout.description.ilike(pattern),
+                                Workout.notes.ilike(pattern), Workout.id.in_(exercise_match)))
+    query = query.order_by(Workout.date.desc(), Workout.id.desc()).limit(limit).offset(offset)
+    return list(connection.execute(query).scalars())
@@ -1,5 +1,6 @@
-from app import app
+from app import create_app
 from database import db
+from migrations import init_schema
 from models import User, Exercise, Workout, WorkoutExercise
 from werkzeug.security import generate_password_hash
 from datetime import date
@@ -316,7 +317,7 @@ def seed_database():
     
     # Clear existing data
     db.drop_all()
-    db.create_all()
+    init_schema()
     
     # Add user
     db.session.add(user)
@@ -372,5 +373,5 @@ def seed_database():
     print(f"Created sample workout: {workout.name}")
 
 if __name__ == '__main__':
-    with app.app_context():
+    with create_app().app_context():
         seed_database()
\ No newline at end of file
@@ -1,11 +1,12 @@
-from app import app
+from app import create_app
 from database import db
+from migrations import init_schema
 from models import WorkoutTemplate, WorkoutTemplateExercise, Exercise
 
 def seed_workout_templates():
-    with app.app_context():
+    with create_app().app_context():
         # Create tables first
-        db.create_all()
+        init_schema()
         
         # Check if templates already exist
         if WorkoutTemplate.query.first():
@@ -0,0 +1,384 @@
+import json
+from collections import defaultdict, namedtuple
+from json.encoder import encode_basestring_ascii
+from flask import Response, current_app
+from sqlalchemy import Select, func, select
+from models import Exercise, Workout, WorkoutExercise, WorkoutTemplate, WorkoutTemplateExercise
+
+# JSON for the list endpoints without ORM objects.
+#
+# Hydrating a Workout (identity map, instance state, relationship collections)
+# and walking to_dict() costs far more than the row itself. Here the columns a
+# to_dict() reads are selected as plain tuples and children with one extra query,
+# and each row is turned into JSON text by an encoder compiled once per model: a
+# format string with the keys already in jsonify's sorted order, filled from
+# per-column value encoders.
+#
+# Children of a page come from an IN list of its ids. Unbounded lists give the
+# parent query itself (IN (SELECT ...)), and streams read their children in
+# parent order alongside the parents, so neither takes more statements as it
+# grows.
+#
+# The output is byte-for-byte what jsonify(obj.to_dict()) sends with Flask's
+# default JSON settings (sorted keys, ASCII escapes, compact separators). In
+# debug mode, where jsonify indents, bodies are re-encoded to match.
+#
+# Workout and template lists also take sparse fieldsets: ?fields=id,name picks
+# the top-level keys and ?include=exercises,exercise_details the embedded data.
+# A view is compiled (and kept) for each combination asked for, and it selects
+# only the columns it sends, so the prose a list view doesn't show is never read.
+# Without either parameter the response is the full to_dict().
+
+CHILD_BATCH_SIZE = 500
+
+
+def _string(value):
+    return 'null' if value is None else encode_basestring_ascii(value)
+
+
+def _float(value):
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return 'Infinity'
+    if value == float('-inf'):
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+def _number(value):
+    if value is None:
+        return 'null'
+    if value.__class__ is float:
+        return _float(value)
+    return int.__repr__(value)
+
+
+def _timestamp(value):
+    # isoformat() is always ASCII
+    return 'null' if value is None else f'"{value.isoformat()}"'
+
+
+def _csv_list(value):
+    # to_dict()'s value.split(',') if value else []
+    return f"[{','.join(map(encode_basestring_ascii, value.split(',')))}]" if value else '[]'
+
+
+def _raw(value):
+    return value
+
+
+VALUE_ENCODERS = {
+    'string': _string,
+    'number': _number,
+    'timestamp': _timestamp,
+    'csv_list': _csv_list,
+    'raw': _raw,  # already JSON
+}
+
+
+def compile_row_encoder(name, fields):
+    """Return encode(row) -> JSON object text for rows holding (key, kind) fields in order; a None key isn't sent"""
+    order = sorted((i for i in range(len(fields)) if fields[i][0] is not None), key=lambda i: fields[i][0])
+    template = '{' + ','.join(f'{json.dumps(fields[i][0])}:%s' for i in order) + '}'
+    arguments = ''.join(f'e{i}(row[{i}]), ' for i in order)
+    namespace = {'template': template}
+    namespace.update((f'e{i}', VALUE_ENCODERS[fields[i][1]]) for i in order)
+    exec(compile(f'def encode(row):\n    return template % ({arguments})\n', f'<{name} encoder>', 'exec'), namespace)
+    return namespace['encode']
+
+
+# columns to select; encode(row) for rows of them, plus the child array text last
+# when children is set
+RowView = namedtuple('RowView', ['columns', 'encode', 'children'])
+
+Fieldset = namedtuple('Fieldset', ['fields', 'include'])
+
+
+class ModelJSON:
+    """Columns and row encoders for one model's to_dict(), optionally with a child list"""
+
+    def __init__(self, name, columns, child_key=None, extra=()):
+        # columns: (key, column, kind) in to_dict() terms, the row's id (or
+        # parent id) first; extra: fields only sent when asked for by name
+        self.name = name
+        self.child_key = child_key
+        self.fields = tuple(key for key, _, _ in columns)
+        self.extra_fields = tuple(key for key, _, _ in extra)
+        self._columns = {key: (column.label(key), kind) for key, column, kind in (*columns, *extra)}
+        self._views = {}
+        default = self.view(self.fields, child_key is not None)
+        self.columns, self.encode = default.columns, default.encode
+
+    def view(self, fields, children=False, hidden=()):
+        """RowView sending fields; the first column and hidden ones are selected either way"""
+        key = (tuple(fields), children, tuple(hidden))
+        view = self._views.get(key)
+        if view is None:
+            selected = list(dict.fromkeys((self.fields[0], *hidden, *fields)))
+            encoder_fields = [(name if name in fields else None, self._columns[name][1]) for name in selected]
+            if children:
+                encoder_fields.append((self.child_key, 'raw'))
+            view = RowView([self._columns[name][0] for name in selected],
+                           compile_row_encoder(self.name, encoder_fields), children)
+            self._views[key] = view
+        return view
+
+    def fieldset(self, args, includes):
+        """Fieldset from ?fields= and ?include=; everything to_dict() sends when neither is given"""
+        if 'fields' not in args and 'include' not in args:
+            return Fieldset(self.fields, frozenset(includes))
+        fields = self.fields
+        if 'fields' in args:
+            fields = _names(args.getlist('fields'))
+            unknown = [name for name in fields if name not in self._columns]
+            if unknown:
+                raise ValueError(f"Unknown field(s): {', '.join(unknown)}. "
+                                 f"Available: {', '.join(self.fields + self.extra_fields)}")
+            fields = tuple(name for name in self.fields + self.extra_fields if name in fields)
+        include = _names(args.getlist('include'))
+        unknown = [name for name in include if name not in includes]
+        if unknown:
+            raise ValueError(f"Unknown include(s): {', '.join(unknown)}. Available: {', '.join(includes)}")
+        return Fieldset(fields, frozenset(include))
+
+
+def _names(values):
+    return [name.strip() for value in values for name in value.split(',') if name.strip()]
+
+
+EXERCISE_JSON = ModelJSON('exercise', [
+    ('id', Exercise.id, 'number'),
+    ('name', Exercise.name, 'string'),
+    ('description', Exercise.description, 'string'),
+    ('category', Exercise.category, 'string'),
+    ('muscle_groups', Exercise.muscle_groups, 'csv_list'),
+    ('equipment', Exercise.equipment, 'string'),
+    ('difficulty_level', Exercise.difficulty_level, 'string'),
+    ('instructions', Exercise.instructions, 'string'),
+    ('created_at', Exercise.created_at, 'timestamp'),
+])
+
+WORKOUT_EXERCISE_JSON = ModelJSON('workout exercise', [
+    ('workout_id', WorkoutExercise.workout_id, 'number'),  # first: the parent id
+    ('id', WorkoutExercise.id, 'number'),
+    ('exercise_id', WorkoutExercise.exercise_id, 'number'),
+    ('exercise_name', Exercise.name, 'string'),
+    ('sets', WorkoutExercise.sets, 'number'),
+    ('reps', WorkoutExercise.reps, 'number'),
+    ('weight', WorkoutExercise.weight, 'number'),
+    ('duration_seconds', WorkoutExercise.duration_seconds, 'number'),
+    ('distance', WorkoutExercise.distance, 'number'),
+    ('calories_burned', WorkoutExercise.calories_burned, 'number'),
+    ('notes', WorkoutExercise.notes, 'string'),
+    ('order_in_workout', WorkoutExercise.order_in_workout, 'number'),
+])
+
+WORKOUT_JSON = ModelJSON('workout', [
+    ('id', Workout.id, 'number'),  # first: the key children are grouped by
+    ('user_id', Workout.user_id, 'number'),
+    ('name', Workout.name, 'string'),
+    ('description', Workout.description, 'string'),
+    ('date', Workout.date, 'timestamp'),
+    ('duration_minutes', Workout.duration_minutes, 'number'),
+    ('calories_burned', Workout.calories_burned, 'number'),
+    ('notes', Workout.notes, 'string'),
+    ('created_at', Workout.created_at, 'timestamp'),
+], child_key='exercises', extra=[
+    ('exercise_count', select(func.count()).where(WorkoutExercise.workout_id == Workout.id).scalar_subquery(),
+     'number'),
+])
+
+WORKOUT_INCLUDES = ('exercises',)
+
+TEMPLATE_EXERCISE_JSON = ModelJSON('template exercise', [
+    ('template_id', WorkoutTemplateExercise.template_id, 'number'),
+    ('id', WorkoutTemplateExercise.id, 'number'),
+    ('exercise_id', WorkoutTemplateExercise.exercise_id, 'number'),
+    ('exercise_name', Exercise.name, 'string'),
+    ('exercise_description', Exercise.description, 'string'),
+    ('exercise_instructions', Exercise.instructions, 'string'),
+    ('order_in_template', WorkoutTemplateExercise.order_in_template, 'number'),
+    ('sets', WorkoutTemplateExercise.sets, 'number'),
+    ('reps', WorkoutTemplateExercise.reps, 'number'),
+    ('duration_seconds', WorkoutTemplateExercise.duration_seconds, 'number'),
+    ('rest_seconds', WorkoutTemplateExercise.rest_seconds, 'number'),
+    ('notes', WorkoutTemplateExercise.notes, 'string'),
+])
+
+TEMPLATE_JSON = ModelJSON('template', [
+    ('id', WorkoutTemplate.id, 'number'),
+    ('name', WorkoutTemplate.name, 'string'),
+    ('description', WorkoutTemplate.description, 'string'),
+    ('category', WorkoutTemplate.category, 'string'),
+    ('difficulty_level', WorkoutTemplate.difficulty_level, 'string'),
+    ('estimated_duration_minutes', WorkoutTemplate.estimated_duration_minutes, 'number'),
+    ('estimated_calories', WorkoutTemplate.estimated_calories, 'number'),
+    ('image_url', WorkoutTemplate.image_url, 'string'),
+    ('equipment_needed', WorkoutTemplate.equipment_needed, 'csv_list'),
+    ('target_muscle_groups', WorkoutTemplate.target_muscle_groups, 'csv_list'),
+    ('created_at', WorkoutTemplate.created_at, 'timestamp'),
+], child_key='exercises', extra=[
+    ('exercise_count', select(func.count()).where(WorkoutTemplateExercise.template_id == WorkoutTemplate.id)
+     .scalar_subquery(), 'number'),
+])
+
+# exercise_details: the exercise's description and instructions on each template exercise
+TEMPLATE_INCLUDES = ('exercises', 'exercise_details')
+TEMPLATE_EXERCISE_DETAILS = ('exercise_description', 'exercise_instructions')
+
+
+def _child_lists(session, view, parents, parent_column, order_by, select_from):
+    """parent id -> JSON array text of its children, in relationship (parent, id) order
+
+    parents is a list of parent ids, or a SELECT of them, which reads the children
+    of however many parents there are in one statement.
+    """
+    children = defaultdict(list)
+    encode = view.encode
+    # order_by leads with the parent column: by id alone the planner may walk the
+    # whole table in primary key order instead of looking the parents up
+    query = select(*view.columns).select_from(select_from).order_by(*order_by)
+    if isinstance(parents, Select):
+        batches = [query.where(parent_column.in_(parents))]
+    else:
+        parents = list(parents)
+        batches = [query.where(parent_column.in_(parents[start:start + CHILD_BATCH_SIZE]))
+                   for start in range(0, len(parents), CHILD_BATCH_SIZE)]
+    for batch in batches:
+        for row in session.execute(batch):
+            children[row[0]].append(encode(row))
+    return {parent_id: f"[{','.join(rows)}]" for parent_id, rows in children.items()}
+
+
+WORKOUT_EXERCISES_FROM = WorkoutExercise.__table__.outerjoin(Exercise.__table__,
+                                                             Exercise.id == WorkoutExercise.exercise_id)
+
+
+def workout_exercise_lists(session, workouts):
+    return _child_lists(
+        session, WORKOUT_EXERCISE_JSON.view(WORKOUT_EXERCISE_JSON.fields), workouts, WorkoutExercise.workout_id,
+        (WorkoutExercise.workout_id, WorkoutExercise.id), WORKOUT_EXERCISES_FROM
+    )
+
+
+def template_exercise_lists(session, templates, details=True):
+    fields = TEMPLATE_EXERCISE_JSON.fields
+    if not details:
+        fields = tuple(name for name in fields if name not in TEMPLATE_EXERCISE_DETAILS)
+    return _child_lists(
+        session, TEMPLATE_EXERCISE_JSON.view(fields), templates, WorkoutTemplateExercise.template_id,
+        (WorkoutTemplateExercise.template_id, WorkoutTemplateExercise.id),
+        WorkoutTemplateExercise.__table__.outerjoin(Exercise.__table__,
+                                                    Exercise.id == WorkoutTemplateExercise.exercise_id)
+    )
+
+
+def _with_children(rows, view, children):
+    encode = view.encode
+    return [encode(tuple(row) + (children.get(row[0], '[]'),)) for row in rows]
+
+
+def encode_workouts(session, rows, view=None, parents=None):
+    """JSON objects for workout rows selected with view's columns (by default all of to_dict())
+
+    parents, a SELECT of the rows' ids, reads their exercises in one statement
+    rather than one per CHILD_BATCH_SIZE rows.
+    """
+    view = view or WORKOUT_JSON.view(WORKOUT_JSON.fields, True)
+    if not view.children:
+        return [view.encode(row) for row in rows]
+    if parents is None:
+        parents = [row[0] for row in rows]
+    return _with_children(rows, view, workout_exercise_lists(session, parents))
+
+
+def stream_workouts(session, query, view, batch_size, limit=None):
+    """Yield lists of JSON objects for the workouts of query, a workout list ordered by (date DESC, id DESC)
+
+    view must select the date right after the id (hidden=('date',)). The exercises
+    come from one more statement in the same order, read alongside the workouts,
+    so a stream of any length takes two statements.
+    """
+    parents = query.statement
+    if limit is not None:
+        parents = parents.limit(limit)
+    result = session.execute(parents, execution_options={'yield_per': batch_size})
+    if not view.children:
+        for rows in result.partitions():
+            yield [view.encode(row) for row in rows]
+        return
+
+    child_view = WORKOUT_EXERCISE_JSON.view(WORKOUT_EXERCISE_JSON.fields)
+    children = select(Workout.date, *child_view.columns) \
+        .select_from(Workout.__table__.join(WORKOUT_EXERCISES_FROM, WorkoutExercise.workout_id == Workout.id)) \
+        .order_by(Workout.date.desc(), Workout.id.desc(), WorkoutExercise.id)
+    if parents.whereclause is not None:
+        children = children.where(parents.whereclause)
+    if limit is not None:
+        children = children.where(Workout.id.in_(parents.with_only_columns(Workout.id)))
+    child_rows = iter(session.execute(children, execution_options={'yield_per': batch_size}))
+    child = next(child_rows, None)
+
+    encode_child = child_view.encode
+    encode = view.encode
+    for rows in result.partitions():
+        encoded = []
+        for row in rows:
+            # Both in (date DESC, id DESC) order: skip children of workouts that
+            # sort earlier (only there if a write landed between the two reads)
+            key = (row[1], row[0])
+            while child is not None and (child[0], child[1]) > key:
+                child = next(child_rows, None)
+            items = []
+            while child is not None and (child[0], child[1]) == key:
+                items.append(encode_child(child[1:]))
+                child = next(child_rows, None)
+            encoded.append(encode(tuple(row) + (f"[{','.join(items)}]",)))
+        yield encoded
+
+
+def encode_templates(session, rows, view=None, details=True, parents=None):
+    """JSON objects for template rows selected with view's columns (by default all of to_dict())
+
+    parents as for encode_workouts().
+    """
+    view = view or TEMPLATE_JSON.view(TEMPLATE_JSON.fields, True)
+    if not view.children:
+        return [view.encode(row) for row in rows]
+    if parents is None:
+        parents = [row[0] for row in rows]
+    return _with_children(rows, view, template_exercise_lists(session, parents, details))
+
+
+def encode_exercises(rows):
+    """JSON objects for exercise rows selected with EXERCISE_JSON.columns"""
+    encode = EXERCISE_JSON.encode
+    return [encode(row) for row in rows]
+
+
+def json_array(items):
+    return f"[{','.join(items)}]"
+
+
+def json_object(**members):
+    """Object text from members that are already JSON, keys sorted as jsonify would"""
+    return '{' + ','.join(f'{json.dumps(key)}:{members[key]}' for key in sorted(members)) + '}'
+
+
+def json_text(obj):
+    """Compact JSON text for a plain value, encoded with jsonify()'s settings"""
+    return current_app.json.dumps(obj, separators=(',', ':'))
+
+
+def json_body(text):
+    """Response body bytes for JSON text, as jsonify() would send it"""
+    provider = current_app.json
+    if provider.compact is False or (provider.compact is None and current_app.debug):
+        return provider.response(json.loads(text)).get_data()
+    return f'{text}\n'.encode('ascii')
+
+
+def json_response(text):
+    """Response for JSON text, byte-identical to jsonify() of the same value"""
+    return Response(json_body(text), mimetype=current_app.json.mimetype)
@@ -0,0 +1,79 @@
+from datetime import date, timedelta
+from sqlalchemy import func, update
+from database import db
+from jobs import job_type
+from models import UserStats, Workout
+from progress import rebuild_user_progress
+
+# Per-user dashboard aggregates.
+#
+# The workout write routes call record_workout_change() after flushing their
+# changes, so the delta lands in the same transaction as the workout itself and
+# the two can never drift apart. A user without a stats row yet (existing data,
+# or a row lost to manual edits) gets one rebuilt from their history on first use.
+
+WEEK_DAYS = 7
+
+
+def record_workout_change(user_id, workouts=0, calories=0, duration_minutes=0):
+    """Apply a delta to the user's aggregates inside the current transaction"""
+    result = db.session.execute(
+        update(UserStats)
+        .where(UserStats.user_id == user_id)
+        .values(
+            total_workouts=UserStats.total_workouts + workouts,
+            total_calories=UserStats.total_calories + (calories or 0),
+            total_duration_minutes=UserStats.total_duration_minutes + (duration_minutes or 0)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        # The flushed history already includes this change
+        rebuild_user_stats(user_id)
+
+
+def rebuild_user_stats(user_id):
+    """Recompute a user's aggregates from their workout history"""
+    total_workouts, total_calories, total_duration = db.session.query(
+        func.count(Workout.id),
+        func.coalesce(func.sum(Workout.calories_burned), 0),
+        func.coalesce(func.sum(Workout.duration_minutes), 0)
+    ).filter(Workout.user_id == user_id).one()
+
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        stats = UserStats(user_id=user_id)
+        db.session.add(stats)
+    stats.total_workouts = total_workouts
+    stats.total_calories = total_calories
+    stats.total_duration_minutes = total_duration
+    db.session.flush()
+    return stats
+
+
+def get_user_stats(user_id):
+    """Return the dashboard summary for a user"""
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        stats = rebuild_user_stats(user_id)
+        db.session.commit()
+
+    # A rolling window can't be maintained incrementally, but it only ever
+    # touches the last week of rows for a single user
+    week_start = date.today() - timedelta(days=WEEK_DAYS)
+    this_week = db.session.query(func.count(Workout.id)).filter(
+        Workout.user_id == user_id,
+        Workout.date >= week_start
+    ).scalar()
+
+    result = stats.to_dict()
+    result['this_week_workouts'] = this_week
+    return result
+
+
+@job_type('rebuild_user', concurrency=2)
+def rebuild_user_job(job):
+    """Recompute a user's dashboard aggregates and progress sessions from their history"""
+    stats = rebuild_user_stats(job.user_id)
+    rebuild_user_progress(job.user_id)
+    return stats.to_dict()
@@ -0,0 +1,201 @@
+import json
+from sqlalchemy import and_, event, insert, inspect, or_, select, update
+from sqlalchemy.orm import Session
+from database import db
+from models import (Exercise, SyncState, SyncTombstone, Workout, WorkoutExercise, WorkoutTemplate,
+                    WorkoutTemplateExercise)
+from serializers import (EXERCISE_JSON, TEMPLATE_EXERCISE_JSON, TEMPLATE_JSON, WORKOUT_EXERCISE_JSON, WORKOUT_JSON,
+                         encode_exercises, json_array, json_object)
+
+# Delta sync for offline clients.
+#
+# Every transaction that writes a synced row (workouts and their exercises, the
+# exercise and template catalog) takes the next number from the sync_state
+# counter once and stamps it into change_seq of each row it inserts or updates;
+# a deleted row leaves a tombstone with that number instead. The counter row stays
+# locked until the transaction ends, so numbers become visible in commit order:
+# once a client has seen N, nothing numbered N or lower can still show up.
+#
+# ORM flushes are stamped by the hooks below. The Core write paths (bulk import,
+# template starts, generate_data) take the number with transaction_seq() or
+# next_change_seq() and write it with their rows.
+#
+# A workout whose exercises change is stamped too, so a sync finds the changed
+# workouts through (user_id, change_seq) and only looks at their exercises. A
+# cursor is the counter value read before anything else; without one the client
+# gets everything. Rows written before change_seq existed have none and only
+# come with a full sync. A full sync lists rows by id, a delta in change order.
+#
+# Exercise names embedded in workout and template exercises are as of their own
+# last change; a client should take names from the exercises it has synced.
+
+# (kind, model) in the order tombstones are listed
+SYNCED_MODELS = (
+    ('workout', Workout),
+    ('workout_exercise', WorkoutExercise),
+    ('exercise', Exercise),
+    ('template', WorkoutTemplate),
+    ('template_exercise', WorkoutTemplateExercise),
+)
+SYNCED_CLASSES = tuple(model for _, model in SYNCED_MODELS)
+CATALOG_KINDS = ('exercise', 'template', 'template_exercise')
+
+
+def next_change_seq(connection):
+    """Take the next change sequence number in the connection's transaction"""
+    table = SyncState.__table__
+    seq = connection.execute(
+        update(table).where(table.c.id == 1).values(seq=table.c.seq + 1).returning(table.c.seq)
+    ).scalar()
+    if seq is None:
+        connection.execute(insert(table).values(id=1, seq=1))
+        seq = 1
+    return seq
+
+
+def transaction_seq(session):
+    """The change sequence number of everything the session's current transaction writes"""
+    seq = session.info.get('change_seq')
+    if seq is None:
+        seq = session.info['change_seq'] = next_change_seq(session.connection())
+    return seq
+
+
+def current_seq():
+    return db.session.query(SyncState.seq).filter_by(id=1).scalar() or 0
+
+
+def _tombstone(session, obj):
+    """Tombstone row for obj if this flush deletes it, else None"""
+    user_id = None
+    if obj in session.deleted:
+        if isinstance(obj, Workout):
+            user_id = obj.user_id
+        elif isinstance(obj, WorkoutExercise):
+            workout = obj.workout or session.get(Workout, obj.workout_id)
+            user_id = workout.user_id if workout is not None else None
+    elif isinstance(obj, WorkoutExercise) and obj.workout is None and inspect(obj).attrs.workout.history.deleted:
+        # Dropped from its workout's exercises: delete-orphan removes it in this flush
+        user_id = inspect(obj).attrs.workout.history.deleted[0].user_id
+    else:
+        return None
+    kind = next(kind for kind, model in SYNCED_MODELS if isinstance(obj, model))
+    return {'seq': transaction_seq(session), 'kind': kind, 'object_id': obj.id, 'user_id': user_id}
+
+
+@event.listens_for(Session, 'before_flush')
+def stamp_changes(session, flush_context, instances):
+    changed = [obj for obj in session.new | session.dirty | session.deleted if isinstance(obj, SYNCED_CLASSES)]
+    if not changed:
+        return
+    seq = transaction_seq(session)
+    tombstones = []
+    for obj in changed:
+        tombstone = None if obj in session.new else _tombstone(session, obj)
+        if tombstone:
+            tombstones.append(tombstone)
+        elif obj in session.new or session.is_modified(obj, include_collections=False):
+            obj.change_seq = seq
+        if isinstance(obj, Workout) and obj not in session.new:
+            # Moved to another user: gone from the old owner's point of view
+            for user_id in inspect(obj).attrs.user_id.history.deleted or ():
+                tombstones.append({'seq': seq, 'kind': 'workout', 'object_id': obj.id, 'user_id': user_id})
+    # A workout's exercises are only looked at when the workout itself changed
+    for obj in changed:
+        if isinstance(obj, WorkoutExercise):
+            workout = obj.workout or (obj.workout_id and session.get(Workout, obj.workout_id))
+            if workout is not None and workout not in session.deleted:
+                workout.change_seq = seq
+    if tombstones:
+        tombstones.sort(key=lambda t: (t['kind'], t['object_id']))
+        session.connection().execute(insert(SyncTombstone.__table__), tombstones)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def forget_change_seq(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('change_seq', None)
+
+
+def _rows(query):
+    return db.session.execute(query).all()
+
+
+def _order(model, since):
+    # A delta lists rows in change order, which the change_seq indexes give without a sort
+    return (model.change_seq, model.id) if since is not None else (model.id,)
+
+
+def _changes(user_id, since):
+    """(key, JSON array text) per synced collection for rows changed after since"""
+    workout_view = WORKOUT_JSON.view(WORKOUT_JSON.fields)
+    template_view = TEMPLATE_JSON.view(TEMPLATE_JSON.fields)
+    workout_exercise_view = WORKOUT_EXERCISE_JSON.view(WORKOUT_EXERCISE_JSON.fields)
+    template_exercise_view = TEMPLATE_EXERCISE_JSON.view(TEMPLATE_EXERCISE_JSON.fields)
+
+    workouts = select(*workout_view.columns).where(Workout.user_id == user_id)
+    changed_workouts = select(Workout.id).where(Workout.user_id == user_id)
+    workout_exercises = select(*workout_exercise_view.columns) \
+        .outerjoin(Exercise, Exercise.id == WorkoutExercise.exercise_id)
+    exercises = select(*EXERCISE_JSON.columns)
+    templates = select(*template_view.columns)
+    template_exercises = select(*template_exercise_view.columns) \
+        .outerjoin(Exercise, Exercise.id == WorkoutTemplateExercise.exercise_id)
+    if since is not None:
+        workouts = workouts.where(Workout.change_seq > since)
+        changed_workouts = changed_workouts.where(Workout.change_seq > since)
+        workout_exercises = workout_exercises.where(WorkoutExercise.change_seq > since)
+        exercises = exercises.where(Exercise.change_seq > since)
+        templates = templates.where(WorkoutTemplate.change_seq > since)
+        template_exercises = template_exercises.where(WorkoutTemplateExercise.change_seq > since)
+    workout_exercises = workout_exercises.where(WorkoutExercise.workout_id.in_(changed_workouts))
+
+    return {
+        'workouts': json_array(map(workout_view.encode, _rows(workouts.order_by(*_order(Workout, since))))),
+        'workout_exercises': json_array(map(workout_exercise_view.encode,
+                                            _rows(workout_exercises.order_by(*_order(WorkoutExercise, since))))),
+        'exercises': json_array(encode_exercises(_rows(exercises.order_by(*_order(Exercise, since))))),
+        'templates': json_array(map(template_view.encode,
+                                    _rows(templates.order_by(*_order(WorkoutTemplate, since))))),
+        'template_exercises': json_array(map(template_exercise_view.encode,
+                                             _rows(template_exercises.order_by(
+                                                 *_order(WorkoutTemplateExercise, since))))),
+    }
+
+
+def _deleted(user_id, since):
+    """JSON object text: kind -> ids deleted after since"""
+    deleted = {kind: [] for kind, _ in SYNCED_MODELS}
+    if since is not None:
+        table = SyncTombstone.__table__
+        rows = db.session.execute(
+            select(table.c.kind, table.c.object_id)
+            .where(or_(table.c.user_id == user_id, and_(table.c.user_id.is_(None), table.c.kind.in_(CATALOG_KINDS))),
+                   table.c.seq > since)
+            .order_by(table.c.seq, table.c.id)
+        )
+        for kind, object_id in rows:
+            deleted[kind].append(object_id)
+    return json_object(**{f'{kind}s': json_array(map(str, dict.fromkeys(ids))) for kind, ids in deleted.items()})
+
+
+def get_changes(user_id, since=None):
+    """JSON text of everything a user's client needs to catch up from the since cursor (None: from scratch)"""
+    # Read first: everything numbered up to here has committed, and the reads
+    # below see it; anything newer that they also see is simply sent again
+    cursor = current_seq()
+    return json_object(
+        cursor=json.dumps(str(cursor)),
+        full='false' if since is not None else 'true',
+        deleted=_deleted(user_id, since),
+        **_changes(user_id, since)
+    )
+
+
+def parse_since(value):
+    """The since cursor as a change sequence number, None for a full sync; raises ValueError"""
+    if value is None or value == '':
+        return None
+    if not value.isdigit():
+        raise ValueError('Invalid cursor')
+    return int(value)
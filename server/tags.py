@@ -0,0 +1,115 @@
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session, load_only
+from database import db
+from models import Exercise, Tag, WorkoutTemplate
+
+# Muscle group and equipment tags.
+#
+# Exercises and templates keep their comma-separated columns (to_dict() and the
+# seed scripts are built on them), and a before_flush hook mirrors those columns
+# into the tags/exercise_tags/template_tags tables whenever they change. Filters
+# then resolve tag names through the (kind, name) unique index and the
+# association tables' (tag_id, owner_id) indexes rather than a substring match,
+# and join the owners to the ids found there.
+
+MUSCLE_GROUP = 'muscle_group'
+EQUIPMENT = 'equipment'
+
+# Comma-separated column -> tag kind, per model
+TAG_SOURCES = {
+    Exercise: (('muscle_groups', MUSCLE_GROUP), ('equipment', EQUIPMENT)),
+    WorkoutTemplate: (('target_muscle_groups', MUSCLE_GROUP), ('equipment_needed', EQUIPMENT)),
+}
+
+
+def split_tags(values):
+    """Normalize comma-separated tag strings into a de-duplicated list of names"""
+    if isinstance(values, str):
+        values = [values]
+    names = []
+    for value in values or []:
+        for name in value.split(','):
+            name = name.strip().lower()
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def _wanted_tags(obj):
+    return {
+        (kind, name)
+        for column, kind in TAG_SOURCES[type(obj)]
+        for name in split_tags(getattr(obj, column))
+    }
+
+
+def _tag_columns_changed(obj):
+    state = inspect(obj)
+    return any(state.attrs[column].history.has_changes() for column, _ in TAG_SOURCES[type(obj)])
+
+
+def apply_tags(session, objects):
+    """Point each object's tags at the rows matching its comma-separated columns"""
+    wanted = {obj: _wanted_tags(obj) for obj in objects}
+    keys = set().union(*wanted.values())
+
+    existing = {}
+    with session.no_autoflush:
+        if keys:
+            # Both columns, so the lookup can use the (kind, name) index
+            kinds, names = {kind for kind, _ in keys}, {name for _, name in keys}
+            for tag in session.query(Tag).filter(Tag.kind.in_(kinds), Tag.name.in_(names)):
+                existing[(tag.kind, tag.name)] = tag
+
+        for obj, keys in wanted.items():
+            tags = []
+            for key in sorted(keys):
+                if key not in existing:
+                    existing[key] = Tag(kind=key[0], name=key[1])
+                tags.append(existing[key])
+            obj.tags = tags
+
+
+@event.listens_for(Session, 'before_flush')
+def sync_tags(session, flush_context, instances):
+    changed = [obj for obj in session.new if type(obj) in TAG_SOURCES]
+    changed += [obj for obj in session.dirty if type(obj) in TAG_SOURCES and _tag_columns_changed(obj)]
+    if changed:
+        apply_tags(session, changed)
+
+
+def backfill_tags(connection=None):
+    """Build tags for every exercise and template (used by migration 2)"""
+    # Only load the tag columns: later migrations may add columns these rows don't have yet
+    objects = []
+    for model, sources in TAG_SOURCES.items():
+        columns = [getattr(model, column) for column, _ in sources]
+        objects += model.query.options(load_only(model.id, *columns)).all()
+    apply_tags(db.session, objects)
+    db.session.flush()
+
+
+def tagged_ids(owner_column, kind, names, match_all=False):
+    """Select the owner ids tagged with any (or, with match_all, every) one of names, once each
+
+    owner_column is the association table column holding the owner id, e.g.
+    exercise_tags.c.exercise_id.
+    """
+    association = owner_column.table
+    query = (
+        select(owner_column)
+        .join(Tag, Tag.id == association.c.tag_id)
+        .where(Tag.kind == kind, Tag.name.in_(names))
+        .group_by(owner_column)
+    )
+    if match_all:
+        query = query.having(func.count() == len(names))
+    return query
+
+
+def filter_tagged(query, id_column, owner_column, kind, names, match_all=False):
+    """Restrict query to the rows whose id_column is tagged as for tagged_ids()"""
+    # Joined rather than id IN (...): on a small analyzed table SQLite prefers to
+    # scan it and test every row against the list
+    tagged = tagged_ids(owner_column, kind, names, match_all).subquery()
+    return query.join(tagged, id_column == tagged.c[owner_column.key])
@@ -0,0 +1,128 @@
+from collections import namedtuple
+from datetime import datetime
+from types import MappingProxyType
+from sqlalchemy import insert
+from cache import catalog_cache
+from database import db
+from loading import template_options
+from models import Workout, WorkoutExercise, WorkoutTemplate
+from progress import store_progress
+from search import reindex_workouts
+from serializers import json_body, json_object, json_text
+from stats import record_workout_change
+from sync import transaction_seq
+
+# Precompiled workout templates for starting workouts.
+#
+# Starting a workout used to load the template through the ORM, add one
+# WorkoutExercise per template row, commit, and serialize the new workout and the
+# template; the commit expired everything, so both serializations lazy-loaded every
+# exercise again. A TemplateSnapshot is built once per catalog version instead and
+# shared by all requests: the rows to copy, the exercise names the workout JSON
+# needs and the template's JSON bytes, all immutable. It lives in catalog_cache, so
+# any exercise or template write replaces it.
+#
+# A start is then one INSERT for the workout and one multi-row INSERT for all of
+# its exercises, stamped with the transaction's change sequence number, the
+# search index, progress and stats updates, and a response that splices the
+# cached template JSON in next to the new workout.
+
+# rows: (exercise_id, sets, reps, duration_seconds, order_in_template) per exercise;
+# exercise_names: read-only exercise_id -> name; body: the template's JSON text
+TemplateSnapshot = namedtuple('TemplateSnapshot', ['id', 'name', 'description', 'rows', 'exercise_names', 'body'])
+
+
+def _build_snapshot(template_id):
+    template = db.session.get(WorkoutTemplate, template_id, options=template_options())
+    if template is None:
+        return None
+    exercises = template.template_exercises
+    return TemplateSnapshot(
+        id=template.id,
+        name=template.name,
+        description=template.description,
+        rows=tuple((te.exercise_id, te.sets, te.reps, te.duration_seconds, te.order_in_template) for te in exercises),
+        exercise_names=MappingProxyType({te.exercise_id: te.exercise.name if te.exercise else None
+                                         for te in exercises}),
+        body=json_text(template.to_dict())
+    )
+
+
+def template_snapshot(template_id):
+    """Snapshot of a template at the current catalog version, or None if there is no such template"""
+    return catalog_cache.get_or_build(('template_snapshot', template_id), lambda: _build_snapshot(template_id))
+
+
+def start_workout(snapshot, user_id):
+    """Insert a workout copied from snapshot in the current transaction; returns it as Workout.to_dict() would"""
+    now = datetime.utcnow()
+    seq = transaction_seq(db.session)
+    workout = {
+        'user_id': user_id,
+        'name': snapshot.name,
+        'description': snapshot.description,
+        'date': now.date(),
+        'created_at': now,
+        'updated_at': now,
+        'change_seq': seq
+    }
+    workouts = Workout.__table__
+    connection = db.session.connection()
+    workout_id = connection.execute(insert(workouts).returning(workouts.c.id), workout).scalar_one()
+
+    # One multi-row INSERT ... VALUES (...), (...) RETURNING. Row order isn't
+    # guaranteed, so the response is built from what comes back, in id order.
+    exercises = WorkoutExercise.__table__
+    inserted = []
+    if snapshot.rows:
+        inserted = connection.execute(
+            insert(exercises).values([
+                {'workout_id': workout_id, 'exercise_id': exercise_id, 'sets': sets, 'reps': reps,
+                 'duration_seconds': duration_seconds, 'order_in_workout': order, 'change_seq': seq}
+                for exercise_id, sets, reps, duration_seconds, order in snapshot.rows
+            ]).returning(exercises.c.id, exercises.c.exercise_id, exercises.c.sets, exercises.c.reps,
+                         exercises.c.duration_seconds, exercises.c.order_in_workout)
+        ).all()
+
+    reindex_workouts(connection, [workout_id])
+    store_progress(connection, [(user_id, workout_id, workout['date'], row.exercise_id, row.sets, row.reps, None)
+                                for row in inserted])
+    record_workout_change(user_id, workouts=1)
+
+    return {
+        'id': workout_id,
+        'user_id': user_id,
+        'name': snapshot.name,
+        'description': snapshot.description,
+        'date': now.date().isoformat(),
+        'duration_minutes': None,
+        'calories_burned': None,
+        'notes': None,
+        'created_at': now.isoformat(),
+        'exercises': [
+            {
+                'id': row.id,
+                'workout_id': workout_id,
+                'exercise_id': row.exercise_id,
+                'exercise_name': snapshot.exercise_names.get(row.exercise_id),
+                'sets': row.sets,
+                'reps': row.reps,
+                'weight': None,
+                'duration_seconds': row.duration_seconds,
+                'distance': None,
+                'calories_burned': None,
+                'notes': None,
+                'order_in_workout': row.order_in_workout
+            }
+            for row in sorted(inserted, key=lambda row: row.id)
+        ]
+    }
+
+
+def started_response_body(snapshot, workout):
+    """The start response's body, as jsonify() would send it, assembled around the cached template JSON"""
+    return json_body(json_object(
+        message=json_text('Workout started successfully'),
+        template=snapshot.body,
+        workout=json_text(workout)
+    ))
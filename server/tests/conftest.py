@@ -0,0 +1,109 @@
+import os
+import sys
+import tempfile
+import uuid
+import pytest
+from sqlalchemy import event
+
+# The server's modules import each other by top-level name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests run against a throwaway SQLite database holding the seed catalog, the demo
+# user and the workout templates. It lives for the whole session, so a test that
+# needs data of its own adds it for a user of its own rather than changing what
+# the seed scripts made.
+
+
+@pytest.fixture(scope='session')
+def app():
+    with tempfile.TemporaryDirectory() as directory, pytest.MonkeyPatch.context() as env:
+        # seed_templates.py opens its own app, so the database is picked by URL
+        env.setenv('DATABASE_URL', 'sqlite:///' + os.path.join(directory, 'tests.db'))
+        env.setenv('JOBS_DIR', os.path.join(directory, 'jobs'))
+        from app import create_app
+        from database import db
+        from migrations import init_schema
+        from seed_db import seed_database
+        from seed_templates import seed_workout_templates
+
+        # Every request reads the catalog version and builds its catalog response,
+        # so what a request costs doesn't depend on the ones before it
+        app = create_app({'TESTING': True, 'CATALOG_CACHE_SIZE': 0, 'CATALOG_CACHE_RECHECK_SECONDS': 0})
+        with app.app_context():
+            init_schema()
+            seed_database()
+            seed_workout_templates()
+        yield app
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def engine(app):
+    from database import db
+
+    with app.app_context():
+        return db.engine
+
+
+@pytest.fixture
+def count_statements(engine):
+    """count_statements(request) -> (response, SQL statements it issued), reading the whole body"""
+    def count(request):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            response = request()
+            response.get_data()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return response, len(statements)
+    return count
+
+
+@pytest.fixture
+def make_user(app):
+    """make_user() -> (user id, headers authenticating as them), for a user of the test's own"""
+    from auth import issue_token
+    from database import db
+    from models import User
+
+    def make():
+        name = f'test-{uuid.uuid4().hex[:12]}'
+        with app.app_context():
+            user = User(username=name, email=f'{name}@example.com', password_hash='-',
+                        first_name='Test', last_name='User')
+            db.session.add(user)
+            db.session.commit()
+            token, _ = issue_token(user.id)
+            return user.id, {'Authorization': f'Bearer {token}'}
+    return make
+
+
+@pytest.fixture
+def new_user(make_user):
+    return make_user()
+
+
+@pytest.fixture
+def create_workout(client):
+    """create_workout(user, exercise_ids=(1, 2)) -> the new workout's JSON, for a user from make_user"""
+    def create(user, exercise_ids=(1, 2)):
+        user_id, headers = user
+        response = client.post('/api/workouts', headers=headers, json={
+            'user_id': user_id, 'name': 'Test workout',
+            'exercises': [{'exercise_id': exercise_id, 'sets': 3, 'reps': 10} for exercise_id in exercise_ids]
+        })
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()['workout']
+    return create
@@ -0,0 +1,56 @@
+# ETags on the read endpoints: a client holding the current one gets a 304, a
+# write that changes what it would see gives it a new one, and ownership is
+# checked first, so a 304 never tells another user that a workout exists.
+
+
+def etag_of(response):
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    return response.headers['ETag']
+
+
+def test_workout_detail_answers_304_for_the_current_etag(client, new_user, create_workout):
+    headers = new_user[1]
+    path = f"/api/workouts/{create_workout(new_user)['id']}"
+    etag = etag_of(client.get(path, headers=headers))
+
+    response = client.get(path, headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_workout_detail_etag_changes_when_the_workout_does(client, new_user, create_workout):
+    headers = new_user[1]
+    path = f"/api/workouts/{create_workout(new_user)['id']}"
+    etag = etag_of(client.get(path, headers=headers))
+
+    assert client.put(path, headers=headers, json={'name': 'Renamed'}).status_code == 200
+    response = client.get(path, headers={**headers, 'If-None-Match': etag})
+    assert etag_of(response) != etag
+    assert response.get_json()['name'] == 'Renamed'
+
+
+def test_workout_list_etag_changes_on_create_and_delete(client, new_user, create_workout):
+    user_id, headers = new_user
+    path = f'/api/workouts?user_id={user_id}'
+    create_workout(new_user)
+    first = etag_of(client.get(path, headers=headers))
+    assert client.get(path, headers={**headers, 'If-None-Match': first}).status_code == 304
+
+    workout = create_workout(new_user)
+    second = etag_of(client.get(path, headers={**headers, 'If-None-Match': first}))
+    assert second != first
+
+    assert client.delete(f"/api/workouts/{workout['id']}", headers=headers).status_code == 200
+    third = etag_of(client.get(path, headers={**headers, 'If-None-Match': second}))
+    assert third not in (first, second)
+
+
+def test_another_users_workout_is_forbidden_even_with_its_etag(client, make_user, new_user, create_workout):
+    path = f"/api/workouts/{create_workout(new_user)['id']}"
+    etag = etag_of(client.get(path, headers=new_user[1]))
+
+    _, other_headers = make_user()
+    response = client.get(path, headers={**other_headers, 'If-None-Match': etag})
+    assert response.status_code == 403
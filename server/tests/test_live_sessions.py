@@ -0,0 +1,90 @@
+# Live workout sessions: appends are idempotent on (session_id, seq), so a client
+# re-sending a batch it got no answer for doesn't double its sets, and finalizing
+# folds the log into the workout once, leaving exercises without a logged set as
+# planned.
+
+
+def open_session(client, user, workout):
+    response = client.post(f"/api/workouts/{workout['id']}/session", headers=user[1])
+    assert response.status_code in (200, 201)
+    return response.get_json()['session']['id']
+
+
+def post_events(client, user, session_id, events):
+    return client.post(f'/api/sessions/{session_id}/events', headers=user[1], json={'events': events})
+
+
+def logged_set(seq, workout_exercise_id, reps=8, weight=60, minute=1):
+    return {'seq': seq, 'type': 'set_completed', 'at': f'2024-01-02T10:{minute:02d}:00',
+            'workout_exercise_id': workout_exercise_id, 'reps': reps, 'weight': weight}
+
+
+def sets_completed(client, user, session_id):
+    state = client.get(f'/api/sessions/{session_id}', headers=user[1]).get_json()
+    return state['last_seq'], {e['workout_exercise_id']: e['sets_completed'] for e in state['exercises']}
+
+
+def test_opening_a_session_again_picks_up_the_same_one(client, new_user, create_workout):
+    workout = create_workout(new_user)
+    first = client.post(f"/api/workouts/{workout['id']}/session", headers=new_user[1])
+    again = client.post(f"/api/workouts/{workout['id']}/session", headers=new_user[1])
+    assert (first.status_code, again.status_code) == (201, 200)
+    assert again.get_json()['session']['id'] == first.get_json()['session']['id']
+
+
+def test_resent_events_are_recorded_once(client, new_user, create_workout):
+    workout = create_workout(new_user)
+    exercise_id = workout['exercises'][0]['id']
+    session_id = open_session(client, new_user, workout)
+    batch = [{'seq': 1, 'type': 'start', 'at': '2024-01-02T10:00:00'}, logged_set(2, exercise_id)]
+
+    for _ in range(2):
+        assert post_events(client, new_user, session_id, batch).status_code == 200
+    assert sets_completed(client, new_user, session_id) == (2, {exercise_id: 1})
+
+    # A retry that overlaps the last batch adds only the events it hadn't sent
+    overlapping = [logged_set(2, exercise_id), logged_set(3, exercise_id, minute=3)]
+    assert post_events(client, new_user, session_id, overlapping).status_code == 200
+    assert sets_completed(client, new_user, session_id) == (3, {exercise_id: 2})
+
+
+def test_finalize_keeps_exercises_without_a_logged_set(client, new_user, create_workout):
+    workout = create_workout(new_user, exercise_ids=(1, 2, 3))
+    logged, *unlogged = workout['exercises']
+    session_id = open_session(client, new_user, workout)
+    post_events(client, new_user, session_id, [
+        {'seq': 1, 'type': 'start', 'at': '2024-01-02T10:00:00'},
+        logged_set(2, logged['id'], reps=5, weight=100, minute=5),
+        logged_set(3, logged['id'], reps=8, weight=80, minute=10),
+        {'seq': 4, 'type': 'pause', 'at': '2024-01-02T10:30:00'},
+    ])
+
+    response = client.post(f'/api/sessions/{session_id}/finalize', headers=new_user[1])
+    assert response.status_code == 200
+    finalized = response.get_json()['workout']
+    exercises = {e['id']: e for e in finalized['exercises']}
+    assert sorted(exercises) == sorted(e['id'] for e in workout['exercises'])
+    heaviest = exercises[logged['id']]
+    assert (heaviest['sets'], heaviest['reps'], heaviest['weight']) == (2, 5, 100)
+    for planned in unlogged:
+        assert (exercises[planned['id']]['sets'], exercises[planned['id']]['reps']) == (3, 10)
+    assert finalized['duration_minutes'] == 30
+
+
+def test_a_finalized_session_is_closed(client, new_user, create_workout):
+    workout = create_workout(new_user)
+    session_id = open_session(client, new_user, workout)
+    post_events(client, new_user, session_id, [logged_set(1, workout['exercises'][0]['id'])])
+
+    first = client.post(f'/api/sessions/{session_id}/finalize', headers=new_user[1])
+    again = client.post(f'/api/sessions/{session_id}/finalize', headers=new_user[1])
+    assert (first.status_code, again.status_code) == (200, 200)
+    assert again.get_json()['workout'] == first.get_json()['workout']
+    assert post_events(client, new_user, session_id, [logged_set(2, workout['exercises'][0]['id'])]).status_code == 409
+
+
+def test_another_user_cannot_append_to_a_session(client, make_user, new_user, create_workout):
+    workout = create_workout(new_user)
+    session_id = open_session(client, new_user, workout)
+    response = post_events(client, make_user(), session_id, [logged_set(1, workout['exercises'][0]['id'])])
+    assert response.status_code == 403
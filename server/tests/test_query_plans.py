@@ -0,0 +1,18 @@
+# Runs check_query_plans.py as part of the suite: every route, against a copy
+# of the test database, has to answer without an error and without any of its
+# statements falling back to a full scan of a table it isn't allowed to scan.
+
+
+def test_route_queries_use_an_index(app, tmp_path):
+    from app import create_app
+    from check_query_plans import copy_database, plan_failures
+    from database import db
+
+    url = copy_database(app, str(tmp_path))
+    plan_app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': url, 'JOBS_DIR': str(tmp_path / 'jobs')})
+    try:
+        failures = plan_failures(plan_app)
+    finally:
+        with plan_app.app_context():
+            db.engine.dispose()
+    assert failures == [], '\n'.join(f"{method or ''} {path}: {details}" for method, path, _, details in failures)
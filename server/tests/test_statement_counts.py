@@ -0,0 +1,80 @@
+import pytest
+
+# Guards the read routes against N+1 queries: each route has a fixed bound on
+# the SQL statements one request may issue, and it has to hold both for a user
+# with a handful of workouts and for one with more than CHILD_BATCH_SIZE
+# workouts and a template list twenty times the seeded one.
+
+SMALL_WORKOUTS = 5
+LARGE_WORKOUTS = 1200
+EXTRA_TEMPLATE_COPIES = 20
+
+# (path, most statements allowed); {user}, {workout} and {template} are filled in
+# from the dataset being measured. The counts include the catalog version reads
+# (see cache.py), which the test app makes on every request.
+ROUTES = [
+    ('/api/workouts?user_id={user}', 4),
+    ('/api/workouts?user_id={user}&limit=20', 4),
+    ('/api/workouts?user_id={user}&format=ndjson', 4),
+    ('/api/workouts?user_id={user}&format=ndjson&limit=20', 4),
+    ('/api/workouts?user_id={user}&fields=id,name,date', 3),
+    ('/api/workouts/{workout}', 4),
+    ('/api/users/{user}/stats', 3),
+    ('/api/exercises', 3),
+    ('/api/templates', 4),
+    ('/api/templates?include=exercise_details', 4),
+    ('/api/templates/{template}', 4),
+]
+
+
+def copy_templates(copies):
+    """Add copies of every template with its exercises, to grow the template list"""
+    from database import db
+    from models import WorkoutTemplate, WorkoutTemplateExercise
+
+    columns = [c.key for c in WorkoutTemplate.__table__.columns if c.key != 'id']
+    child_columns = [c.key for c in WorkoutTemplateExercise.__table__.columns if c.key not in ('id', 'template_id')]
+    for template in WorkoutTemplate.query.order_by(WorkoutTemplate.id).all():
+        for _ in range(copies):
+            copy = WorkoutTemplate(**{c: getattr(template, c) for c in columns})
+            copy.template_exercises = [WorkoutTemplateExercise(**{c: getattr(e, c) for c in child_columns})
+                                       for e in template.template_exercises]
+            db.session.add(copy)
+    db.session.commit()
+
+
+def generated_user(workouts, seed):
+    """Generate a user with workouts, returning (user id, first workout id)"""
+    from database import db
+    from generate_data import generate
+    from models import User, Workout
+
+    generate(1, workouts, 6, 730, seed, 20000)
+    user_id = db.session.query(db.func.max(User.id)).scalar()
+    return user_id, db.session.query(db.func.min(Workout.id)).filter(Workout.user_id == user_id).scalar()
+
+
+@pytest.fixture(scope='module')
+def datasets(app):
+    """Route parameters for the small and the large dataset"""
+    from models import WorkoutTemplate
+
+    with app.app_context():
+        small_user, small_workout = generated_user(SMALL_WORKOUTS, 1)
+        small_template = WorkoutTemplate.query.order_by(WorkoutTemplate.id).first().id
+        large_user, large_workout = generated_user(LARGE_WORKOUTS, 2)
+        copy_templates(EXTRA_TEMPLATE_COPIES)
+        large_template = WorkoutTemplate.query.order_by(WorkoutTemplate.id.desc()).first().id
+    return {
+        'small': {'user': small_user, 'workout': small_workout, 'template': small_template},
+        'large': {'user': large_user, 'workout': large_workout, 'template': large_template},
+    }
+
+
+@pytest.mark.parametrize('size', ['small', 'large'])
+@pytest.mark.parametrize('route, bound', ROUTES)
+def test_statements_per_request_are_bounded(client, count_statements, datasets, route, bound, size):
+    path = route.format(**datasets[size])
+    response, statements = count_statements(lambda: client.get(path))
+    assert response.status_code == 200
+    assert statements <= bound, f'{path} issued {statements} SQL statements, at most {bound} allowed'
@@ -0,0 +1,58 @@
+# /api/sync: a full sync lists what the user has and no deletions; a delta from
+# a cursor lists what changed since, and the ids of rows deleted since as
+# tombstones, without the deleted rows themselves.
+
+
+def sync(client, user, since=None):
+    user_id, headers = user
+    path = f'/api/sync?user_id={user_id}' + (f'&since={since}' if since is not None else '')
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def ids(rows):
+    return sorted(row['id'] for row in rows)
+
+
+def test_full_sync_lists_workouts_without_tombstones(client, new_user, create_workout):
+    workouts = [create_workout(new_user), create_workout(new_user)]
+    body = sync(client, new_user)
+    assert body['full']
+    assert ids(body['workouts']) == ids(workouts)
+    assert all(not deleted for deleted in body['deleted'].values())
+
+
+def test_delta_lists_deleted_rows_as_tombstones(client, new_user, create_workout):
+    kept, deleted = create_workout(new_user), create_workout(new_user)
+    cursor = sync(client, new_user)['cursor']
+
+    assert client.delete(f"/api/workouts/{deleted['id']}", headers=new_user[1]).status_code == 200
+    body = sync(client, new_user, cursor)
+    assert not body['full']
+    assert body['deleted']['workouts'] == [deleted['id']]
+    assert sorted(body['deleted']['workout_exercises']) == ids(deleted['exercises'])
+    assert ids(body['workouts']) == []
+
+    # A sync from the new cursor has nothing left to delete
+    assert sync(client, new_user, body['cursor'])['deleted']['workouts'] == []
+    assert ids(sync(client, new_user)['workouts']) == [kept['id']]
+
+
+def test_delta_lists_only_changed_workouts(client, new_user, create_workout):
+    changed, _ = create_workout(new_user), create_workout(new_user)
+    cursor = sync(client, new_user)['cursor']
+
+    response = client.put(f"/api/workouts/{changed['id']}", headers=new_user[1], json={'name': 'Renamed'})
+    assert response.status_code == 200
+    body = sync(client, new_user, cursor)
+    assert [(w['id'], w['name']) for w in body['workouts']] == [(changed['id'], 'Renamed')]
+
+
+def test_tombstones_belong_to_their_user(client, make_user, new_user, create_workout):
+    other_user = make_user()
+    cursor = sync(client, other_user)['cursor']
+
+    workout = create_workout(new_user)
+    assert client.delete(f"/api/workouts/{workout['id']}", headers=new_user[1]).status_code == 200
+    assert sync(client, other_user, cursor)['deleted']['workouts'] == []
@@ -0,0 +1,7 @@
+from app import create_app
+
+# WSGI entry point for production servers:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+
+app = create_app()